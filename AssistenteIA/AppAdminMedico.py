@@ -1,11 +1,30 @@
 import streamlit as st
 import sqlite3
-import pandas as pd
 from datetime import datetime
 import os
-import chromadb
-from sentence_transformers import SentenceTransformer
+import math
+import importlib
+import json
+import threading
+import uuid
+from contextlib import nullcontext
+from arquivamento import obter_triagem_arquivada, obter_triagens_arquivadas
+from banco_validacao import (
+    CAMINHO_BD, CONSULTA_LISTAGEM, LIMITE_ORDENACAO_RELEVANCIA, buscar_triagens, conectar, consultar_textos, estatisticas_validacao,
+    excluir_triagens, incrementar_versao_dados, init_validation_db, ler_triagem, listar_triagens, registrar_validacao, versao_dados
+)
+from banco_vetorial import (
+    MARCADOR_CASO_VALIDADO, buscar_entradas_semelhantes, formatar_caso_validado, indexar_entrada_triagem, marcar_entrada_validada,
+    modelo_da_colecao, obter_embedding_entrada, remover_entrada_triagem
+)
+from embeddings import embed_text as gerar_embedding
+from gateway_llm import LIMIAR_CARGA_FRIA_MS
+from memoria import EstadoSessoes, MonitorMemoria
+from observador_eventos import ObservadorEventos
+from unidades import cliente_chroma_da_unidade, colecao_da_unidade, existe_colecao_da_unidade, listar_unidades, obter_unidade
 from typing import List
+# pandas, chromadb e sentence_transformers (torch) são importados apenas nas funções e páginas que os usam,
+# para que a tela de login e o Dashboard abram sem pagar o custo dessas importações (ver perfil_importacao.py)
 
 # Configuração da página
 st.set_page_config(
@@ -15,40 +34,92 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Função para obter a unidade escolhida na barra lateral (cada unidade tem seu banco de validação e suas coleções)
+def unidade_atual():
+    return obter_unidade(st.session_state.get("unidade"))
+
+# Argumentos das funções do índice de triagens enviadas, apontando para a coleção da unidade atual
+def colecao_entradas():
+    unidade = unidade_atual()
+    return {"chroma_client": cliente_chroma_da_unidade(unidade), "nome": unidade.colecao_entradas}
+
 # Função para verificar se o banco de dados existe
-def verificar_banco_dados():
-    return os.path.exists('./validacao_triagem.db')
+def verificar_banco_dados(caminho_bd=None):
+    return os.path.exists(caminho_bd or unidade_atual().caminho_bd)
 
-# Função para conectar ao banco de dados
-def conectar_bd():
-    if not verificar_banco_dados():
+# Função para criar no banco as estruturas que o painel usa (ex.: índice de busca textual), uma única vez por servidor e banco
+@st.cache_resource
+def atualizar_esquema_banco(caminho_bd):
+    init_validation_db(caminho_bd)
+    return True
+
+# Função para conectar ao banco de dados (por padrão, o da unidade atual)
+def conectar_bd(caminho_bd=None):
+    caminho_bd = caminho_bd or unidade_atual().caminho_bd
+    if not verificar_banco_dados(caminho_bd):
         st.error("Banco de dados de validação não encontrado. Execute o aplicativo principal primeiro para criar o banco de dados.")
         return None
     
     try:
-        conn = sqlite3.connect('./validacao_triagem.db')
+        atualizar_esquema_banco(caminho_bd)
+        conn = conectar(caminho_bd)
         return conn
     except Exception as e:
         st.error(f"Erro ao conectar ao banco de dados: {e}")
         return None
 
-# Função para obter todas as triagens
-def obter_triagens(filtro="todas"):
+# Função para obter a versão atual das triagens (muda a cada inclusão, validação ou exclusão, feita em qualquer
+# um dos aplicativos). As consultas abaixo ficam em cache com a versão na chave: enquanto nada muda no banco,
+# os reruns do Streamlit (trocar de página, clicar num filtro) leem o resultado da memória.
+def obter_versao_dados(nome="validacao_triagem"):
+    caminho_bd = unidade_atual().caminho_bd
+    if not verificar_banco_dados(caminho_bd):
+        return None
+    atualizar_esquema_banco(caminho_bd)
+    return versao_dados(nome, caminho_bd)
+
+# As consultas ficam em banco_validacao.py (também usadas pelo teste de carga); aqui elas ganham o cache por versão
+@st.cache_data(max_entries=16, show_spinner=False)
+def consultar_triagens(filtro, incluir_arquivadas, versao, unidade):
+    import pandas as pd
+    df = listar_triagens(filtro, unidade.caminho_bd)
+    
+    # As triagens arquivadas são todas validadas (o arquivamento exclui linhas do banco, o que muda a versão)
+    if incluir_arquivadas and filtro != "pendentes":
+        arquivadas = obter_triagens_arquivadas(caminho_arquivo=unidade.caminho_arquivo)
+        if not arquivadas.empty:
+            # Um arquivamento interrompido entre a cópia e a exclusão deixa a triagem nos dois lugares até a próxima execução
+            df = pd.concat([df, arquivadas], ignore_index=True).drop_duplicates("id")
+            df = df.sort_values("data_hora", ascending=False, ignore_index=True)
+    return df
+
+# Função para obter todas as triagens (com incluir_arquivadas, também as das partições mensais do arquivamento)
+def obter_triagens(filtro="todas", incluir_arquivadas=False):
+    import pandas as pd
+    versao = obter_versao_dados()
+    if versao is None:
+        st.error("Banco de dados de validação não encontrado. Execute o aplicativo principal primeiro para criar o banco de dados.")
+        return pd.DataFrame()
+    
+    try:
+        with medir_etapa("listar_triagens"):
+            return consultar_triagens(filtro, incluir_arquivadas, versao, unidade_atual())
+    except Exception as e:
+        st.error(f"Erro ao obter triagens: {e}")
+        return pd.DataFrame()
+
+# Função para obter apenas as triagens pendentes informadas (usada para acrescentar as novas à lista da sessão)
+def obter_triagens_pendentes_por_ids(ids):
+    import pandas as pd
+    if not ids:
+        return pd.DataFrame()
     conn = conectar_bd()
     if conn is None:
         return pd.DataFrame()
     
     try:
-        query = "SELECT id, sintomas, resposta, data_hora, validado, feedback, validado_por, data_validacao FROM validacao_triagem"
-        
-        if filtro == "pendentes":
-            query += " WHERE validado = 0"
-        elif filtro == "validadas":
-            query += " WHERE validado = 1"
-            
-        query += " ORDER BY data_hora DESC"
-        
-        df = pd.read_sql_query(query, conn)
+        marcadores = ", ".join("?" for _ in ids)
+        df = pd.read_sql_query(f"{CONSULTA_LISTAGEM} WHERE validado = 0 AND id IN ({marcadores})", conn, params=list(ids))
         conn.close()
         return df
     except Exception as e:
@@ -56,73 +127,154 @@ def obter_triagens(filtro="todas"):
         conn.close()
         return pd.DataFrame()
 
+@st.cache_data(max_entries=64, show_spinner=False)
+def consultar_triagem(triagem_id, versao, unidade):
+    triagem = ler_triagem(triagem_id, unidade.caminho_bd)
+    
+    # Se não está no banco principal, procura nas partições do arquivamento
+    if triagem is None:
+        return obter_triagem_arquivada(triagem_id, unidade.caminho_arquivo)
+    
+    return triagem
+
 # Função para obter uma triagem específica
 def obter_triagem(triagem_id):
-    conn = conectar_bd()
-    if conn is None:
+    versao = obter_versao_dados()
+    if versao is None:
+        st.error("Banco de dados de validação não encontrado. Execute o aplicativo principal primeiro para criar o banco de dados.")
         return None
     
     try:
-        query = "SELECT * FROM validacao_triagem WHERE id = ?"
-        df = pd.read_sql_query(query, conn, params=(triagem_id,))
-        conn.close()
-        
-        if df.empty:
-            return None
-        
-        return df.iloc[0]
+        with medir_etapa("detalhes_triagem"):
+            return consultar_triagem(triagem_id, versao, unidade_atual())
     except Exception as e:
         st.error(f"Erro ao obter triagem: {e}")
-        conn.close()
         return None
 
-# Função para converter texto em embedding
+# Listas de pendentes das sessões (DataFrame e último evento aplicado), guardadas fora do st.session_state para que
+# a lista de uma sessão ociosa seja descartada (TRIAGEM_SESSAO_OCIOSA_MIN) e recarregada por completo se ela voltar
+@st.cache_resource
+def obter_estados_sessao():
+    return EstadoSessoes()
+
+def pendentes_da_sessao():
+    return obter_estados_sessao().obter(st.session_state.id_sessao) or (None, 0)
+
+def guardar_pendentes_da_sessao(pendentes, seq):
+    obter_estados_sessao().guardar(st.session_state.id_sessao, (pendentes, seq))
+
+# Monitor de memória do servidor do painel (amostras periódicas e medição das etapas), exibido no Dashboard
 @st.cache_resource
-def carregar_modelo_embedding():
-    return SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+def obter_monitor_memoria():
+    return MonitorMemoria("AppAdminMedico", CAMINHO_BD, sessoes=obter_estados_sessao())
+
+# Função para medir uma etapa do painel (antes de o banco de validação existir, não há onde gravar as medições)
+def medir_etapa(nome):
+    if not verificar_banco_dados(CAMINHO_BD):
+        return nullcontext()
+    return obter_monitor_memoria().etapa(nome)
+
+# Observador dos eventos das triagens pendentes, compartilhado por todas as sessões do servidor (um por banco)
+@st.cache_resource
+def obter_observador_eventos(caminho_bd):
+    atualizar_esquema_banco(caminho_bd)
+    return ObservadorEventos(caminho_bd)
+
+# Função para manter a lista de pendentes da sessão: carregada por completo uma vez e, depois, atualizada só com
+# os eventos novos (triagens criadas entram, validadas ou excluídas saem). Retorna quantas triagens novas entraram.
+def sincronizar_pendentes(forcar=False):
+    import pandas as pd
+    if not verificar_banco_dados():
+        guardar_pendentes_da_sessao(obter_triagens("pendentes"), 0)
+        return 0
+    
+    observador = obter_observador_eventos(unidade_atual().caminho_bd)
+    pendentes, seq = pendentes_da_sessao()
+    if pendentes is None:
+        # O último evento é lido antes da lista, então nenhum evento ocorrido durante a consulta se perde
+        seq = observador.ultimo_seq()
+        guardar_pendentes_da_sessao(obter_triagens("pendentes"), seq)
+        return 0
+    
+    eventos = observador.eventos_desde(seq, forcar)
+    if eventos is None:
+        # A sessão ficou muito tempo sem atualizar: recarrega a lista inteira
+        obter_estados_sessao().descartar(st.session_state.id_sessao)
+        return sincronizar_pendentes()
+    if not eventos:
+        return 0
+    
+    # Aplica apenas o último evento de cada triagem
+    estado_final = {evento["triagem_id"]: evento["tipo"] for evento in eventos}
+    if not pendentes.empty:
+        pendentes = pendentes[~pendentes["id"].isin(list(estado_final))]
+    novas = obter_triagens_pendentes_por_ids([triagem_id for triagem_id, tipo in estado_final.items() if tipo == "criada"])
+    if not novas.empty:
+        pendentes = pd.concat([novas, pendentes], ignore_index=True).sort_values("data_hora", ascending=False, ignore_index=True)
+    guardar_pendentes_da_sessao(pendentes.reset_index(drop=True), eventos[-1]["seq"])
+    return len(novas)
+
+# Função para exibir a tabela de uma listagem de triagens
+def exibir_tabela_triagens(triagens):
+    if triagens.empty:
+        if st.session_state.filtro == "pendentes":
+            st.info("Não há triagens pendentes de validação.")
+        else:
+            st.info("Não há triagens registradas no sistema.")
+        return
+    
+    # Exibir tabela de triagens
+    st.write(f"Total de registros: {len(triagens)}")
+    
+    # Simplificar a visualização da tabela
+    tabela_triagens = triagens.copy()
+    tabela_triagens['sintomas'] = tabela_triagens['sintomas'].str[:50] + "..."
+    tabela_triagens['resposta'] = tabela_triagens['resposta'].str[:50] + "..."
+    
+    # Adicionar coluna de status
+    tabela_triagens['status'] = tabela_triagens['validado'].apply(
+        lambda x: "✅ Validado" if x == 1 else "⏳ Pendente"
+    )
+    
+    # Exibir tabela
+    st.dataframe(
+        tabela_triagens[['id', 'sintomas', 'data_hora', 'status']],
+        use_container_width=True
+    )
+
+# Tabela de pendentes atualizada sozinha a cada INTERVALO_ATUALIZACAO_PENDENTES segundos, sem recarregar a página
+INTERVALO_ATUALIZACAO_PENDENTES = 5
+
+@st.fragment(run_every=INTERVALO_ATUALIZACAO_PENDENTES)
+def exibir_tabela_pendentes():
+    novas = sincronizar_pendentes()
+    if novas:
+        st.toast(f"{novas} nova(s) triagem(ns) pendente(s) de validação")
+    exibir_tabela_triagens(pendentes_da_sessao()[0])
 
+# Função para converter texto em embedding, com o modelo das coleções da unidade atual
+# (o mesmo para a base de casos e as triagens enviadas, que são reindexadas juntas).
+# O modelo é carregado uma única vez por servidor (ver embeddings.py)
 def embed_text(text: str) -> List[float]:
-    model = carregar_modelo_embedding()
-    embeddings = model.encode([text], convert_to_tensor=True)
-    return embeddings.cpu().numpy()[0].tolist()
+    return gerar_embedding(text, modelo_da_colecao(unidade_atual().colecao))
 
 # Função para adicionar caso validado ao banco de dados vetorial
 def adicionar_caso_validado(sintomas, resposta, feedback):
     try:
-        # Conectar ao ChromaDB
-        chroma_client = chromadb.PersistentClient(path="./chroma_db")
-        collection_name = "triagem_hci"
-        
-        # Verificar se a coleção existe
-        collections = chroma_client.list_collections()
-        if collection_name in [col.name for col in collections]:
-            collection = chroma_client.get_collection(collection_name)
-        else:
-            collection = chroma_client.create_collection(name=collection_name)
-        
-        # Extrair a classificação da resposta
-        classificacao = ""
-        if "vermelha" in resposta.lower():
-            classificacao = "Vermelha"
-        elif "laranja" in resposta.lower():
-            classificacao = "Laranja"
-        elif "amarela" in resposta.lower():
-            classificacao = "Amarela"
-        elif "verde" in resposta.lower():
-            classificacao = "Verde"
-        elif "azul" in resposta.lower():
-            classificacao = "Azul"
-        
-        # Criar um caso formatado para adicionar ao banco
-        caso_formatado = f"{sintomas} Classificação: {classificacao}."
-        if feedback:
-            caso_formatado += f" Feedback especialista: {feedback}"
+        # Obter a coleção da unidade no banco vetorial (criada com os parâmetros HNSW configurados se não existir)
+        unidade = unidade_atual()
+        collection = colecao_da_unidade(unidade)
+        
+        # Criar um caso formatado para adicionar ao banco (com a classificação extraída da resposta); a reconstrução
+        # da coleção monta o mesmo texto a partir do banco de validação
+        caso_formatado = formatar_caso_validado(sintomas, resposta, feedback)
         
         # Gerar embedding para o caso
         embedding = embed_text(caso_formatado)
         
-        # Gerar ID único para o caso validado
-        caso_id = f"validated_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        # Gerar ID único para o caso validado (com um timestamp, duas validações no mesmo segundo teriam o mesmo ID
+        # e a segunda seria descartada como duplicada)
+        caso_id = f"validated_{uuid.uuid4().hex}"
         
         # Adicionar ao banco vetorial
         collection.add(
@@ -130,6 +282,7 @@ def adicionar_caso_validado(sintomas, resposta, feedback):
             ids=[caso_id],
             metadatas=[{"content": caso_formatado, "validated": True}]
         )
+        incrementar_versao_dados("banco_vetorial", unidade.caminho_bd)
         
         return True, caso_id
     except Exception as e:
@@ -138,8 +291,8 @@ def adicionar_caso_validado(sintomas, resposta, feedback):
 
 # Função para validar uma triagem
 def validar_triagem(triagem_id, validado_por, feedback):
-    conn = conectar_bd()
-    if conn is None:
+    if not verificar_banco_dados():
+        st.error("Banco de dados de validação não encontrado. Execute o aplicativo principal primeiro para criar o banco de dados.")
         return False
     
     try:
@@ -155,27 +308,22 @@ def validar_triagem(triagem_id, validado_por, feedback):
             feedback
         )
         
-        # Atualizar o status no banco de dados SQLite
-        cursor = conn.cursor()
-        data_validacao = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
         # Adicionar o ID do caso no ChromaDB ao feedback
         feedback_completo = feedback
         if sucesso_adicao:
-            feedback_completo = f"{feedback}\n\nCaso adicionado ao banco de conhecimento com ID: {caso_id}"
+            feedback_completo = f"{feedback}{MARCADOR_CASO_VALIDADO}{caso_id}"
         
-        cursor.execute(
-            "UPDATE validacao_triagem SET validado = 1, feedback = ?, validado_por = ?, data_validacao = ? WHERE id = ?",
-            (feedback_completo, validado_por, data_validacao, triagem_id)
-        )
+        # Atualizar o status no banco de dados SQLite
+        registrar_validacao(triagem_id, validado_por, feedback_completo, unidade_atual().caminho_bd)
         
-        conn.commit()
-        conn.close()
+        # A triagem passa a aparecer como referência no painel de triagens semelhantes
+        try:
+            marcar_entrada_validada(triagem_id, **colecao_entradas())
+        except Exception as e:
+            st.warning(f"Triagem validada, mas o índice de triagens semelhantes não foi atualizado: {e}")
         return True
     except Exception as e:
         st.error(f"Erro ao validar triagem: {e}")
-        if conn:
-            conn.close()
         return False
 
 # Função para excluir uma triagem
@@ -185,55 +333,121 @@ def excluir_triagem(triagem_id):
         return False
     
     try:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM validacao_triagem WHERE id = ?", (triagem_id,))
+        excluir_triagens(conn, "id = ?", (triagem_id,), unidade_atual().caminho_bd)
         conn.commit()
         conn.close()
+        
+        try:
+            remover_entrada_triagem(triagem_id, **colecao_entradas())
+        except Exception as e:
+            st.warning(f"Triagem excluída, mas o vetor não foi removido do índice de triagens semelhantes: {e}")
         return True
     except Exception as e:
         st.error(f"Erro ao excluir triagem: {e}")
         conn.close()
         return False
 
-# Função para obter estatísticas
-def obter_estatisticas():
+# Função para obter as triagens já validadas mais semelhantes a uma triagem, usando o vetor indexado no envio.
+# Triagens enviadas antes da indexação têm o vetor calculado uma única vez aqui e gravado no índice.
+def obter_triagens_semelhantes(triagem, k=5):
+    try:
+        with medir_etapa("triagens_semelhantes"):
+            entradas = colecao_entradas()
+            embedding = obter_embedding_entrada(triagem['id'], **entradas)
+            if embedding is None:
+                embedding = embed_text(triagem['sintomas'])
+                indexar_entrada_triagem(triagem['id'], embedding, triagem['data_hora'], bool(triagem['validado']), **entradas)
+            
+            semelhantes = buscar_entradas_semelhantes(embedding, k=k, excluir_id=triagem['id'], **entradas)
+    except Exception as e:
+        st.error(f"Erro ao buscar triagens semelhantes: {e}")
+        return []
+    
+    if not semelhantes:
+        return []
+    
     conn = conectar_bd()
     if conn is None:
-        return {}
+        return []
     
     try:
-        cursor = conn.cursor()
-        
-        # Total de triagens
-        cursor.execute("SELECT COUNT(*) FROM validacao_triagem")
-        total = cursor.fetchone()[0]
-        
-        # Triagens validadas
-        cursor.execute("SELECT COUNT(*) FROM validacao_triagem WHERE validado = 1")
-        validadas = cursor.fetchone()[0]
-        
-        # Triagens pendentes
-        cursor.execute("SELECT COUNT(*) FROM validacao_triagem WHERE validado = 0")
-        pendentes = cursor.fetchone()[0]
+        marcadores = ", ".join("?" for _ in semelhantes)
+        triagens = consultar_textos(
+            conn, f"id IN ({marcadores})", [triagem_id for triagem_id, _ in semelhantes], caminho_bd=unidade_atual().caminho_bd
+        )
+        por_id = {t["id"]: (t["id"], t["sintomas"], t["feedback"], t["validado_por"], t["data_validacao"]) for t in triagens}
+        conn.close()
         
-        # Validadores únicos
-        cursor.execute("SELECT COUNT(DISTINCT validado_por) FROM validacao_triagem WHERE validado_por IS NOT NULL")
-        validadores = cursor.fetchone()[0]
+        # Triagens que já foram arquivadas continuam servindo de referência
+        faltantes = [triagem_id for triagem_id, _ in semelhantes if triagem_id not in por_id]
+        if faltantes:
+            arquivadas = obter_triagens_arquivadas(faltantes, unidade_atual().caminho_arquivo)
+            for linha in arquivadas[["id", "sintomas", "feedback", "validado_por", "data_validacao"]].itertuples(index=False):
+                por_id[linha[0]] = tuple(linha)
         
+        # Mantém a ordem por similaridade; vetores de triagens que não existem mais no banco são ignorados
+        return [
+            {
+                "id": triagem_id,
+                "similaridade": 1.0 - distancia,
+                "sintomas": por_id[triagem_id][1],
+                "feedback": por_id[triagem_id][2],
+                "validado_por": por_id[triagem_id][3],
+                "data_validacao": por_id[triagem_id][4],
+            }
+            for triagem_id, distancia in semelhantes if triagem_id in por_id
+        ]
+    except Exception as e:
+        st.error(f"Erro ao buscar triagens semelhantes: {e}")
         conn.close()
-        
-        return {
-            "total": total,
-            "validadas": validadas,
-            "pendentes": pendentes,
-            "validadores": validadores,
-            "taxa_validacao": (validadas / total * 100) if total > 0 else 0
-        }
+        return []
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def consultar_estatisticas(versao, unidade):
+    return estatisticas_validacao(unidade.caminho_bd)
+
+# Função para obter estatísticas
+def obter_estatisticas():
+    versao = obter_versao_dados()
+    if versao is None:
+        st.error("Banco de dados de validação não encontrado. Execute o aplicativo principal primeiro para criar o banco de dados.")
+        return {}
+    
+    try:
+        return consultar_estatisticas(versao, unidade_atual())
     except Exception as e:
         st.error(f"Erro ao obter estatísticas: {e}")
-        conn.close()
         return {}
 
+# Função para buscar triagens por texto (sintomas, resposta e feedback) no índice de busca textual
+def buscar_triagens_texto(termo, pagina=1, por_pagina=20):
+    if conectar_bd() is None:
+        return 0, []
+    
+    try:
+        with medir_etapa("busca_textual"):
+            return buscar_triagens(termo, pagina, por_pagina, unidade_atual().caminho_bd)
+    except sqlite3.Error as e:
+        st.error(f"Erro ao buscar triagens: {e}")
+        return 0, []
+
+# Colunas exportadas (textos descomprimidos, sem as colunas internas de compressão)
+COLUNAS_EXPORTACAO = ["id", "sintomas", "resposta", "data_hora", "validado", "feedback", "validado_por", "data_validacao"]
+
+# Função para ler as triagens exportadas (todas ou as do filtro SQL, ex.: "validado = 1") com os textos descomprimidos
+def ler_exportacao(conn, filtro="1"):
+    import pandas as pd
+    return pd.DataFrame(consultar_textos(conn, filtro, caminho_bd=unidade_atual().caminho_bd), columns=COLUNAS_EXPORTACAO)
+
+# Função para gerar o arquivo exportado: retorna (conteúdo, extensão, tipo MIME).
+# Com compactar=True o CSV é compactado com gzip, o que reduz bastante o download (as respostas repetem os mesmos títulos)
+def gerar_arquivo_exportacao(df, compactar=True):
+    import gzip
+    csv = df.to_csv(index=False)
+    if compactar:
+        return gzip.compress(csv.encode("utf-8")), "csv.gz", "application/gzip"
+    return csv, "csv", "text/csv"
+
 # Função para exportar dados para CSV
 def exportar_csv():
     conn = conectar_bd()
@@ -241,7 +455,7 @@ def exportar_csv():
         return None
     
     try:
-        df = pd.read_sql_query("SELECT * FROM validacao_triagem", conn)
+        df = ler_exportacao(conn)
         conn.close()
         return df
     except Exception as e:
@@ -249,38 +463,39 @@ def exportar_csv():
         conn.close()
         return None
 
+# Estatísticas do banco vetorial em cache pela versão "banco_vetorial" (incrementada quando casos são adicionados
+# pelos aplicativos ou pela reconstrução). O ttl cobre alterações feitas por fora, direto no ChromaDB.
+@st.cache_data(max_entries=4, ttl=600, show_spinner=False)
+def consultar_estatisticas_banco_vetorial(versao, unidade):
+    # Verificar se a coleção da unidade existe no banco vetorial
+    if not existe_colecao_da_unidade(unidade):
+        return {
+            "total": 0,
+            "casos_originais": 0,
+            "casos_validados": 0
+        }
+    
+    collection = colecao_da_unidade(unidade)
+    
+    # Obter todos os IDs
+    todos_ids = collection.get()["ids"]
+    
+    # Contar casos validados (IDs que começam com "validated_")
+    casos_validados = sum(1 for id in todos_ids if id.startswith("validated_"))
+    
+    # Contar casos originais (IDs que começam com "case_")
+    casos_originais = sum(1 for id in todos_ids if id.startswith("case_"))
+    
+    return {
+        "total": len(todos_ids),
+        "casos_originais": casos_originais,
+        "casos_validados": casos_validados
+    }
+
 # Função para obter estatísticas do banco vetorial
 def obter_estatisticas_banco_vetorial():
     try:
-        # Conectar ao ChromaDB
-        chroma_client = chromadb.PersistentClient(path="./chroma_db")
-        collection_name = "triagem_hci"
-        
-        # Verificar se a coleção existe
-        collections = chroma_client.list_collections()
-        if collection_name in [col.name for col in collections]:
-            collection = chroma_client.get_collection(collection_name)
-            
-            # Obter todos os IDs
-            todos_ids = collection.get()["ids"]
-            
-            # Contar casos validados (IDs que começam com "validated_")
-            casos_validados = sum(1 for id in todos_ids if id.startswith("validated_"))
-            
-            # Contar casos originais (IDs que começam com "case_")
-            casos_originais = sum(1 for id in todos_ids if id.startswith("case_"))
-            
-            return {
-                "total": len(todos_ids),
-                "casos_originais": casos_originais,
-                "casos_validados": casos_validados
-            }
-        else:
-            return {
-                "total": 0,
-                "casos_originais": 0,
-                "casos_validados": 0
-            }
+        return consultar_estatisticas_banco_vetorial(obter_versao_dados("banco_vetorial"), unidade_atual())
     except Exception as e:
         st.error(f"Erro ao obter estatísticas do banco vetorial: {e}")
         return {
@@ -289,6 +504,115 @@ def obter_estatisticas_banco_vetorial():
             "casos_validados": 0
         }
 
+# Função para exibir as estatísticas do banco vetorial em três métricas
+def exibir_estatisticas_banco_vetorial(estatisticas_vetorial):
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("Total de Casos", estatisticas_vetorial["total"])
+    
+    with col2:
+        st.metric("Casos Originais", estatisticas_vetorial["casos_originais"])
+    
+    with col3:
+        st.metric("Casos Validados", estatisticas_vetorial["casos_validados"])
+
+# Função para obter estatísticas de latência por servidor de LLM (registradas pelo gateway do aplicativo principal,
+# que é compartilhado pelas unidades e grava no banco da unidade padrão)
+def obter_estatisticas_llm(horas=24):
+    import pandas as pd
+    conn = conectar_bd(CAMINHO_BD)
+    if conn is None:
+        return pd.DataFrame()
+    
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'chamadas_llm'")
+        if cursor.fetchone() is None:
+            conn.close()
+            return pd.DataFrame()
+        
+        # Apenas as chamadas de triagem (aquecimento e keep-alive não entram nas latências)
+        df = pd.read_sql_query(
+            "SELECT backend, latencia_ms, sucesso, duracao_carga_ms FROM chamadas_llm "
+            "WHERE data_hora >= datetime('now', 'localtime', ?) AND COALESCE(origem, 'triagem') = 'triagem'",
+            conn,
+            params=(f"-{horas} hours",)
+        )
+        conn.close()
+        
+        if df.empty:
+            return df
+        
+        sucesso = df[df["sucesso"] == 1]
+        resumo = df.groupby("backend").agg(requisicoes=("sucesso", "size"), falhas=("sucesso", lambda x: int((x == 0).sum())))
+        latencias = sucesso.groupby("backend")["latencia_ms"]
+        resumo["latencia_media_ms"] = latencias.mean()
+        resumo["latencia_p95_ms"] = latencias.quantile(0.95)
+        
+        # Latência das chamadas que precisaram carregar o modelo na memória (a frio) x modelo já carregado (a quente)
+        fria = sucesso["duracao_carga_ms"].fillna(0) > LIMIAR_CARGA_FRIA_MS
+        resumo["chamadas_a_frio"] = fria.groupby(sucesso["backend"]).sum()
+        resumo["latencia_fria_ms"] = sucesso[fria].groupby("backend")["latencia_ms"].mean()
+        resumo["latencia_quente_ms"] = sucesso[~fria].groupby("backend")["latencia_ms"].mean()
+        return resumo.reset_index().fillna(0).round(1)
+    except Exception as e:
+        st.error(f"Erro ao obter estatísticas do LLM: {e}")
+        conn.close()
+        return pd.DataFrame()
+
+# Função para obter as medições de memória dos servidores (gravadas pelo monitor de memória de cada aplicativo, ver memoria.py):
+# retorna as amostras periódicas e o resumo das etapas por processo
+def obter_estatisticas_memoria(horas=24):
+    import pandas as pd
+    vazio = {"amostras": pd.DataFrame(), "etapas": pd.DataFrame()}
+    conn = conectar_bd(CAMINHO_BD)
+    if conn is None:
+        return vazio
+    
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'memoria_amostras'")
+        if cursor.fetchone() is None:
+            conn.close()
+            return vazio
+        
+        periodo = (f"-{horas} hours",)
+        amostras = pd.read_sql_query(
+            "SELECT data_hora, processo, rss_mb, alocado_mb, pico_alocado_mb, sessoes, sessoes_descartadas, maiores_crescimentos "
+            "FROM memoria_amostras WHERE data_hora >= datetime('now', 'localtime', ?) ORDER BY data_hora",
+            conn,
+            params=periodo
+        )
+        etapas = pd.read_sql_query(
+            "SELECT processo, etapa, COUNT(*) AS execucoes, AVG(duracao_ms) AS duracao_media_ms, "
+            "AVG(variacao_rss_mb) AS variacao_rss_media_mb, MAX(variacao_rss_mb) AS variacao_rss_maxima_mb, "
+            "AVG(variacao_alocado_mb) AS variacao_alocado_media_mb "
+            "FROM memoria_etapas WHERE data_hora >= datetime('now', 'localtime', ?) GROUP BY processo, etapa ORDER BY processo, etapa",
+            conn,
+            params=periodo
+        )
+        conn.close()
+        return {"amostras": amostras, "etapas": etapas.round(2)}
+    except Exception as e:
+        st.error(f"Erro ao obter estatísticas de memória: {e}")
+        conn.close()
+        return vazio
+
+# Função para importar as dependências pesadas em segundo plano, uma única vez por servidor,
+# logo após o primeiro login (enquanto o usuário ainda está no Dashboard)
+@st.cache_resource
+def pre_importar_dependencias():
+    def importar():
+        for modulo in ("pandas", "chromadb", "sentence_transformers"):
+            try:
+                importlib.import_module(modulo)
+            except Exception:
+                pass
+    
+    threading.Thread(target=importar, name="pre-importar-dependencias", daemon=True).start()
+    return True
+
 # Autenticação simples (em produção, use um sistema mais seguro)
 def autenticar(username, password):
     # Em um sistema real, você verificaria as credenciais em um banco de dados seguro
@@ -310,8 +634,14 @@ if 'usuario' not in st.session_state:
     st.session_state.usuario = ""
 if 'triagem_selecionada' not in st.session_state:
     st.session_state.triagem_selecionada = None
+if 'incluir_arquivadas' not in st.session_state:
+    st.session_state.incluir_arquivadas = False
+if 'id_sessao' not in st.session_state:
+    st.session_state.id_sessao = uuid.uuid4().hex
 if 'filtro' not in st.session_state:
     st.session_state.filtro = "todas"
+if 'unidade' not in st.session_state:
+    st.session_state.unidade = obter_unidade().codigo
 
 # Tela de login
 if not st.session_state.autenticado:
@@ -339,15 +669,36 @@ if not st.session_state.autenticado:
     - **Enfermeiro**: enfermeiro / enfermeiro123
     """)
 else:
+    pre_importar_dependencias()
+    if verificar_banco_dados(CAMINHO_BD):
+        obter_monitor_memoria()
+    
     # Barra lateral
     with st.sidebar:
         st.title("🏥 Painel de Administração")
         st.write(f"Usuário: **{st.session_state.usuario}**")
         
+        # Seletor de unidade (aparece apenas quando há mais de uma unidade configurada em unidades.json)
+        unidades = listar_unidades()
+        if len(unidades) > 1:
+            codigos = [unidade.codigo for unidade in unidades]
+            nomes = {unidade.codigo: unidade.nome for unidade in unidades}
+            unidade_escolhida = st.selectbox(
+                "Unidade",
+                codigos,
+                index=codigos.index(st.session_state.unidade),
+                format_func=lambda codigo: nomes[codigo]
+            )
+            if unidade_escolhida != st.session_state.unidade:
+                # As triagens da sessão pertencem à unidade anterior
+                st.session_state.unidade = unidade_escolhida
+                st.session_state.triagem_selecionada = None
+                obter_estados_sessao().descartar(st.session_state.id_sessao)
+        
         # Menu de navegação
         menu = st.radio(
             "Menu",
-            ["Dashboard", "Triagens Pendentes", "Todas as Triagens", "Banco de Conhecimento", "Exportar Dados"]
+            ["Dashboard", "Triagens Pendentes", "Todas as Triagens", "Buscar Triagens", "Banco de Conhecimento", "Exportar Dados"]
         )
         
         # Filtro para triagens
@@ -357,6 +708,11 @@ else:
                 ["todas", "pendentes", "validadas"],
                 format_func=lambda x: x.capitalize()
             )
+            st.session_state.incluir_arquivadas = st.checkbox(
+                "Incluir triagens arquivadas",
+                value=st.session_state.incluir_arquivadas,
+                help="Também lista as triagens validadas antigas movidas para as partições mensais (consulta mais lenta)"
+            )
         
         # Botão de logout
         if st.button("Sair"):
@@ -370,7 +726,6 @@ else:
         
         # Estatísticas
         estatisticas = obter_estatisticas()
-        estatisticas_vetorial = obter_estatisticas_banco_vetorial()
         
         if estatisticas:
             # Estatísticas de validação
@@ -391,22 +746,52 @@ else:
             st.progress(estatisticas["taxa_validacao"] / 100)
             st.write(f"{estatisticas['taxa_validacao']:.1f}% das triagens foram validadas")
             
-            # Estatísticas do banco de conhecimento
-            st.subheader("Banco de Conhecimento")
-            col1, col2, col3 = st.columns(3)
+            # Informações adicionais
+            st.subheader("Informações Adicionais")
+            st.write(f"Número de validadores ativos: {estatisticas['validadores']}")
             
-            with col1:
-                st.metric("Total de Casos", estatisticas_vetorial["total"])
+            # As seções abaixo dependem do banco vetorial e do pandas; ficam por último para que
+            # as estatísticas acima já apareçam na tela enquanto essas dependências são carregadas.
+            # Estatísticas do banco de conhecimento: o espaço fica reservado aqui, mas só é preenchido no fim da página,
+            # depois que as demais seções já foram exibidas, porque a primeira consulta importa o chromadb
+            st.subheader("Banco de Conhecimento")
+            area_banco_conhecimento = st.empty()
+            area_banco_conhecimento.caption("Carregando estatísticas do banco de conhecimento...")
             
-            with col2:
-                st.metric("Casos Originais", estatisticas_vetorial["casos_originais"])
+            # Latência dos servidores de LLM
+            st.subheader("Servidores de LLM (últimas 24h)")
+            estatisticas_llm = obter_estatisticas_llm()
+            if not estatisticas_llm.empty:
+                st.dataframe(estatisticas_llm, use_container_width=True)
+            else:
+                st.info("Nenhuma chamada ao LLM registrada nas últimas 24 horas.")
             
-            with col3:
-                st.metric("Casos Validados", estatisticas_vetorial["casos_validados"])
+            # Memória dos servidores do aplicativo principal e do painel
+            st.subheader("Memória dos Servidores (últimas 24h)")
+            memoria = obter_estatisticas_memoria()
+            amostras = memoria["amostras"]
+            if not amostras.empty:
+                # Situação atual de cada processo (última amostra)
+                atuais = amostras.groupby("processo").tail(1).drop(columns="maiores_crescimentos").round(1)
+                st.dataframe(atuais, use_container_width=True, hide_index=True)
+                
+                # RSS ao longo do tempo: deve ficar estável sob carga constante
+                st.line_chart(amostras.pivot_table(index="data_hora", columns="processo", values="rss_mb"))
+                
+                # Variação de memória por etapa (com várias sessões simultâneas, inclui o que as outras alocaram)
+                if not memoria["etapas"].empty:
+                    st.dataframe(memoria["etapas"], use_container_width=True, hide_index=True)
+                
+                # Linhas de código com maior crescimento desde o início do servidor (apenas com TRIAGEM_TRACEMALLOC)
+                snapshots = amostras.dropna(subset=["maiores_crescimentos"]).groupby("processo").tail(1)
+                for _, snapshot in snapshots.iterrows():
+                    with st.expander(f"Maiores crescimentos de memória: {snapshot['processo']} ({snapshot['data_hora']})"):
+                        st.dataframe(json.loads(snapshot["maiores_crescimentos"]), use_container_width=True)
+            else:
+                st.info("Nenhuma amostra de memória registrada nas últimas 24 horas.")
             
-            # Informações adicionais
-            st.subheader("Informações Adicionais")
-            st.write(f"Número de validadores ativos: {estatisticas['validadores']}")
+            with area_banco_conhecimento.container():
+                exibir_estatisticas_banco_vetorial(obter_estatisticas_banco_vetorial())
         else:
             st.warning("Não foi possível obter estatísticas. Verifique se o banco de dados existe.")
     
@@ -418,28 +803,16 @@ else:
             st.title("Todas as Triagens")
         
         # Obter triagens com base no filtro
-        triagens = obter_triagens(st.session_state.filtro)
+        if menu == "Triagens Pendentes":
+            # Lista da sessão, atualizada pelos eventos (a tabela se atualiza sozinha; a seleção, no próximo clique)
+            sincronizar_pendentes(forcar=True)
+            exibir_tabela_pendentes()
+            triagens = pendentes_da_sessao()[0]
+        else:
+            triagens = obter_triagens(st.session_state.filtro, st.session_state.incluir_arquivadas)
+            exibir_tabela_triagens(triagens)
         
         if not triagens.empty:
-            # Exibir tabela de triagens
-            st.write(f"Total de registros: {len(triagens)}")
-            
-            # Simplificar a visualização da tabela
-            tabela_triagens = triagens.copy()
-            tabela_triagens['sintomas'] = tabela_triagens['sintomas'].str[:50] + "..."
-            tabela_triagens['resposta'] = tabela_triagens['resposta'].str[:50] + "..."
-            
-            # Adicionar coluna de status
-            tabela_triagens['status'] = tabela_triagens['validado'].apply(
-                lambda x: "✅ Validado" if x == 1 else "⏳ Pendente"
-            )
-            
-            # Exibir tabela
-            st.dataframe(
-                tabela_triagens[['id', 'sintomas', 'data_hora', 'status']],
-                use_container_width=True
-            )
-            
             # Seleção de triagem para visualização detalhada
             triagem_id = st.selectbox(
                 "Selecione uma triagem para visualizar detalhes",
@@ -468,6 +841,8 @@ else:
                             st.success("Validado")
                             st.write(f"Validado por: {st.session_state.triagem_selecionada['validado_por']}")
                             st.write(f"Data de validação: {st.session_state.triagem_selecionada['data_validacao']}")
+                            if st.session_state.triagem_selecionada.get('particao'):
+                                st.info(f"Triagem arquivada (partição {st.session_state.triagem_selecionada['particao']})")
                         else:
                             st.warning("Pendente de validação")
                     
@@ -483,6 +858,20 @@ else:
                     st.subheader("Resposta do Sistema")
                     st.write(st.session_state.triagem_selecionada['resposta'])
                     
+                    # Triagens semelhantes já validadas, para comparar a classificação com casos anteriores
+                    st.subheader("Triagens semelhantes já validadas")
+                    semelhantes = obter_triagens_semelhantes(st.session_state.triagem_selecionada)
+                    if semelhantes:
+                        for semelhante in semelhantes:
+                            with st.expander(f"Similaridade {semelhante['similaridade']:.0%} — validada por {semelhante['validado_por']} em {semelhante['data_validacao']}"):
+                                st.write("**Sintomas:**")
+                                st.write(semelhante['sintomas'])
+                                st.write("**Feedback:**")
+                                st.write(semelhante['feedback'] or "Sem feedback.")
+                                st.caption(f"ID: {semelhante['id']}")
+                    else:
+                        st.info("Nenhuma triagem validada semelhante encontrada.")
+                    
                     # Formulário de validação (apenas para triagens pendentes)
                     if st.session_state.triagem_selecionada['validado'] == 0:
                         with st.form("validacao_form"):
@@ -521,36 +910,88 @@ else:
                                     st.success("Triagem excluída com sucesso!")
                                     st.session_state.triagem_selecionada = None
                                     st.rerun()
-                    else:
-                        # Opção para excluir triagem validada
+                    elif not st.session_state.triagem_selecionada.get('particao'):
+                        # Opção para excluir triagem validada (triagens arquivadas não são excluídas pelo painel)
                         if st.button("Excluir Triagem"):
                             if excluir_triagem(st.session_state.triagem_selecionada['id']):
                                 st.success("Triagem excluída com sucesso!")
                                 st.session_state.triagem_selecionada = None
                                 st.rerun()
-        else:
-            if st.session_state.filtro == "pendentes":
-                st.info("Não há triagens pendentes de validação.")
-            else:
-                st.info("Não há triagens registradas no sistema.")
     
-    elif menu == "Banco de Conhecimento":
-        st.title("Banco de Conhecimento")
-        
-        # Estatísticas do banco de conhecimento
-        estatisticas_vetorial = obter_estatisticas_banco_vetorial()
+    elif menu == "Buscar Triagens":
+        st.title("Buscar Triagens")
         
-        # Exibir estatísticas
-        col1, col2, col3 = st.columns(3)
+        col1, col2 = st.columns([3, 1])
         
         with col1:
-            st.metric("Total de Casos", estatisticas_vetorial["total"])
+            termo = st.text_input(
+                "Buscar por sintomas, resposta ou feedback",
+                placeholder="Ex.: dispneia, dor torácica"
+            )
         
         with col2:
-            st.metric("Casos Originais", estatisticas_vetorial["casos_originais"])
+            por_pagina = st.selectbox("Resultados por página", [10, 20, 50], index=1)
+        
+        if termo:
+            # Volta para a primeira página quando a busca muda
+            if st.session_state.get("termo_busca") != (termo, por_pagina):
+                st.session_state.termo_busca = (termo, por_pagina)
+                st.session_state.pagina_busca = 1
+            
+            total, resultados = buscar_triagens_texto(termo, st.session_state.pagina_busca, por_pagina)
+            total_paginas = max(1, math.ceil(total / por_pagina))
+            
+            st.write(f"{total} triagens encontradas — página {st.session_state.pagina_busca} de {total_paginas}")
+            if total > LIMITE_ORDENACAO_RELEVANCIA:
+                st.caption("Muitos resultados: exibindo as triagens mais recentes primeiro. Refine a busca para ordenar por relevância.")
+            
+            # Resultados com os trechos encontrados destacados
+            for resultado in resultados:
+                status = "✅ Validado" if resultado["validado"] == 1 else "⏳ Pendente"
+                st.markdown(
+                    f"**{resultado['data_hora']}** · {status} · `{resultado['id']}`<br>{resultado['trecho']}",
+                    unsafe_allow_html=True
+                )
+            
+            # Navegação entre páginas
+            col1, col2, _ = st.columns([1, 1, 4])
+            
+            with col1:
+                if st.button("← Anterior", disabled=st.session_state.pagina_busca <= 1):
+                    st.session_state.pagina_busca -= 1
+                    st.rerun()
+            
+            with col2:
+                if st.button("Próxima →", disabled=st.session_state.pagina_busca >= total_paginas):
+                    st.session_state.pagina_busca += 1
+                    st.rerun()
+            
+            # Detalhes de uma triagem encontrada
+            if resultados:
+                triagem_id = st.selectbox(
+                    "Abrir triagem",
+                    [resultado["id"] for resultado in resultados],
+                    format_func=lambda x: f"ID: {x[:8]}..."
+                )
+                triagem = obter_triagem(triagem_id)
+                
+                if triagem is not None:
+                    st.subheader("Sintomas do Paciente")
+                    st.write(triagem['sintomas'])
+                    
+                    st.subheader("Resposta do Sistema")
+                    st.write(triagem['resposta'])
+                    
+                    if triagem['feedback']:
+                        st.subheader("Feedback")
+                        st.write(triagem['feedback'])
+    
+    elif menu == "Banco de Conhecimento":
+        import pandas as pd
+        st.title("Banco de Conhecimento")
         
-        with col3:
-            st.metric("Casos Validados", estatisticas_vetorial["casos_validados"])
+        # Estatísticas do banco de conhecimento
+        exibir_estatisticas_banco_vetorial(obter_estatisticas_banco_vetorial())
         
         # Informações sobre o banco de conhecimento
         st.subheader("Sobre o Banco de Conhecimento")
@@ -564,11 +1005,8 @@ else:
         
         # Visualizar casos do banco (se possível)
         try:
-            chroma_client = chromadb.PersistentClient(path="./chroma_db")
-            collection_name = "triagem_hci"
-            
-            if collection_name in [col.name for col in chroma_client.list_collections()]:
-                collection = chroma_client.get_collection(collection_name)
+            if existe_colecao_da_unidade(unidade_atual()):
+                collection = colecao_da_unidade(unidade_atual())
                 
                 # Obter todos os casos
                 todos_casos = collection.get()
@@ -605,21 +1043,24 @@ else:
             st.error(f"Erro ao visualizar casos do banco de conhecimento: {e}")
     
     elif menu == "Exportar Dados":
+        import pandas as pd
         st.title("Exportar Dados")
         
         st.write("Exporte os dados de triagem para análise externa ou backup.")
         
+        compactar_exportacao = st.checkbox("Compactar com gzip (.csv.gz)", value=True)
+        
         if st.button("Gerar CSV"):
             df = exportar_csv()
             
             if df is not None and not df.empty:
-                csv = df.to_csv(index=False)
+                dados, extensao, mime = gerar_arquivo_exportacao(df, compactar_exportacao)
                 
                 st.download_button(
                     label="Baixar CSV",
-                    data=csv,
-                    file_name=f"triagens_exportadas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                    mime="text/csv"
+                    data=dados,
+                    file_name=f"triagens_exportadas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extensao}",
+                    mime=mime
                 )
             else:
                 st.error("Não foi possível gerar o arquivo CSV.")
@@ -633,17 +1074,17 @@ else:
             if st.button("Exportar apenas validadas"):
                 conn = conectar_bd()
                 if conn is not None:
-                    df = pd.read_sql_query("SELECT * FROM validacao_triagem WHERE validado = 1", conn)
+                    df = ler_exportacao(conn, "validado = 1")
                     conn.close()
                     
                     if not df.empty:
-                        csv = df.to_csv(index=False)
+                        dados, extensao, mime = gerar_arquivo_exportacao(df, compactar_exportacao)
                         
                         st.download_button(
                             label="Baixar CSV (Validadas)",
-                            data=csv,
-                            file_name=f"triagens_validadas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                            mime="text/csv"
+                            data=dados,
+                            file_name=f"triagens_validadas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extensao}",
+                            mime=mime
                         )
                     else:
                         st.warning("Não há triagens validadas para exportar.")
@@ -652,17 +1093,17 @@ else:
             if st.button("Exportar apenas pendentes"):
                 conn = conectar_bd()
                 if conn is not None:
-                    df = pd.read_sql_query("SELECT * FROM validacao_triagem WHERE validado = 0", conn)
+                    df = ler_exportacao(conn, "validado = 0")
                     conn.close()
                     
                     if not df.empty:
-                        csv = df.to_csv(index=False)
+                        dados, extensao, mime = gerar_arquivo_exportacao(df, compactar_exportacao)
                         
                         st.download_button(
                             label="Baixar CSV (Pendentes)",
-                            data=csv,
-                            file_name=f"triagens_pendentes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                            mime="text/csv"
+                            data=dados,
+                            file_name=f"triagens_pendentes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extensao}",
+                            mime=mime
                         )
                     else:
                         st.warning("Não há triagens pendentes para exportar.")
@@ -1,91 +1,84 @@
-from typing import List # Importa o tipo de dado List usado para anotar funções
+import uuid
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning) # Ignora mensagens de alerta do tipo UserWarning (apenas para deixar a interface limpa)
 import streamlit as st # Importa a biblioteca de interface web Streamlit
-from llama_index.core.llms import ChatMessage # Importa classes do LlamaIndex para usar um modelo de linguagem (LLM)
-from llama_index.llms.ollama import Ollama
-from llama_index.core import Settings
-# Permite usar asyncio dentro do Streamlit sem conflito. Asyncio permite que múltiplas tarefas rodem ao mesmo tempo, sem travar.
-import nest_asyncio
-nest_asyncio.apply()
-# Importa o ChromaDB, um banco de dados vetorial para armazenar e buscar embeddings
-import chromadb
-# Importa sqlite3 para armazenar as respostas para validação
-import sqlite3
-# Importa datetime para registrar a data e hora da triagem
-from datetime import datetime
-# Importa uuid para gerar identificadores únicos
-import uuid
-
-# Função para inicializar o banco de dados de validação
-def init_validation_db():
-    conn = sqlite3.connect('./validacao_triagem.db')
-    cursor = conn.cursor()
-    # Cria a tabela de validação se não existir
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS validacao_triagem (
-        id TEXT PRIMARY KEY,
-        sintomas TEXT NOT NULL,
-        resposta TEXT NOT NULL,
-        data_hora TEXT NOT NULL,
-        validado INTEGER DEFAULT 0,
-        feedback TEXT,
-        validado_por TEXT,
-        data_validacao TEXT
+# Importa o gateway que distribui as requisições entre os servidores Ollama configurados.
+# O gateway usa HTTP síncrono, então o nest_asyncio (necessário para o cliente assíncrono do LlamaIndex) não é mais usado.
+# ChromaDB e Sentence Transformers são importados apenas quando o botão "Diagnosticar" é clicado,
+# para que a página abra sem pagar o custo dessas importações (ver perfil_importacao.py)
+from gateway_llm import GatewayOllama
+# Importa o acesso ao banco vetorial (ChromaDB ou índice NumPy, conforme TRIAGEM_BACKEND_VETORIAL) para armazenar e buscar embeddings
+from banco_vetorial import modelo_da_colecao
+# Importa a configuração das unidades (cada hospital/pronto-atendimento tem sua base de casos e seu banco de validação)
+from unidades import buscar_casos_semelhantes, colecao_da_unidade, listar_unidades, obter_unidade
+# Importa as funções do banco de dados SQLite onde as respostas são armazenadas para validação
+# (a tabela de triagens e o índice de busca textual usado pelo painel administrativo)
+from banco_validacao import CAMINHO_BD, incrementar_versao_dados, init_validation_db
+# Importa as etapas da triagem que não dependem da interface (prompt enviado ao modelo, estado da triagem e envio para validação)
+from nucleo_triagem import MENSAGEM_SISTEMA, criar_triagem_sessao, enviar_para_validacao, montar_mensagens
+# Importa o modelo de embeddings compartilhado (carregado uma vez por servidor, não a cada clique)
+from embeddings import embed_text, embed_textos
+# Importa a medição de memória por etapa e o estado das sessões com descarte das ociosas
+from memoria import EstadoSessoes, MonitorMemoria
+# Importa threading para aquecer o modelo em segundo plano
+import threading
+
+# Escolhe a unidade da triagem: parâmetro ?unidade= da URL, variável TRIAGEM_UNIDADE ou a unidade padrão.
+# Quando há mais de uma unidade configurada, ela também pode ser trocada na barra lateral.
+# Um código desconhecido na URL (link antigo ou digitado errado) não derruba o aplicativo: usa a unidade padrão.
+unidades = listar_unidades()
+try:
+    unidade = obter_unidade(st.query_params.get("unidade"))
+except KeyError as erro:
+    st.warning(f"{erro.args[0]}. Usando a unidade padrão.")
+    unidade = obter_unidade()
+if len(unidades) > 1:
+    unidade = st.sidebar.selectbox(
+        "Unidade",
+        unidades,
+        index=unidades.index(unidade),
+        format_func=lambda u: u.nome,
     )
-    ''')
-    conn.commit()
-    conn.close()
-
-# Função para salvar a resposta no banco de dados de validação
-def salvar_para_validacao(sintomas, resposta):
-    conn = sqlite3.connect('./validacao_triagem.db')
-    cursor = conn.cursor()
-    
-    # Gera um ID único para a triagem
-    triagem_id = str(uuid.uuid4())
-    
-    # Obtém a data e hora atual
-    data_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Insere os dados na tabela
-    cursor.execute(
-        "INSERT INTO validacao_triagem (id, sintomas, resposta, data_hora) VALUES (?, ?, ?, ?)",
-        (triagem_id, sintomas, str(resposta), data_hora)
-    )
-    
-    conn.commit()
-    conn.close()
-    
-    return triagem_id
-
-# Inicializa o banco de dados de validação
-init_validation_db()
-
-# Inicializa o modelo de linguagem da Ollama com o modelo Mistral
-llm = Ollama(model="mistral", request_timeout=420.0)
-Settings.llm = llm
-
-# Cria o cliente do banco de dados vetorial ChromaDB com persistência (armazenamento local no diretório chroma_db)
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
-
-# Define o nome da coleção (como uma "tabela") onde os dados serão armazenados
-collection_name = "triagem_hci"
-
-# Lista as coleções existentes no banco de dados (SELECT * FROM collections)
-collections = chroma_client.list_collections()
-
-# Verifica se a coleção já existe. Se sim, obtém ela. Caso contrário, cria uma nova.
-if collection_name in [col.name for col in collections]:
-    collection = chroma_client.get_collection(collection_name)
+    # Permite consultar também as bases de casos das demais unidades (os 3 casos mais próximos entre todas)
+    buscar_todas_unidades = st.sidebar.checkbox("Buscar casos semelhantes em todas as unidades", value=False)
 else:
-    collection = chroma_client.create_collection(name=collection_name)
-
-# Inicializa variáveis de estado da sessão
-if 'resposta_atual' not in st.session_state:
-    st.session_state.resposta_atual = None
-if 'sintomas_atuais' not in st.session_state:
-    st.session_state.sintomas_atuais = None
+    buscar_todas_unidades = False
+
+# Inicializa o banco de dados de validação da unidade
+init_validation_db(unidade.caminho_bd)
+
+# Inicializa o acesso ao modelo Mistral através do gateway de servidores Ollama (URLs em TRIAGEM_OLLAMA_URLS).
+# O gateway é criado uma única vez por servidor Streamlit, mantendo as conexões HTTP abertas entre as execuções do script.
+@st.cache_resource
+def obter_llm():
+    gateway = GatewayOllama(model="mistral", request_timeout=420.0, caminho_bd=CAMINHO_BD)
+    # Carrega o modelo em segundo plano já na inicialização, para que a primeira triagem não pague o tempo de carga,
+    # e renova o keep_alive periodicamente durante o horário do turno (TRIAGEM_TURNO_INICIO / TRIAGEM_TURNO_FIM)
+    threading.Thread(target=gateway.aquecer, args=(MENSAGEM_SISTEMA,), name="aquecer-llm", daemon=True).start()
+    gateway.iniciar_manter_aquecido()
+    return gateway
+
+llm = obter_llm()
+
+# Estado das triagens ainda não enviadas, de todas as sessões do servidor. Fica fora do st.session_state para que
+# as sessões ociosas (abas esquecidas abertas) sejam descartadas (TRIAGEM_SESSAO_OCIOSA_MIN, TRIAGEM_MAX_SESSOES)
+@st.cache_resource
+def obter_estados_sessao():
+    return EstadoSessoes()
+
+# Monitor de memória do servidor: mede as etapas da triagem e grava amostras periódicas, exibidas no Dashboard do painel
+@st.cache_resource
+def obter_monitor_memoria():
+    return MonitorMemoria("AppTriagem", CAMINHO_BD, sessoes=obter_estados_sessao())
+
+estados_sessao = obter_estados_sessao()
+monitor = obter_monitor_memoria()
+
+# Inicializa variáveis de estado da sessão (apenas valores pequenos; a triagem em andamento fica em estados_sessao)
+if 'id_sessao' not in st.session_state:
+    st.session_state.id_sessao = uuid.uuid4().hex
+if 'triagem_em_andamento' not in st.session_state:
+    st.session_state.triagem_em_andamento = False
 if 'enviado_para_validacao' not in st.session_state:
     st.session_state.enviado_para_validacao = False
 if 'triagem_id' not in st.session_state:
@@ -106,119 +99,85 @@ if st.button("Diagnosticar"):
     if new_case:
         # Mostra um spinner (indicador visual) enquanto o processamento ocorre
         with st.spinner("Diagnosticando..."):
+            # Obtém a coleção (como uma "tabela") da unidade onde os dados serão armazenados, no backend vetorial configurado.
+            # No ChromaDB (armazenamento local no diretório chroma_db), se ainda não existir, ela é criada
+            # com métrica de cosseno e os parâmetros HNSW definidos em banco_vetorial.py
+            collection = colecao_da_unidade(unidade)
 
-            # Importa e carrega o modelo de embeddings (vetorização) 
-            from sentence_transformers import SentenceTransformer
-            # Carrega um modelo pré-treinado de embeddings semânticos chamado all-MiniLM-L6-v2, 
-            # disponibilizado pela Sentence Transformers, uma biblioteca baseada no Hugging Face e no PyTorch
-            model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-
-            # Função que converte um texto em vetor numérico (embedding)
-            def embed_text(text: str) -> List[float]:
-                # Aplica o modelo para transformar o texto em vetor (tensor)
-                embeddings = model.encode([text], convert_to_tensor=True)
-                # Converte o tensor para lista de floats e retorna
-                return embeddings.cpu().numpy()[0].tolist()
+            # Modelo de embeddings semânticos da base de casos da unidade (por padrão o all-MiniLM-L6-v2,
+            # ou o modelo para o qual a base foi reindexada), disponibilizado pela Sentence Transformers,
+            # uma biblioteca baseada no Hugging Face e no PyTorch. O modelo é carregado uma única vez por servidor
+            # (ver embeddings.py), e não a cada clique, o que acumulava memória do torch entre as sessões
+            nome_modelo = modelo_da_colecao(unidade.colecao)
 
             # Função para ler os casos de triagem simulados a partir do arquivo "casos.txt"
-            def load_triagem_cases(filepath: str) -> List[str]:
+            def load_triagem_cases(filepath: str):
                 # Abre o arquivo e retorna apenas linhas não vazias
                 with open(filepath, "r", encoding="utf-8") as file:
                     return [line.strip() for line in file if line.strip()]
 
-            # Carrega os casos simulados do arquivo
-            triagem_cases = load_triagem_cases("casos.txt")
+            with monitor.etapa("carga_base_casos"):
+                # Carrega os casos simulados do arquivo da unidade
+                triagem_cases = load_triagem_cases(unidade.arquivo_casos)
 
-            # Recupera os IDs já existentes no banco vetorial para evitar duplicação
-            existing_ids = set(collection.get()["ids"])
+                # Recupera os IDs já existentes no banco vetorial para evitar duplicação
+                existing_ids = set(collection.get(include=[])["ids"])
 
-            # Para cada caso do arquivo
-            for i, case in enumerate(triagem_cases):
-                # Cria um ID único com base no índice
-                case_id = f"case_{i}"
-                # Adiciona o caso no banco apenas se ainda não existir
-                if case_id not in existing_ids:
-                    # Converte o caso em embedding
-                    embedding = embed_text(case)
-                    # Adiciona o vetor ao banco com o ID e metadado de conteúdo textual
+                # Adiciona ao banco apenas os casos que ainda não existem, com o ID baseado no índice
+                # e o texto original como metadado, convertendo-os em embeddings de uma vez
+                novos = [(f"case_{i}", case) for i, case in enumerate(triagem_cases) if f"case_{i}" not in existing_ids]
+                if novos:
                     collection.add(
-                        embeddings=[embedding],
-                        ids=[case_id],
-                        metadatas=[{"content": case}]  # Armazena o texto original como metadado
+                        embeddings=embed_textos([case for _, case in novos], nome_modelo),
+                        ids=[case_id for case_id, _ in novos],
+                        metadatas=[{"content": case} for _, case in novos]
                     )
+                    # Avisa o painel administrativo que as estatísticas do banco vetorial mudaram
+                    incrementar_versao_dados("banco_vetorial", unidade.caminho_bd)
 
             # Converte os sintomas informados pelo usuário em vetor (embedding)
-            query_embedding = embed_text(new_case)
+            with monitor.etapa("embedding"):
+                query_embedding = embed_text(new_case, nome_modelo)
 
-            # Consulta no banco vetorial os 3 casos mais semelhantes ao novo caso informado.
+            # Consulta no banco vetorial os 3 casos mais semelhantes ao novo caso informado
+            # (apenas na coleção da unidade, ou em todas as unidades se a opção estiver marcada).
             # O ChromaDB utiliza o vetor de embedding gerado para o novo caso (query_embedding)
             # e compara esse vetor com todos os vetores previamente armazenados na coleção.
             # Essa comparação é feita usando uma métrica de similaridade (como produto interno ou cosseno),
             # retornando os 'n_results' casos com maior similaridade semântica.
             # O resultado inclui os metadados dos casos mais parecidos, que serão usados para orientar a resposta do LLM.
-            results = collection.query(query_embeddings=[query_embedding], n_results=3)
+            with monitor.etapa("busca_casos"):
+                results = buscar_casos_semelhantes(query_embedding, 3, unidade, todas_unidades=buscar_todas_unidades)
 
             # Extrai os conteúdos (textos) dos casos similares retornados
-            similar_cases = [metadata["content"] for metadata in results['metadatas'][0]]
-
-            # Monta o prompt com os sintomas e os casos similares
-            input_text = f"Sintomas do novo caso: {new_case}\n\nCasos Similares: {' '.join(similar_cases)}"
+            similar_cases = [caso["conteudo"] for caso in results]
 
-            # Cria a sequência de mensagens para enviar ao modelo de linguagem
-            messages = [
-                # Mensagem inicial: define o comportamento do assistente como um profissional da saúde
-                ChatMessage(
-                    role="system",
-                    content="Você é um profissional de saúde responsável por analisar sintomas clínicos no Hospital de Clínicas de Ijuí. Seu objetivo é classificar o diagnóstico mais provável com base na CID-10, informando o código correspondente e sugerindo condutas clínicas iniciais apropriadas ao caso. Não inclua informações irrelevantes ou fora do contexto clínico."
-                ),
-                # Mensagem com os sintomas e os casos similares
-                ChatMessage(role="user", content=input_text),
-                # Solicita resposta estruturada com classificação, justificativa e conduta
-                ChatMessage(
-                    role="user",
-                    content=(
-                        "Com base nos sintomas descritos e nos casos similares fornecidos, elabore uma resposta estruturada contendo as seguintes seções:\n\n"
-                        "Diagnóstico\n"
-                        "Nome (CID-10: [CÓDIGO]): [Nome da condição diagnosticada]\n\n"
-                        "Classificação de Risco\n"
-                        "Cor: [Vermelha | Laranja | Amarela | Verde | Azul]\n"
-                        "Justificativa: [Explique clinicamente os motivos da classificação com base nos sintomas, sinais vitais e idade do paciente]\n\n"
-                        "Conduta Clínica Inicial\n"
-                        "Encaminhamento: [Para onde o paciente deve ser encaminhado]\n"
-                        "Objetivo: [O que deve ser feito inicialmente com o paciente: exames, estabilização, etc.]\n\n"
-                        "Responda de forma objetiva, clara, curta e seguindo linguagem médica. Evite informações desnecessárias ou fora do contexto clínico."
-)
-                ),
-            ]
+            # Monta a sequência de mensagens para enviar ao modelo de linguagem: comportamento do assistente,
+            # sintomas com os casos similares e o formato de resposta estruturada (ver nucleo_triagem.py)
+            messages = montar_mensagens(new_case, similar_cases)
 
             # Tenta executar a consulta ao modelo (via Ollama)
             try:
-                resposta = llm.chat(messages)  # Envia as mensagens para o modelo e recebe resposta
+                with monitor.etapa("llm"):
+                    resposta = llm.chat(messages)  # Envia as mensagens para o modelo e recebe resposta
                 
-                # Armazena a resposta e os sintomas na sessão para uso posterior
-                st.session_state.resposta_atual = resposta
-                st.session_state.sintomas_atuais = new_case
+                # Guarda a triagem para o envio posterior: sintomas, texto da resposta já separado em seções, vetor dos sintomas
+                # e o modelo que o calculou (para indexá-lo junto com a triagem, sem recalculá-lo enquanto a coleção usar o mesmo
+                # modelo) e unidade (para salvá-la no banco certo mesmo que a unidade seja trocada antes do envio).
+                # O objeto de resposta do modelo não é guardado
+                triagem = criar_triagem_sessao(new_case, resposta, query_embedding, unidade.codigo, nome_modelo)
+                estados_sessao.guardar(st.session_state.id_sessao, triagem)
+                st.session_state.triagem_em_andamento = True
                 
                 # Exibe o resultado na interface web
                 st.markdown("""
                     <h3 style='color:#2E8B57;font-weight:bold;margin:12px 0 4px 0;'>✅ Diagnóstico</h3>
                 """, unsafe_allow_html=True)
 
-                if resposta:
-                    resposta_texto = str(resposta)
-
-                    def extrair_bloco(texto, inicio, fim=None):
-                        try:
-                            start = texto.index(inicio)
-                            end = texto.index(fim) if fim else len(texto)
-                            return texto[start + len(inicio):end].strip()
-                        except ValueError:
-                            return "Informação não disponível."
-
-                    bloco_diagnostico = extrair_bloco(resposta_texto, "Diagnóstico", "Classificação de Risco")
-                    st.markdown(f"<div style='margin:0;'>{bloco_diagnostico}</div>", unsafe_allow_html=True)
+                if triagem.resposta:
+                    st.markdown(f"<div style='margin:0;'>{triagem.diagnostico}</div>", unsafe_allow_html=True)
 
-                    bloco_classificacao = extrair_bloco(resposta_texto, "Classificação de Risco", "Conduta Clínica Inicial")
+                    bloco_classificacao = triagem.classificacao
                     def detectar_cor_classificacao(texto):
                         cores = {
                             "vermelha": ("#B22222", "🟥"),
@@ -260,8 +219,7 @@ if st.button("Diagnosticar"):
                         texto = re.sub(r"Objetivo:(.*?)", r"<br><strong>Objetivo:</strong>\1", texto)
                         return texto
 
-                    bloco_conduta = extrair_bloco(resposta_texto, "Conduta Clínica Inicial")
-                    st.markdown(f"<div style='margin-bottom:30px ;'>{formatar_conduta(bloco_conduta)}</div>", unsafe_allow_html=True)
+                    st.markdown(f"<div style='margin-bottom:30px ;'>{formatar_conduta(triagem.conduta)}</div>", unsafe_allow_html=True)
                                 
             except Exception as e:
                 # Em caso de erro, mostra uma mensagem de erro na interface
@@ -271,15 +229,29 @@ if st.button("Diagnosticar"):
         st.warning("Por favor, insira os sintomas do paciente.")
 
 # Botão para enviar para validação (aparece apenas se houver uma resposta)
-if st.session_state.resposta_atual is not None and not st.session_state.enviado_para_validacao:
+triagem_atual = estados_sessao.obter(st.session_state.id_sessao) if st.session_state.triagem_em_andamento else None
+if st.session_state.triagem_em_andamento and triagem_atual is None and not st.session_state.enviado_para_validacao:
+    # A triagem foi descartada porque a sessão ficou ociosa por muito tempo
+    st.session_state.triagem_em_andamento = False
+    st.info("A triagem anterior expirou por inatividade. Clique em \"Diagnosticar\" novamente para enviá-la para validação.")
+if triagem_atual is not None and not st.session_state.enviado_para_validacao:
     if st.button("Enviar para validação por especialistas"):
-        # Salva a resposta no banco de dados de validação
-        triagem_id = salvar_para_validacao(
-            st.session_state.sintomas_atuais, 
-            st.session_state.resposta_atual
-        )
+        # Salva a resposta no banco de dados de validação e indexa o vetor dos sintomas,
+        # para que o painel mostre triagens semelhantes já validadas
+        with monitor.etapa("envio_validacao"):
+            triagem_id, erro_indexacao = enviar_para_validacao(
+                triagem_atual.sintomas,
+                triagem_atual.resposta,
+                triagem_atual.embedding,
+                obter_unidade(triagem_atual.unidade),
+                triagem_atual.modelo
+            )
+        if erro_indexacao is not None:
+            st.warning(f"A triagem foi salva, mas não foi indexada para busca de casos semelhantes: {erro_indexacao}")
         
-        # Atualiza o estado da sessão
+        # Atualiza o estado da sessão (a triagem enviada não precisa mais ficar na memória)
+        estados_sessao.descartar(st.session_state.id_sessao)
+        st.session_state.triagem_em_andamento = False
         st.session_state.enviado_para_validacao = True
         st.session_state.triagem_id = triagem_id
         
@@ -0,0 +1,344 @@
+# Arquivamento e compactação do banco de validação de triagens
+#
+# Triagens validadas há mais de N dias saem da tabela validacao_triagem (que é consultada a cada tela do
+# painel) e vão para partições mensais em ./arquivo: um banco SQLite por mês (validacao_triagem_AAAA_MM.db)
+# ou um arquivo Parquet compactado com zstd (validacao_triagem_AAAA_MM.parquet, requer pyarrow).
+# As partições guardam os textos já descomprimidos (lidos com consultar_textos), para que possam ser
+# abertas sem os dicionários de compressão do banco principal.
+# O painel administrativo consulta as partições apenas quando o usuário pede para incluir as arquivadas.
+# Depois de arquivar, o banco principal passa por VACUUM/ANALYZE para devolver o espaço e atualizar as estatísticas.
+# Só as triagens cujo rowid o VACUUM mudou são reindexadas na busca textual (a reconstrução completa é opcional).
+#
+# Uso pela linha de comando (a partir da pasta AssistenteIA), por exemplo agendado uma vez por semana:
+#   python arquivamento.py status
+#   python arquivamento.py arquivar --dias 180 --formato sqlite
+#   python arquivamento.py compactar
+#   python arquivamento.py compactar --reconstruir-busca
+#   python arquivamento.py executar --dias 180 --formato parquet
+import argparse
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from banco_validacao import (
+    CAMINHO_BD, busca_textual_consistente, conectar, consultar_textos, indexar_busca_textual, init_validation_db, limpar_eventos,
+    reconstruir_busca_textual, remover_da_busca_textual
+)
+
+# Diretório das partições mensais
+CAMINHO_ARQUIVO = os.environ.get("TRIAGEM_ARQUIVO_PATH", "./arquivo")
+
+# Idade mínima (em dias, pela data da triagem) para uma triagem validada ser arquivada
+DIAS_ARQUIVAMENTO = int(os.environ.get("TRIAGEM_DIAS_ARQUIVAMENTO", "180"))
+
+FORMATOS = ("sqlite", "parquet")
+
+COLUNAS = ["id", "sintomas", "resposta", "data_hora", "validado", "feedback", "validado_por", "data_validacao"]
+
+_PADRAO_PARTICAO = re.compile(r"^validacao_triagem_(\d{4})_(\d{2})\.(db|parquet)$")
+
+# Função para montar o caminho da partição de um mês ("2025-03" -> ./arquivo/validacao_triagem_2025_03.db)
+def caminho_particao(mes: str, formato: str, caminho_arquivo: str = CAMINHO_ARQUIVO) -> str:
+    extensao = "db" if formato == "sqlite" else "parquet"
+    return os.path.join(caminho_arquivo, f"validacao_triagem_{mes.replace('-', '_')}.{extensao}")
+
+# Função para listar as partições existentes, da mais recente para a mais antiga: (mês, formato, caminho)
+def listar_particoes(caminho_arquivo: str = CAMINHO_ARQUIVO) -> List[Tuple[str, str, str]]:
+    if not os.path.isdir(caminho_arquivo):
+        return []
+    particoes = []
+    for nome in os.listdir(caminho_arquivo):
+        correspondencia = _PADRAO_PARTICAO.match(nome)
+        if correspondencia:
+            ano, mes, extensao = correspondencia.groups()
+            formato = "sqlite" if extensao == "db" else "parquet"
+            particoes.append((f"{ano}-{mes}", formato, os.path.join(caminho_arquivo, nome)))
+    return sorted(particoes, reverse=True)
+
+# Função para criar a tabela de uma partição SQLite (mesmo esquema da tabela principal, sem o índice de busca textual)
+def _criar_tabela_particao(conn, esquema: str = "main"):
+    conn.execute(f'''
+    CREATE TABLE IF NOT EXISTS {esquema}.validacao_triagem (
+        id TEXT PRIMARY KEY,
+        sintomas TEXT NOT NULL,
+        resposta TEXT NOT NULL,
+        data_hora TEXT NOT NULL,
+        validado INTEGER DEFAULT 0,
+        feedback TEXT,
+        validado_por TEXT,
+        data_validacao TEXT
+    )
+    ''')
+
+# Move as triagens de um mês para a partição SQLite, em lotes. Cada lote é confirmado em duas etapas: primeiro a cópia
+# na partição, depois a remoção do índice de busca e a exclusão no banco principal. Uma única transação sobre os dois
+# bancos só seria atômica no modo de journal padrão (rollback); em WAL, o SQLite confirma cada banco separadamente e
+# uma interrupção poderia confirmar a exclusão sem a cópia. Na ordem cópia-exclusão, uma interrupção entre as etapas
+# deixa o lote nos dois bancos; a próxima execução o copia de novo (INSERT OR REPLACE pelo id) e o exclui, sem perda
+# nem duplicação.
+def _arquivar_mes_sqlite(conn, mes: str, limite: str, caminho: str, caminho_bd: str, tamanho_lote: int = 1000) -> int:
+    conn.execute("ATTACH DATABASE ? AS particao", (caminho,))
+    try:
+        _criar_tabela_particao(conn, "particao")
+        conn.commit()
+        filtro = "validado = 1 AND data_hora < ? AND data_hora >= ? AND data_hora < ?"
+        parametros = (limite, mes, _mes_seguinte(mes))
+        cursor = conn.cursor()
+        movidas = 0
+        while True:
+            # As linhas movidas saem da tabela, então cada lote lê as próximas do início
+            triagens = consultar_textos(cursor, filtro, (*parametros, tamanho_lote), "LIMIT ?", caminho_bd)
+            if not triagens:
+                break
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO particao.validacao_triagem ({', '.join(COLUNAS)}) VALUES ({', '.join('?' for _ in COLUNAS)})",
+                [tuple(t[coluna] for coluna in COLUNAS) for t in triagens]
+            )
+            conn.commit()
+            remover_da_busca_textual(cursor, triagens)
+            cursor.executemany("DELETE FROM main.validacao_triagem WHERE rowid = ?", [(t["rowid"],) for t in triagens])
+            conn.commit()
+            movidas += len(triagens)
+        return movidas
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("DETACH DATABASE particao")
+
+# Move as triagens de um mês para a partição Parquet. O arquivo é imutável: a partição é regravada (com as linhas
+# antigas e as novas) num arquivo temporário e substituída atomicamente antes de excluir as linhas do banco principal.
+# Se o processo parar entre as duas etapas, a próxima execução regrava as mesmas linhas sem duplicá-las.
+def _arquivar_mes_parquet(conn, mes: str, limite: str, caminho: str, caminho_bd: str) -> int:
+    import pandas as pd
+    filtro = "validado = 1 AND data_hora < ? AND data_hora >= ? AND data_hora < ?"
+    parametros = (limite, mes, _mes_seguinte(mes))
+    triagens = consultar_textos(conn, filtro, parametros, caminho_bd=caminho_bd)
+    if not triagens:
+        return 0
+    novas = pd.DataFrame(triagens, columns=COLUNAS)
+
+    if os.path.exists(caminho):
+        novas = pd.concat([pd.read_parquet(caminho), novas], ignore_index=True).drop_duplicates("id", keep="last")
+    temporario = caminho + ".tmp"
+    novas.sort_values("data_hora").to_parquet(temporario, compression="zstd", index=False)
+    os.replace(temporario, caminho)
+
+    cursor = conn.cursor()
+    remover_da_busca_textual(cursor, triagens)
+    cursor.executemany("DELETE FROM validacao_triagem WHERE rowid = ?", [(t["rowid"],) for t in triagens])
+    conn.commit()
+    return len(triagens)
+
+def _mes_seguinte(mes: str) -> str:
+    ano, numero = (int(parte) for parte in mes.split("-"))
+    return f"{ano + numero // 12}-{numero % 12 + 1:02d}"
+
+# Função para arquivar as triagens validadas com mais de `dias` dias; retorna a quantidade movida por mês
+def arquivar(dias: int = DIAS_ARQUIVAMENTO, formato: str = "sqlite", caminho_bd: str = CAMINHO_BD,
+             caminho_arquivo: str = CAMINHO_ARQUIVO) -> Dict[str, int]:
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de arquivamento desconhecido: {formato} (use {' ou '.join(FORMATOS)})")
+
+    init_validation_db(caminho_bd)
+    os.makedirs(caminho_arquivo, exist_ok=True)
+    limite = (datetime.now() - timedelta(days=dias)).strftime("%Y-%m-%d %H:%M:%S")
+
+    conn = conectar(caminho_bd)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT substr(data_hora, 1, 7) AS mes FROM validacao_triagem WHERE validado = 1 AND data_hora < ? GROUP BY mes ORDER BY mes",
+            (limite,)
+        )
+        meses = [linha[0] for linha in cursor.fetchall()]
+
+        arquivadas = {}
+        for mes in meses:
+            caminho = caminho_particao(mes, formato, caminho_arquivo)
+            if formato == "sqlite":
+                arquivadas[mes] = _arquivar_mes_sqlite(conn, mes, limite, caminho, caminho_bd)
+            else:
+                arquivadas[mes] = _arquivar_mes_parquet(conn, mes, limite, caminho, caminho_bd)
+        return arquivadas
+    finally:
+        conn.close()
+
+# Função para compactar o banco principal: VACUUM devolve o espaço das linhas arquivadas, ANALYZE atualiza as
+# estatísticas do planejador. Os eventos antigos das triagens pendentes também são apagados.
+# O VACUUM pode renumerar os rowids (a tabela não tem INTEGER PRIMARY KEY), que são a chave do índice de busca textual:
+# os rowids anteriores ficam numa tabela temporária e só as triagens que mudaram de rowid são reindexadas; depois o
+# 'optimize' do FTS5 junta os segmentos do índice. Com reconstruir_busca=True, o índice inteiro é refeito.
+# Retorna a quantidade de triagens reindexadas.
+def compactar(caminho_bd: str = CAMINHO_BD, reconstruir_busca: bool = False, tamanho_lote: int = 1000) -> int:
+    init_validation_db(caminho_bd)
+    conn = conectar(caminho_bd)
+    try:
+        cursor = conn.cursor()
+        limpar_eventos(cursor)
+        # Triagens incluídas ou excluídas por fora dos aplicativos deixam o índice divergente: a reindexação parcial
+        # só acompanha os rowids, então nesse caso o índice é reconstruído por inteiro
+        reconstruir_busca = reconstruir_busca or not busca_textual_consistente(cursor)
+        cursor.execute("DROP TABLE IF EXISTS temp.rowids_anteriores")
+        cursor.execute("CREATE TEMP TABLE rowids_anteriores (id TEXT PRIMARY KEY, rowid_anterior INTEGER NOT NULL)")
+        cursor.execute("INSERT INTO temp.rowids_anteriores (id, rowid_anterior) SELECT id, rowid FROM main.validacao_triagem")
+        conn.commit()
+        conn.execute("VACUUM")
+
+        # Triagens incluídas entre a cópia dos rowids e o VACUUM não têm o rowid anterior: só a reconstrução resolve
+        cursor.execute(
+            "SELECT COUNT(*) FROM main.validacao_triagem v WHERE NOT EXISTS (SELECT 1 FROM temp.rowids_anteriores r WHERE r.id = v.id)"
+        )
+        if reconstruir_busca or cursor.fetchone()[0]:
+            reconstruir_busca_textual(cursor, caminho_bd, tamanho_lote)
+            cursor.execute("SELECT COUNT(*) FROM main.validacao_triagem")
+            reindexadas = cursor.fetchone()[0]
+        else:
+            reindexadas = _reindexar_rowids_alterados(cursor, caminho_bd, tamanho_lote)
+            cursor.execute("INSERT INTO validacao_triagem_fts(validacao_triagem_fts) VALUES ('optimize')")
+        cursor.execute("DROP TABLE temp.rowids_anteriores")
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.commit()
+        return reindexadas
+    finally:
+        conn.close()
+
+# Reindexa na busca textual as triagens cujo rowid mudou no VACUUM. Primeiro remove todas as entradas antigas e só
+# depois inclui as novas, porque o rowid novo de uma triagem pode ser o antigo de outra.
+def _reindexar_rowids_alterados(cursor, caminho_bd: str, tamanho_lote: int) -> int:
+    cursor.execute("DROP TABLE IF EXISTS temp.rowids_alterados")
+    cursor.execute('''
+        CREATE TEMP TABLE rowids_alterados AS
+        SELECT v.rowid AS rowid_novo, r.rowid_anterior
+        FROM temp.rowids_anteriores r JOIN main.validacao_triagem v ON v.id = r.id
+        WHERE v.rowid != r.rowid_anterior
+    ''')
+    for remover in (True, False):
+        ultimo_rowid = 0
+        while True:
+            cursor.execute(
+                "SELECT rowid_novo, rowid_anterior FROM temp.rowids_alterados WHERE rowid_novo > ? ORDER BY rowid_novo LIMIT ?",
+                (ultimo_rowid, tamanho_lote)
+            )
+            anteriores = dict(cursor.fetchall())
+            if not anteriores:
+                break
+            triagens = consultar_textos(cursor, f"rowid IN ({', '.join('?' for _ in anteriores)})", list(anteriores), caminho_bd=caminho_bd)
+            if remover:
+                remover_da_busca_textual(cursor, [dict(t, rowid=anteriores[t["rowid"]]) for t in triagens])
+            else:
+                indexar_busca_textual(cursor, triagens)
+            ultimo_rowid = max(anteriores)
+    cursor.execute("SELECT COUNT(*) FROM temp.rowids_alterados")
+    alteradas = cursor.fetchone()[0]
+    cursor.execute("DROP TABLE temp.rowids_alterados")
+    return alteradas
+
+# Função para ler triagens arquivadas (todas ou apenas os IDs pedidos) de todas as partições, como um DataFrame.
+# A coluna "particao" indica o mês de origem de cada linha.
+def obter_triagens_arquivadas(ids: Optional[List[str]] = None, caminho_arquivo: str = CAMINHO_ARQUIVO):
+    import pandas as pd
+    if ids is not None and not ids:
+        return pd.DataFrame(columns=COLUNAS + ["particao"])
+
+    quadros = []
+    for mes, formato, caminho in listar_particoes(caminho_arquivo):
+        if formato == "sqlite":
+            conn = sqlite3.connect(caminho, timeout=30)
+            try:
+                consulta = f"SELECT {', '.join(COLUNAS)} FROM validacao_triagem"
+                parametros = ()
+                if ids is not None:
+                    consulta += f" WHERE id IN ({', '.join('?' for _ in ids)})"
+                    parametros = tuple(ids)
+                quadro = pd.read_sql_query(consulta, conn, params=parametros)
+            finally:
+                conn.close()
+        else:
+            quadro = pd.read_parquet(caminho, columns=COLUNAS, filters=[("id", "in", list(ids))] if ids is not None else None)
+        if not quadro.empty:
+            quadros.append(quadro.assign(particao=mes))
+
+    if not quadros:
+        return pd.DataFrame(columns=COLUNAS + ["particao"])
+    return pd.concat(quadros, ignore_index=True).sort_values("data_hora", ascending=False, ignore_index=True)
+
+# Função para obter uma triagem arquivada pelo ID (None se não estiver em nenhuma partição)
+def obter_triagem_arquivada(triagem_id: str, caminho_arquivo: str = CAMINHO_ARQUIVO):
+    triagens = obter_triagens_arquivadas([triagem_id], caminho_arquivo)
+    if triagens.empty:
+        return None
+    return triagens.iloc[0]
+
+def exibir_status(caminho_bd: str, caminho_arquivo: str, dias: int):
+    limite = (datetime.now() - timedelta(days=dias)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = conectar(caminho_bd)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*), SUM(validado = 1 AND data_hora < ?) FROM validacao_triagem", (limite,))
+    total, elegiveis = cursor.fetchone()
+    conn.close()
+
+    print(f"Banco principal: {caminho_bd} ({os.path.getsize(caminho_bd) / 1e6:.1f} MB)")
+    print(f"  Triagens: {total}")
+    print(f"  Validadas com mais de {dias} dias (prontas para arquivar): {elegiveis or 0}")
+
+    particoes = listar_particoes(caminho_arquivo)
+    print(f"Partições em {caminho_arquivo}: {len(particoes)}")
+    for mes, formato, caminho in particoes:
+        print(f"  {mes}  {formato:<7}  {os.path.getsize(caminho) / 1e6:>8.2f} MB  {os.path.basename(caminho)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Arquivamento e compactação do banco de validação de triagens")
+    parser.add_argument("--unidade", help="Código da unidade (define --bd e --arquivo conforme unidades.json)")
+    parser.add_argument("--bd", help=f"Caminho do banco de validação (padrão: {CAMINHO_BD})")
+    parser.add_argument("--arquivo", help=f"Diretório das partições mensais (padrão: {CAMINHO_ARQUIVO})")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    status = subparsers.add_parser("status", help="Exibe o tamanho do banco principal e as partições existentes")
+    status.add_argument("--dias", type=int, default=DIAS_ARQUIVAMENTO)
+
+    for nome, ajuda in [("arquivar", "Move as triagens validadas antigas para as partições mensais"),
+                        ("executar", "Arquiva e em seguida compacta o banco principal")]:
+        sub = subparsers.add_parser(nome, help=ajuda)
+        sub.add_argument("--dias", type=int, default=DIAS_ARQUIVAMENTO, help="Idade mínima, em dias, das triagens arquivadas")
+        sub.add_argument("--formato", choices=FORMATOS, default="sqlite", help="Formato das partições")
+
+    compactar_parser = subparsers.add_parser("compactar", help="Executa VACUUM e ANALYZE no banco principal")
+    for sub in (compactar_parser, subparsers.choices["executar"]):
+        sub.add_argument("--reconstruir-busca", action="store_true",
+                         help="Reconstrói todo o índice de busca textual (ex.: depois de alterar a tabela por outra ferramenta)")
+
+    args = parser.parse_args()
+
+    if args.unidade:
+        from unidades import obter_unidade
+        unidade = obter_unidade(args.unidade)
+        args.bd = args.bd or unidade.caminho_bd
+        args.arquivo = args.arquivo or unidade.caminho_arquivo
+    args.bd = args.bd or CAMINHO_BD
+    args.arquivo = args.arquivo or CAMINHO_ARQUIVO
+
+    if args.comando == "status":
+        exibir_status(args.bd, args.arquivo, args.dias)
+        return
+
+    if args.comando in ("arquivar", "executar"):
+        inicio = time.perf_counter()
+        arquivadas = arquivar(args.dias, args.formato, args.bd, args.arquivo)
+        for mes, quantidade in arquivadas.items():
+            print(f"{mes}: {quantidade} triagens arquivadas em {caminho_particao(mes, args.formato, args.arquivo)}")
+        print(f"Total arquivado: {sum(arquivadas.values())} triagens em {time.perf_counter() - inicio:.1f}s")
+
+    if args.comando in ("compactar", "executar"):
+        tamanho_antes = os.path.getsize(args.bd)
+        inicio = time.perf_counter()
+        reindexadas = compactar(args.bd, args.reconstruir_busca)
+        print(f"Banco compactado: {tamanho_antes / 1e6:.1f} MB -> {os.path.getsize(args.bd) / 1e6:.1f} MB "
+              f"em {time.perf_counter() - inicio:.1f}s ({reindexadas} triagens reindexadas na busca textual)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,566 @@
+# Acesso compartilhado ao banco de dados SQLite de validação de triagens
+# (usado pelo aplicativo principal, pelo painel administrativo e pelas ferramentas de linha de comando)
+import html
+import os
+import re
+import sqlite3
+import unicodedata
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from compressao import Dicionario, comprimir, descomprimir, previa, treinar_dicionario
+
+# Caminho do banco de dados de validação
+CAMINHO_BD = './validacao_triagem.db'
+
+# Acima desta quantidade de resultados, a busca ordena pelas triagens mais recentes em vez de calcular
+# a relevância (bm25) de todos os resultados, o que manteria termos muito comuns acima de 100 ms em milhões de linhas
+LIMITE_ORDENACAO_RELEVANCIA = 20000
+
+# Marcadores dos termos encontrados nos trechos da busca, antes de escapar o HTML (caracteres que não aparecem no texto clínico)
+_INICIO_DESTAQUE = "\x02"
+_FIM_DESTAQUE = "\x03"
+
+# Dicionários de compressão já lidos de cada banco (são imutáveis depois de gravados)
+_dicionarios: Dict[str, Dict[int, Dicionario]] = {}
+
+# Função para ler os dicionários de compressão gravados no banco
+def _carregar_dicionarios(conn, caminho_bd) -> Dict[int, Dicionario]:
+    dicionarios = _dicionarios.setdefault(os.path.abspath(caminho_bd), {})
+    try:
+        linhas = conn.execute("SELECT id, tipo, dados FROM dicionarios_compressao").fetchall()
+    except sqlite3.OperationalError:
+        # Banco ainda sem a tabela de dicionários (criada por init_validation_db)
+        return dicionarios
+    for dicionario_id, tipo, dados in linhas:
+        dicionarios[dicionario_id] = Dicionario(dicionario_id, tipo, bytes(dados))
+    return dicionarios
+
+# Função para descomprimir um texto do banco; dicionários criados depois da conexão (por outro processo)
+# são lidos numa conexão separada
+def _descomprimir_do_banco(blob, caminho_bd):
+    dicionarios = _dicionarios.setdefault(os.path.abspath(caminho_bd), {})
+    try:
+        return descomprimir(blob, dicionarios)
+    except KeyError:
+        conn = sqlite3.connect(caminho_bd, timeout=30)
+        try:
+            return descomprimir(blob, _carregar_dicionarios(conn, caminho_bd))
+        finally:
+            conn.close()
+
+# Função para conectar ao banco de dados de validação (já com os dicionários de compressão lidos).
+# O esquema não depende de funções registradas na conexão: o banco pode ser lido e alterado por qualquer ferramenta
+# (sqlite3, DB Browser, backups); os textos comprimidos são descomprimidos em Python por consultar_textos().
+def conectar(caminho_bd=CAMINHO_BD):
+    conn = sqlite3.connect(caminho_bd, timeout=30)
+    _carregar_dicionarios(conn, caminho_bd)
+    return conn
+
+# Função para obter o dicionário de compressão mais recente do banco (None se nenhum foi treinado)
+def dicionario_atual(caminho_bd=CAMINHO_BD) -> Optional[Dicionario]:
+    dicionarios = _dicionarios.get(os.path.abspath(caminho_bd))
+    if not dicionarios:
+        return None
+    return dicionarios[max(dicionarios)]
+
+# Função para comprimir um texto com o dicionário atual do banco (para gravar em resposta_comprimida/feedback_comprimido)
+def comprimir_texto(texto, caminho_bd=CAMINHO_BD) -> Optional[bytes]:
+    return comprimir(texto, dicionario_atual(caminho_bd))
+
+# Função para inicializar o banco de dados de validação
+def init_validation_db(caminho_bd=CAMINHO_BD):
+    conn = conectar(caminho_bd)
+    cursor = conn.cursor()
+    # Cria a tabela de validação se não existir
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS validacao_triagem (
+        id TEXT PRIMARY KEY,
+        sintomas TEXT NOT NULL,
+        resposta TEXT NOT NULL,
+        data_hora TEXT NOT NULL,
+        validado INTEGER DEFAULT 0,
+        feedback TEXT,
+        validado_por TEXT,
+        data_validacao TEXT
+    )
+    ''')
+    # Índice para as listagens por status (pendentes/validadas) ordenadas por data e para o arquivamento
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_validacao_triagem_validado_data ON validacao_triagem(validado, data_hora)")
+    init_compressao(cursor)
+    init_busca_textual(cursor, caminho_bd)
+    init_versao_dados(cursor)
+    init_eventos(cursor)
+    conn.commit()
+    conn.close()
+
+# Função para preparar o armazenamento comprimido: resposta e feedback ficam em blobs (resposta_comprimida,
+# feedback_comprimido) com uma prévia sem compressão para as listagens. As colunas de texto originais continuam
+# existindo para as linhas gravadas antes da compressão (até rodar "python compressao.py recomprimir").
+# Os textos completos são lidos com consultar_textos().
+def init_compressao(cursor):
+    colunas = {linha[1] for linha in cursor.execute("PRAGMA table_info(validacao_triagem)").fetchall()}
+    for coluna, tipo in [("resposta_comprimida", "BLOB"), ("feedback_comprimido", "BLOB"), ("previa_resposta", "TEXT")]:
+        if coluna not in colunas:
+            cursor.execute(f"ALTER TABLE validacao_triagem ADD COLUMN {coluna} {tipo}")
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS dicionarios_compressao (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tipo TEXT NOT NULL,
+        dados BLOB NOT NULL,
+        amostras INTEGER NOT NULL,
+        data_criacao TEXT NOT NULL
+    )
+    ''')
+
+# Colunas lidas por consultar_textos()
+_COLUNAS_TEXTO = ("rowid, id, sintomas, resposta, resposta_comprimida, data_hora, validado, "
+                  "feedback, feedback_comprimido, validado_por, data_validacao")
+
+# Função para consultar triagens com os textos completos (resposta e feedback descomprimidos em Python).
+# `filtro` e `complemento` completam a consulta (ex.: "id = ?", "ORDER BY rowid LIMIT ?"), com os `parametros` de ambos.
+# Cada triagem vem como dict com rowid, id, sintomas, resposta, data_hora, validado, feedback, validado_por e data_validacao.
+def consultar_textos(conn, filtro="1", parametros=(), complemento="", caminho_bd=CAMINHO_BD) -> List[dict]:
+    linhas = conn.execute(f"SELECT {_COLUNAS_TEXTO} FROM validacao_triagem WHERE {filtro} {complemento}", parametros).fetchall()
+    return [
+        {
+            "rowid": rowid, "id": triagem_id, "sintomas": sintomas,
+            "resposta": _descomprimir_do_banco(resposta_comprimida, caminho_bd) if resposta_comprimida is not None else resposta,
+            "data_hora": data_hora, "validado": validado,
+            "feedback": _descomprimir_do_banco(feedback_comprimido, caminho_bd) if feedback_comprimido is not None else feedback,
+            "validado_por": validado_por, "data_validacao": data_validacao,
+        }
+        for (rowid, triagem_id, sintomas, resposta, resposta_comprimida, data_hora, validado,
+             feedback, feedback_comprimido, validado_por, data_validacao) in linhas
+    ]
+
+# Função para criar o índice de busca textual (FTS5) sobre sintomas, resposta e feedback.
+# O índice não guarda cópia do texto (content='') e não tem triggers: os aplicativos incluem e removem as triagens
+# do índice em Python, na mesma transação da alteração na tabela (indexar_busca_textual/remover_da_busca_textual).
+# Assim os textos comprimidos são indexados já descomprimidos sem que o esquema dependa de funções da conexão.
+# Limitação: alterações feitas na tabela por fora dos aplicativos (ex.: DB Browser) não chegam à busca sozinhas.
+# Inclusões e exclusões externas são detectadas por busca_textual_consistente() e corrigidas pelo compactar do
+# arquivamento; textos editados por fora só voltam a ser encontrados depois de reconstruir_busca_textual().
+# O tokenizador remove acentos, então "toracica" encontra "torácica"; prefix='2 3' acelera buscas por prefixo.
+def init_busca_textual(cursor, caminho_bd=CAMINHO_BD):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'validacao_triagem_fts'")
+    existia = cursor.fetchone() is not None
+
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS validacao_triagem_fts USING fts5(
+        sintomas, resposta, feedback,
+        content='',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    ''')
+
+    # Bancos criados antes do índice: indexa as triagens já existentes
+    if not existia:
+        # Ordenação padrão (coluna rank) por bm25 com pesos por coluna:
+        # sintomas pesam mais que a resposta do modelo; o feedback fica no meio
+        cursor.execute("INSERT INTO validacao_triagem_fts(validacao_triagem_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 3.0)')")
+        reconstruir_busca_textual(cursor, caminho_bd)
+
+# Função para incluir triagens no índice de busca textual (dicts como os de consultar_textos())
+def indexar_busca_textual(cursor, triagens: List[dict]):
+    cursor.executemany(
+        "INSERT INTO validacao_triagem_fts(rowid, sintomas, resposta, feedback) VALUES (?, ?, ?, ?)",
+        [(t["rowid"], t["sintomas"], t["resposta"], t["feedback"]) for t in triagens]
+    )
+
+# Função para remover triagens do índice de busca textual. Como o índice não guarda o texto, a remoção
+# recebe os mesmos textos que foram indexados (lidos com consultar_textos() antes de alterar ou excluir a linha).
+def remover_da_busca_textual(cursor, triagens: List[dict]):
+    cursor.executemany(
+        "INSERT INTO validacao_triagem_fts(validacao_triagem_fts, rowid, sintomas, resposta, feedback) VALUES ('delete', ?, ?, ?, ?)",
+        [(t["rowid"], t["sintomas"], t["resposta"], t["feedback"]) for t in triagens]
+    )
+
+# Função para excluir as triagens que atendem ao filtro, removendo-as também do índice de busca textual.
+# Não confirma a transação (quem chama faz o commit); retorna a quantidade excluída.
+def excluir_triagens(conn, filtro, parametros=(), caminho_bd=CAMINHO_BD) -> int:
+    triagens = consultar_textos(conn, filtro, parametros, caminho_bd=caminho_bd)
+    remover_da_busca_textual(conn, triagens)
+    conn.executemany("DELETE FROM validacao_triagem WHERE rowid = ?", [(t["rowid"],) for t in triagens])
+    return len(triagens)
+
+# Função para criar o contador de versão dos dados. Os triggers incrementam a versão de "validacao_triagem" a cada
+# inclusão, alteração ou exclusão de triagem, feita por qualquer aplicativo ou ferramenta; os caches de consultas
+# do painel usam a versão como chave e só consultam o banco de novo quando ela muda.
+# A versão de "banco_vetorial" é incrementada por incrementar_versao_dados() quando casos são adicionados à coleção.
+def init_versao_dados(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS versao_dados (
+        nome TEXT PRIMARY KEY,
+        versao INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO versao_dados (nome, versao) VALUES ('validacao_triagem', 0), ('banco_vetorial', 0)")
+    for sufixo, evento in [("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE")]:
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS versao_validacao_triagem_{sufixo} AFTER {evento} ON validacao_triagem BEGIN
+            UPDATE versao_dados SET versao = versao + 1 WHERE nome = 'validacao_triagem';
+        END
+        ''')
+
+# Função para criar o registro de eventos das triagens pendentes (só recebe inclusões, lido em ordem de seq).
+# Os triggers registram quando uma triagem pendente é criada, validada ou excluída, na mesma transação da alteração,
+# para que o painel atualize a lista de pendentes aplicando apenas os eventos novos em vez de reconsultar tudo.
+def init_eventos(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS eventos_triagem (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        tipo TEXT NOT NULL,
+        triagem_id TEXT NOT NULL,
+        data_hora TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS eventos_triagem_ai AFTER INSERT ON validacao_triagem WHEN new.validado = 0 BEGIN
+        INSERT INTO eventos_triagem (tipo, triagem_id) VALUES ('criada', new.id);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS eventos_triagem_au AFTER UPDATE OF validado ON validacao_triagem
+    WHEN old.validado = 0 AND new.validado = 1 BEGIN
+        INSERT INTO eventos_triagem (tipo, triagem_id) VALUES ('validada', new.id);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS eventos_triagem_ad AFTER DELETE ON validacao_triagem WHEN old.validado = 0 BEGIN
+        INSERT INTO eventos_triagem (tipo, triagem_id) VALUES ('excluida', old.id);
+    END
+    ''')
+
+# Função para ler os eventos posteriores a `desde_seq`, em ordem
+def ler_eventos(conn, desde_seq: int, limite: int = 1000) -> List[dict]:
+    linhas = conn.execute(
+        "SELECT seq, tipo, triagem_id, data_hora FROM eventos_triagem WHERE seq > ? ORDER BY seq LIMIT ?",
+        (desde_seq, limite)
+    ).fetchall()
+    return [{"seq": seq, "tipo": tipo, "triagem_id": triagem_id, "data_hora": data_hora} for seq, tipo, triagem_id, data_hora in linhas]
+
+# Função para obter o número do último evento registrado (0 se não houver)
+def ultimo_evento(conn) -> int:
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM eventos_triagem").fetchone()[0]
+
+# Função para apagar eventos antigos (os painéis só precisam dos eventos recentes; quem ficar para trás recarrega a lista)
+def limpar_eventos(cursor, dias: int = 7):
+    cursor.execute("DELETE FROM eventos_triagem WHERE data_hora < datetime('now', 'localtime', ?)", (f"-{dias} days",))
+
+# Função para ler a versão atual de um conjunto de dados ("validacao_triagem" ou "banco_vetorial")
+def versao_dados(nome="validacao_triagem", caminho_bd=CAMINHO_BD) -> int:
+    conn = conectar(caminho_bd)
+    try:
+        linha = conn.execute("SELECT versao FROM versao_dados WHERE nome = ?", (nome,)).fetchone()
+        return linha[0] if linha else 0
+    finally:
+        conn.close()
+
+# Função para registrar uma alteração feita fora do banco SQLite (ex.: casos adicionados ao banco vetorial)
+def incrementar_versao_dados(nome, caminho_bd=CAMINHO_BD):
+    conn = conectar(caminho_bd)
+    try:
+        conn.execute("INSERT INTO versao_dados (nome, versao) VALUES (?, 1) ON CONFLICT(nome) DO UPDATE SET versao = versao + 1", (nome,))
+        conn.commit()
+    finally:
+        conn.close()
+
+# Função para reindexar todas as triagens, em lotes: necessário se a tabela for alterada por fora dos aplicativos
+# (ex.: DELETE pelo DB Browser) e depois de um VACUUM, que pode renumerar os rowids
+def reconstruir_busca_textual(cursor, caminho_bd=CAMINHO_BD, tamanho_lote: int = 1000):
+    cursor.execute("INSERT INTO validacao_triagem_fts(validacao_triagem_fts) VALUES ('delete-all')")
+    ultimo_rowid = 0
+    while True:
+        triagens = consultar_textos(cursor, "rowid > ?", (ultimo_rowid, tamanho_lote), "ORDER BY rowid LIMIT ?", caminho_bd)
+        if not triagens:
+            break
+        indexar_busca_textual(cursor, triagens)
+        ultimo_rowid = triagens[-1]["rowid"]
+
+# Função para verificar se o índice de busca textual tem exatamente as triagens da tabela, comparando os rowids.
+# Não detecta textos editados por fora dos aplicativos, porque o índice não guarda os textos para comparar.
+def busca_textual_consistente(cursor) -> bool:
+    cursor.execute('''
+        SELECT NOT EXISTS (SELECT rowid FROM validacao_triagem EXCEPT SELECT rowid FROM validacao_triagem_fts)
+           AND NOT EXISTS (SELECT rowid FROM validacao_triagem_fts EXCEPT SELECT rowid FROM validacao_triagem)
+    ''')
+    return bool(cursor.fetchone()[0])
+
+# Função para salvar a resposta no banco de dados de validação
+def salvar_para_validacao(sintomas, resposta, caminho_bd=CAMINHO_BD):
+    conn = conectar(caminho_bd)
+    cursor = conn.cursor()
+
+    # Gera um ID único para a triagem
+    triagem_id = str(uuid.uuid4())
+
+    # Obtém a data e hora atual
+    data_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # Insere os dados na tabela, com a resposta comprimida e apenas o início dela em texto (para as listagens)
+    resposta = str(resposta)
+    cursor.execute(
+        "INSERT INTO validacao_triagem (id, sintomas, resposta, resposta_comprimida, previa_resposta, data_hora) VALUES (?, ?, '', ?, ?, ?)",
+        (triagem_id, sintomas, comprimir_texto(resposta, caminho_bd), previa(resposta), data_hora)
+    )
+    indexar_busca_textual(cursor, [{"rowid": cursor.lastrowid, "sintomas": sintomas, "resposta": resposta, "feedback": None}])
+
+    conn.commit()
+    conn.close()
+
+    return triagem_id
+
+# Colunas das listagens: só a prévia da resposta; o texto completo é descomprimido apenas nos detalhes da triagem
+CONSULTA_LISTAGEM = "SELECT id, sintomas, COALESCE(previa_resposta, substr(resposta, 1, 50)) AS resposta, data_hora, validado, validado_por, data_validacao FROM validacao_triagem"
+
+# Função para listar as triagens ("todas", "pendentes" ou "validadas"), das mais recentes para as mais antigas, como DataFrame
+def listar_triagens(filtro="todas", caminho_bd=CAMINHO_BD):
+    import pandas as pd
+    query = CONSULTA_LISTAGEM
+    if filtro == "pendentes":
+        query += " WHERE validado = 0"
+    elif filtro == "validadas":
+        query += " WHERE validado = 1"
+    query += " ORDER BY data_hora DESC"
+
+    conn = conectar(caminho_bd)
+    try:
+        return pd.read_sql_query(query, conn)
+    finally:
+        conn.close()
+
+# Função para ler uma triagem com os textos completos (None se ela não está no banco, por exemplo se foi arquivada)
+def ler_triagem(triagem_id, caminho_bd=CAMINHO_BD) -> Optional[dict]:
+    conn = conectar(caminho_bd)
+    try:
+        triagens = consultar_textos(conn, "id = ?", (triagem_id,), caminho_bd=caminho_bd)
+    finally:
+        conn.close()
+    if not triagens:
+        return None
+    triagem = triagens[0]
+    del triagem["rowid"]
+    return triagem
+
+# Função para registrar a validação de uma triagem (o feedback é gravado comprimido)
+def registrar_validacao(triagem_id, validado_por, feedback, caminho_bd=CAMINHO_BD):
+    data_validacao = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn = conectar(caminho_bd)
+    try:
+        # O índice de busca é atualizado na mesma transação (o feedback anterior sai, o novo entra)
+        conn.execute("BEGIN IMMEDIATE")
+        anteriores = consultar_textos(conn, "id = ?", (triagem_id,), caminho_bd=caminho_bd)
+        conn.execute(
+            "UPDATE validacao_triagem SET validado = 1, feedback = NULL, feedback_comprimido = ?, validado_por = ?, data_validacao = ? WHERE id = ?",
+            (comprimir_texto(feedback, caminho_bd), validado_por, data_validacao, triagem_id)
+        )
+        remover_da_busca_textual(conn, anteriores)
+        indexar_busca_textual(conn, [dict(triagem, feedback=feedback) for triagem in anteriores])
+        conn.commit()
+    finally:
+        conn.close()
+
+# Função para contar as triagens por situação (Dashboard do painel administrativo)
+def estatisticas_validacao(caminho_bd=CAMINHO_BD) -> dict:
+    conn = conectar(caminho_bd)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(validado = 1), 0), COALESCE(SUM(validado = 0), 0) FROM validacao_triagem")
+        total, validadas, pendentes = cursor.fetchone()
+        cursor.execute("SELECT COUNT(DISTINCT validado_por) FROM validacao_triagem WHERE validado_por IS NOT NULL")
+        validadores = cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+    return {
+        "total": total,
+        "validadas": validadas,
+        "pendentes": pendentes,
+        "validadores": validadores,
+        "taxa_validacao": (validadas / total * 100) if total > 0 else 0
+    }
+
+# Função para converter o texto digitado pelo usuário numa consulta FTS5 segura:
+# cada palavra vira um termo entre aspas, e a última também é buscada por prefixo ("dor tor" encontra "dor torácica")
+def montar_consulta_fts(texto: str) -> str:
+    termos = [f'"{termo}"' for termo in re.findall(r"\w+", texto or "")]
+    if termos:
+        termos[-1] += "*"
+    return " ".join(termos)
+
+# Função para escapar o HTML do trecho e trocar os marcadores dos termos encontrados por <mark>
+def _destacar(trecho: str) -> str:
+    trecho = html.escape(trecho or "")
+    return trecho.replace(_INICIO_DESTAQUE, "<mark>").replace(_FIM_DESTAQUE, "</mark>")
+
+# Função para normalizar uma palavra como o tokenizador do índice (minúsculas e sem acentos)
+def _normalizar(palavra: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", palavra.lower()) if not unicodedata.combining(c))
+
+# Função para montar o trecho de uma triagem com os termos da busca marcados (o índice não guarda o texto, então
+# o snippet() do FTS5 não está disponível): escolhe a janela de até `palavras` palavras com mais termos, na coluna
+# com mais ocorrências. Retorna None se nenhum termo aparece (linha alterada por fora depois de indexada).
+def _montar_trecho(textos: List[Optional[str]], termos: List[str], palavras: int = 16) -> Optional[str]:
+    exatos, prefixo = set(termos[:-1]), termos[-1]
+    melhor = None  # (ocorrências, texto, palavras encontradas, início da janela, posições dos termos)
+    for texto in textos:
+        encontradas = list(re.finditer(r"\w+", texto or ""))
+        posicoes = []
+        for i, palavra in enumerate(encontradas):
+            normalizada = _normalizar(palavra.group())
+            if normalizada in exatos or normalizada.startswith(prefixo):
+                posicoes.append(i)
+        for posicao in posicoes:
+            inicio = max(0, min(posicao - 2, len(encontradas) - palavras))
+            ocorrencias = sum(1 for p in posicoes if inicio <= p < inicio + palavras)
+            if melhor is None or ocorrencias > melhor[0]:
+                melhor = (ocorrencias, texto, encontradas, inicio, set(posicoes))
+    if melhor is None:
+        return None
+
+    _, texto, encontradas, inicio, posicoes = melhor
+    fim = min(inicio + palavras, len(encontradas))
+    partes = ["…" if inicio > 0 else ""]
+    cursor_texto = encontradas[inicio].start()
+    for i in range(inicio, fim):
+        palavra = encontradas[i]
+        partes.append(texto[cursor_texto:palavra.start()])
+        partes.append(f"{_INICIO_DESTAQUE}{palavra.group()}{_FIM_DESTAQUE}" if i in posicoes else palavra.group())
+        cursor_texto = palavra.end()
+    partes.append("…" if fim < len(encontradas) else "")
+    return "".join(partes)
+
+# Função para buscar triagens por texto, ordenadas por relevância (bm25), com paginação e trechos destacados.
+# Retorna o total de resultados e a lista da página pedida.
+def buscar_triagens(texto: str, pagina: int = 1, por_pagina: int = 20, caminho_bd=CAMINHO_BD) -> Tuple[int, List[dict]]:
+    consulta = montar_consulta_fts(texto)
+    if not consulta:
+        return 0, []
+
+    conn = conectar(caminho_bd)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT COUNT(*) FROM validacao_triagem_fts WHERE validacao_triagem_fts MATCH ?", (consulta,))
+    total = cursor.fetchone()[0]
+
+    # Primeiro escolhe apenas os rowids da página; os textos são descomprimidos e destacados só para eles
+    ordem = "rank" if total <= LIMITE_ORDENACAO_RELEVANCIA else "rowid DESC"
+    cursor.execute(
+        f"SELECT rowid FROM validacao_triagem_fts WHERE validacao_triagem_fts MATCH ? ORDER BY {ordem} LIMIT ? OFFSET ?",
+        (consulta, por_pagina, (max(pagina, 1) - 1) * por_pagina)
+    )
+    rowids = [linha[0] for linha in cursor.fetchall()]
+    if not rowids:
+        conn.close()
+        return total, []
+
+    triagens = consultar_textos(conn, f"rowid IN ({', '.join('?' for _ in rowids)})", rowids, caminho_bd=caminho_bd)
+    conn.close()
+
+    termos = [_normalizar(termo) for termo in re.findall(r"\w+", texto)]
+    por_rowid = {}
+    for triagem in triagens:
+        trecho = _montar_trecho([triagem["sintomas"], triagem["resposta"], triagem["feedback"]], termos)
+        if trecho is not None:
+            por_rowid[triagem["rowid"]] = {
+                "id": triagem["id"], "data_hora": triagem["data_hora"], "validado": triagem["validado"],
+                "validado_por": triagem["validado_por"], "trecho": _destacar(trecho),
+            }
+    return total, [por_rowid[rowid] for rowid in rowids if rowid in por_rowid]
+
+# Função para treinar um novo dicionário de compressão com as respostas e feedbacks mais recentes
+def treinar_dicionario_bd(caminho_bd=CAMINHO_BD, amostras: int = 5000) -> Dicionario:
+    init_validation_db(caminho_bd)
+    conn = conectar(caminho_bd)
+    cursor = conn.cursor()
+    recentes = consultar_textos(conn, "1", (amostras,), "ORDER BY data_hora DESC LIMIT ?", caminho_bd)
+    textos = [texto for triagem in recentes for texto in (triagem["resposta"], triagem["feedback"]) if texto]
+    if not textos:
+        conn.close()
+        raise ValueError("Não há triagens no banco para treinar o dicionário de compressão")
+
+    tipo, dados = treinar_dicionario(textos)
+    cursor.execute(
+        "INSERT INTO dicionarios_compressao (tipo, dados, amostras, data_criacao) VALUES (?, ?, ?, ?)",
+        (tipo, dados, len(textos), datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    )
+    conn.commit()
+    dicionario = Dicionario(cursor.lastrowid, tipo, dados)
+    _carregar_dicionarios(conn, caminho_bd)
+    conn.close()
+    return dicionario
+
+# Função para comprimir as linhas gravadas antes da compressão (e, com todas=True, as que usam dicionários
+# antigos), em lotes. Retorna a quantidade de linhas reescritas.
+def recomprimir(caminho_bd=CAMINHO_BD, todas: bool = False, tamanho_lote: int = 1000) -> int:
+    init_validation_db(caminho_bd)
+    conn = conectar(caminho_bd)
+    cursor = conn.cursor()
+    dicionario = dicionario_atual(caminho_bd)
+    # Bytes 2 a 5 do blob: ID do dicionário usado
+    id_atual = (dicionario.id if dicionario else 0).to_bytes(4, "big")
+
+    filtro = "resposta_comprimida IS NULL"
+    if todas:
+        filtro += " OR substr(resposta_comprimida, 2, 4) != ? OR substr(feedback_comprimido, 2, 4) != ?"
+    parametros_filtro = (id_atual, id_atual) if todas else ()
+
+    # Os textos não mudam, só a forma gravada: o índice de busca textual não precisa ser atualizado
+    total = 0
+    ultimo_rowid = 0
+    while True:
+        linhas = consultar_textos(
+            cursor, f"rowid > ? AND ({filtro})", (ultimo_rowid, *parametros_filtro, tamanho_lote), "ORDER BY rowid LIMIT ?", caminho_bd
+        )
+        if not linhas:
+            break
+        cursor.executemany(
+            "UPDATE validacao_triagem SET resposta = '', resposta_comprimida = ?, previa_resposta = ?, "
+            "feedback = NULL, feedback_comprimido = ? WHERE rowid = ?",
+            [(comprimir(t["resposta"], dicionario), previa(t["resposta"]), comprimir(t["feedback"], dicionario), t["rowid"])
+             for t in linhas]
+        )
+        conn.commit()
+        total += len(linhas)
+        ultimo_rowid = linhas[-1]["rowid"]
+
+    conn.close()
+    return total
+
+# Função para medir o ganho da compressão: bytes dos textos originais x bytes gravados
+def estatisticas_compressao(caminho_bd=CAMINHO_BD) -> dict:
+    init_validation_db(caminho_bd)
+    conn = conectar(caminho_bd)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT COUNT(*),
+               SUM(resposta_comprimida IS NULL),
+               SUM(COALESCE(length(resposta_comprimida), length(CAST(resposta AS BLOB)))
+                   + COALESCE(length(feedback_comprimido), length(CAST(feedback AS BLOB)), 0)
+                   + COALESCE(length(CAST(previa_resposta AS BLOB)), 0))
+        FROM validacao_triagem
+    ''')
+    triagens, nao_comprimidas, bytes_comprimidos = cursor.fetchone()
+    # Tamanho original: os textos são descomprimidos em lotes
+    bytes_originais = 0
+    ultimo_rowid = 0
+    while True:
+        lote = consultar_textos(cursor, "rowid > ?", (ultimo_rowid, 1000), "ORDER BY rowid LIMIT ?", caminho_bd)
+        if not lote:
+            break
+        bytes_originais += sum(len((t["resposta"] or "").encode("utf-8")) + len((t["feedback"] or "").encode("utf-8")) for t in lote)
+        ultimo_rowid = lote[-1]["rowid"]
+    conn.close()
+
+    dicionario = dicionario_atual(caminho_bd)
+    return {
+        "triagens": triagens,
+        "nao_comprimidas": nao_comprimidas or 0,
+        "bytes_originais": bytes_originais or 0,
+        "bytes_comprimidos": bytes_comprimidos or 0,
+        "dicionario": f"{dicionario.id} ({dicionario.tipo}, {len(dicionario.dados)} bytes)" if dicionario else None,
+        "tamanho_arquivo": os.path.getsize(caminho_bd),
+    }
@@ -0,0 +1,711 @@
+# Configuração e manutenção do banco vetorial (ChromaDB) da coleção de triagem
+#
+# Uso pela linha de comando (a partir da pasta AssistenteIA):
+#   python banco_vetorial.py status
+#   python banco_vetorial.py reconstruir [--m 32] [--construction-ef 200] [--search-ef 64]
+#   python banco_vetorial.py varredura [--k 3] [--efs 10,20,40,80,160,320]
+#   python banco_vetorial.py exportar-numpy
+#   python banco_vetorial.py benchmark [--k 3] [--repeticoes 5]
+#   python banco_vetorial.py indexar-entradas [--lote 1000]
+import argparse
+import json
+import os
+import random
+import re
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Caminho do banco vetorial persistente e nome da coleção (como uma "tabela")
+CAMINHO_CHROMA = os.environ.get("TRIAGEM_CHROMA_PATH", "./chroma_db")
+NOME_COLECAO = os.environ.get("TRIAGEM_COLECAO", "triagem_hci")
+
+# Coleção com os vetores dos sintomas das próprias triagens enviadas para validação
+# (usada para mostrar ao especialista triagens semelhantes já validadas)
+NOME_COLECAO_ENTRADAS = f"{NOME_COLECAO}_entradas"
+
+# Arquivo que aponta, para cada coleção lógica (ex.: triagem_hci), a coleção física ativa e o modelo de embedding
+# com que ela foi gerada. A troca de modelo (ver reindexacao.py) grava a nova coleção ao lado da antiga e só então
+# regrava este arquivo com os.replace, então os aplicativos passam da coleção antiga para a nova de uma vez.
+# Coleções sem entrada no arquivo têm o próprio nome lógico e usam o modelo padrão (embeddings.MODELO_EMBEDDING).
+CAMINHO_COLECOES_ATIVAS = os.environ.get("TRIAGEM_COLECOES_ATIVAS_PATH", "./colecoes_ativas.json")
+
+# Backend do banco vetorial: "chroma" (ChromaDB persistente com HNSW) ou "numpy" (busca exata em memória, ver indice_numpy.py)
+BACKEND_VETORIAL = os.environ.get("TRIAGEM_BACKEND_VETORIAL", "chroma")
+
+# Arquivos com os textos de origem dos casos
+ARQUIVO_CASOS = "casos.txt"
+ARQUIVO_TESTE = "teste.txt"
+
+# Parâmetros do índice HNSW usados ao criar (ou reconstruir) a coleção.
+# - hnsw:space: métrica de distância (cosine, pois os embeddings são comparados por similaridade semântica)
+# - hnsw:M: número de vizinhos por nó do grafo (maior = mais recall, mais memória)
+# - hnsw:construction_ef: tamanho da lista de candidatos na construção (maior = índice melhor, construção mais lenta)
+# - hnsw:search_ef: tamanho da lista de candidatos na busca (maior = mais recall, busca mais lenta)
+CONFIG_HNSW = {
+    "hnsw:space": os.environ.get("TRIAGEM_HNSW_SPACE", "cosine"),
+    "hnsw:M": int(os.environ.get("TRIAGEM_HNSW_M", "32")),
+    "hnsw:construction_ef": int(os.environ.get("TRIAGEM_HNSW_CONSTRUCTION_EF", "200")),
+    "hnsw:search_ef": int(os.environ.get("TRIAGEM_HNSW_SEARCH_EF", "64")),
+}
+
+# Tamanho dos lotes ao ler e gravar vetores na coleção
+TAMANHO_LOTE = 1000
+
+# Quantidade máxima de vetores usados na varredura de recall x latência (coleções maiores são medidas numa amostra)
+TAMANHO_AMOSTRA_VARREDURA = int(os.environ.get("TRIAGEM_AMOSTRA_VARREDURA", "20000"))
+
+# Texto acrescentado ao feedback da triagem quando o caso validado é gravado no banco vetorial (seguido do ID do caso)
+MARCADOR_CASO_VALIDADO = "\n\nCaso adicionado ao banco de conhecimento com ID: "
+
+# Lote de casos: (ids, textos, metadados)
+Lote = Tuple[List[str], List[str], List[dict]]
+
+# Função para criar o cliente do banco vetorial com persistência
+def conectar_chroma(caminho=CAMINHO_CHROMA):
+    import chromadb
+    return chromadb.PersistentClient(path=caminho)
+
+# Função para listar os nomes das coleções existentes (SELECT * FROM collections)
+def nomes_colecoes(chroma_client) -> List[str]:
+    # Versões recentes do ChromaDB retornam apenas os nomes; versões antigas retornam objetos de coleção
+    return [col.name if hasattr(col, "name") else col for col in chroma_client.list_collections()]
+
+# Conteúdo do arquivo de coleções ativas, relido apenas quando a data de modificação muda
+_colecoes_ativas = {}
+
+# Função para ler o arquivo de coleções ativas ({nome lógico: {"colecao": ..., "modelo": ..., ...}})
+def ler_colecoes_ativas(caminho=CAMINHO_COLECOES_ATIVAS) -> Dict[str, dict]:
+    try:
+        modificacao = os.stat(caminho).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if caminho not in _colecoes_ativas or _colecoes_ativas[caminho][0] != modificacao:
+        with open(caminho, "r", encoding="utf-8") as arquivo:
+            _colecoes_ativas[caminho] = (modificacao, json.load(arquivo))
+    return _colecoes_ativas[caminho][1]
+
+# Função para alterar as entradas do arquivo de coleções ativas. Todas as alterações são gravadas de uma vez:
+# o arquivo novo é escrito ao lado e substitui o antigo com os.replace (atômico), então quem lê nunca vê meio arquivo.
+def gravar_colecoes_ativas(alteracoes: Dict[str, dict], caminho=CAMINHO_COLECOES_ATIVAS):
+    dados = dict(ler_colecoes_ativas(caminho))
+    dados.update(alteracoes)
+    temporario = f"{caminho}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(dados, arquivo, ensure_ascii=False, indent=2)
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+    os.replace(temporario, caminho)
+
+# Função para obter o nome da coleção física ativa de uma coleção lógica
+def nome_ativo(nome: str) -> str:
+    return ler_colecoes_ativas().get(nome, {}).get("colecao", nome)
+
+# Função para obter o modelo de embedding da coleção ativa (consultas a ela devem usar o mesmo modelo)
+def modelo_da_colecao(nome: str) -> str:
+    from embeddings import MODELO_EMBEDDING
+    return ler_colecoes_ativas().get(nome, {}).get("modelo", MODELO_EMBEDDING)
+
+# Função para obter o modelo de uma coleção pelo nome físico (ex.: triagem_hci__r20250101120000), procurando em
+# colecoes_ativas.json o nome lógico do qual ela é a coleção ativa ou a anterior
+def modelo_da_colecao_fisica(nome_fisico: str) -> str:
+    for nome, entrada in ler_colecoes_ativas().items():
+        if entrada.get("colecao") == nome_fisico:
+            return modelo_da_colecao(nome)
+        anterior = entrada.get("anterior") or {}
+        if anterior.get("colecao") == nome_fisico and anterior.get("modelo"):
+            return anterior["modelo"]
+    return modelo_da_colecao(nome_fisico)
+
+# Função para montar o nome da coleção física de um modelo (ex.: triagem_hci__paraphrase_multilingual_minilm_l12_v2).
+# O ChromaDB aceita no máximo 63 caracteres, então nomes de modelo muito longos são truncados.
+def nome_versionado(nome: str, modelo: str) -> str:
+    sufixo = re.sub(r"[^a-z0-9]+", "_", modelo.split("/")[-1].lower()).strip("_")
+    return f"{nome}__{sufixo}"[:63].rstrip("_")
+
+# Índices NumPy já abertos neste processo (reaproveitados entre as execuções do script do Streamlit)
+_indices_numpy = {}
+
+# Função para abrir um índice NumPy, reaproveitando a instância já carregada
+def obter_indice_numpy(nome=NOME_COLECAO):
+    from indice_numpy import IndiceNumpy
+    if nome not in _indices_numpy:
+        _indices_numpy[nome] = IndiceNumpy(nome)
+    return _indices_numpy[nome]
+
+# Função para verificar se a coleção existe no backend configurado
+def existe_colecao(nome=NOME_COLECAO, chroma_client=None, backend=None):
+    nome = nome_ativo(nome)
+    if (backend or BACKEND_VETORIAL) == "numpy":
+        from indice_numpy import CAMINHO_INDICE_NUMPY
+        return os.path.exists(os.path.join(CAMINHO_INDICE_NUMPY, nome, "registros.json"))
+    if chroma_client is None:
+        chroma_client = conectar_chroma()
+    return nome in nomes_colecoes(chroma_client)
+
+# Função para obter a coleção de triagem no backend configurado (a coleção física ativa do nome lógico informado).
+# No ChromaDB, a coleção é criada com os parâmetros HNSW configurados se não existir;
+# coleções já existentes mantêm os parâmetros com que foram criadas (use "reconstruir" para alterá-los).
+def obter_colecao(chroma_client=None, nome=NOME_COLECAO, config_hnsw=None, backend=None):
+    nome = nome_ativo(nome)
+    if (backend or BACKEND_VETORIAL) == "numpy":
+        return obter_indice_numpy(nome)
+
+    if chroma_client is None:
+        chroma_client = conectar_chroma()
+
+    # Verifica se a coleção já existe. Se sim, obtém ela. Caso contrário, cria uma nova.
+    if nome in nomes_colecoes(chroma_client):
+        return chroma_client.get_collection(nome)
+    return chroma_client.create_collection(name=nome, metadata=dict(config_hnsw or CONFIG_HNSW))
+
+# Função para indexar o vetor dos sintomas de uma triagem (calculado uma única vez, quando ela é enviada para validação)
+def indexar_entrada_triagem(triagem_id: str, embedding: List[float], data_hora: Optional[str] = None, validado: bool = False,
+                            chroma_client=None, nome=NOME_COLECAO_ENTRADAS):
+    data_hora = data_hora or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    colecao = obter_colecao(chroma_client, nome=nome)
+    colecao.add(embeddings=[embedding], ids=[triagem_id], metadatas=[{"data_hora": data_hora, "validado": validado}])
+
+# Função para obter o vetor já indexado de uma triagem (None se ela foi enviada antes da indexação existir)
+def obter_embedding_entrada(triagem_id: str, chroma_client=None, nome=NOME_COLECAO_ENTRADAS) -> Optional[List[float]]:
+    if not existe_colecao(nome, chroma_client):
+        return None
+    registros = obter_colecao(chroma_client, nome=nome).get(ids=[triagem_id], include=["embeddings"])
+    embeddings = registros.get("embeddings")
+    if embeddings is None or len(embeddings) == 0:
+        return None
+    return list(embeddings[0])
+
+# Função para marcar o vetor de uma triagem como validado (passa a aparecer nas buscas por triagens semelhantes)
+def marcar_entrada_validada(triagem_id: str, chroma_client=None, nome=NOME_COLECAO_ENTRADAS):
+    colecao = obter_colecao(chroma_client, nome=nome)
+    if colecao.get(ids=[triagem_id])["ids"]:
+        colecao.update(ids=[triagem_id], metadatas=[{"validado": True}])
+
+# Função para remover o vetor de uma triagem excluída
+def remover_entrada_triagem(triagem_id: str, chroma_client=None, nome=NOME_COLECAO_ENTRADAS):
+    if existe_colecao(nome, chroma_client):
+        obter_colecao(chroma_client, nome=nome).delete(ids=[triagem_id])
+
+# Função para buscar as triagens validadas mais semelhantes a um vetor; retorna pares (id da triagem, distância)
+def buscar_entradas_semelhantes(embedding: List[float], k: int = 5, excluir_id: Optional[str] = None,
+                                chroma_client=None, nome=NOME_COLECAO_ENTRADAS) -> List[Tuple[str, float]]:
+    if not existe_colecao(nome, chroma_client):
+        return []
+    colecao = obter_colecao(chroma_client, nome=nome)
+    # Pede um resultado a mais, pois a própria triagem pode estar entre os vetores validados
+    resultados = colecao.query(query_embeddings=[embedding], n_results=k + 1, where={"validado": True}, include=["distances"])
+    pares = [(triagem_id, distancia) for triagem_id, distancia in zip(resultados["ids"][0], resultados["distances"][0]) if triagem_id != excluir_id]
+    return pares[:k]
+
+# Função para ler os casos de triagem a partir do arquivo "casos.txt"
+def load_triagem_cases(filepath: str = ARQUIVO_CASOS) -> List[str]:
+    # Abre o arquivo e retorna apenas linhas não vazias
+    with open(filepath, "r", encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+# Função para percorrer todos os registros da coleção em lotes, sem carregar a coleção inteira na memória.
+# Cada lote é um dict com "ids" e as chaves pedidas em `include` (ex.: "metadatas", "embeddings").
+def iterar_colecao(collection, include=("metadatas",), tamanho: int = TAMANHO_LOTE) -> Iterator[Dict[str, list]]:
+    total = collection.count()
+    for offset in range(0, total, tamanho):
+        lote = collection.get(limit=tamanho, offset=offset, include=list(include))
+        resultado = {"ids": lote["ids"]}
+        for chave in include:
+            valores = lote.get(chave)
+            resultado[chave] = valores if valores is not None else []
+        yield resultado
+
+# Função para percorrer os vetores da coleção em lotes de (ids, embeddings)
+def lotes_embeddings(collection, tamanho: int = TAMANHO_LOTE) -> Iterator[Tuple[List[str], list]]:
+    for lote in iterar_colecao(collection, include=("embeddings",), tamanho=tamanho):
+        yield lote["ids"], lote["embeddings"]
+
+# Função para extrair a classificação de risco (cor) da resposta do modelo
+def classificacao_da_resposta(resposta: str) -> str:
+    for cor in ("vermelha", "laranja", "amarela", "verde", "azul"):
+        if cor in resposta.lower():
+            return cor.capitalize()
+    return ""
+
+# Função para montar o texto de um caso validado, como ele é gravado (e reconstruído) na coleção de casos
+def formatar_caso_validado(sintomas: str, resposta: str, feedback: Optional[str]) -> str:
+    caso_formatado = f"{sintomas} Classificação: {classificacao_da_resposta(resposta)}."
+    if feedback:
+        caso_formatado += f" Feedback especialista: {feedback}"
+    return caso_formatado
+
+# Função para ler, em lotes, os casos validados a partir do banco de validação (fonte da verdade): as triagens
+# validadas cujo feedback registra o ID do caso gravado (MARCADOR_CASO_VALIDADO), no banco principal e nas partições
+# do arquivamento. O texto do caso é montado de novo a partir dos sintomas, da resposta e do feedback original.
+def casos_validados(caminho_bd=None, caminho_arquivo=None, tamanho: int = TAMANHO_LOTE) -> Iterator[Lote]:
+    import sqlite3
+    from arquivamento import CAMINHO_ARQUIVO, listar_particoes
+    from banco_validacao import CAMINHO_BD, conectar, consultar_textos
+
+    def converter(triagens) -> Lote:
+        ids, textos, metadados = [], [], []
+        for sintomas, resposta, feedback in triagens:
+            if not feedback or MARCADOR_CASO_VALIDADO not in feedback:
+                continue
+            feedback_original, caso_id = feedback.rsplit(MARCADOR_CASO_VALIDADO, 1)
+            texto = formatar_caso_validado(sintomas, resposta or "", feedback_original)
+            ids.append(caso_id.strip())
+            textos.append(texto)
+            metadados.append({"content": texto, "validated": True})
+        return ids, textos, metadados
+
+    caminho_bd = caminho_bd or CAMINHO_BD
+    conn = conectar(caminho_bd)
+    try:
+        ultimo_rowid = 0
+        while True:
+            triagens = consultar_textos(conn, "validado = 1 AND rowid > ?", (ultimo_rowid, tamanho), "ORDER BY rowid LIMIT ?", caminho_bd)
+            if not triagens:
+                break
+            ultimo_rowid = triagens[-1]["rowid"]
+            yield converter((t["sintomas"], t["resposta"], t["feedback"]) for t in triagens)
+    finally:
+        conn.close()
+
+    for _, formato, caminho in listar_particoes(caminho_arquivo or CAMINHO_ARQUIVO):
+        if formato == "sqlite":
+            conn = sqlite3.connect(caminho, timeout=30)
+            try:
+                ultimo_rowid = 0
+                while True:
+                    linhas = conn.execute(
+                        "SELECT rowid, sintomas, resposta, feedback FROM validacao_triagem WHERE validado = 1 AND rowid > ? "
+                        "ORDER BY rowid LIMIT ?", (ultimo_rowid, tamanho)
+                    ).fetchall()
+                    if not linhas:
+                        break
+                    ultimo_rowid = linhas[-1][0]
+                    yield converter(linha[1:] for linha in linhas)
+            finally:
+                conn.close()
+        else:
+            import pyarrow.parquet as pq
+            for lote in pq.ParquetFile(caminho).iter_batches(batch_size=tamanho, columns=["sintomas", "resposta", "feedback", "validado"]):
+                colunas = [lote.column(i).to_pylist() for i in range(4)]
+                yield converter((sintomas, resposta, feedback) for sintomas, resposta, feedback, validado in zip(*colunas) if validado)
+
+# Função para gerar, em lotes, os textos de origem da coleção de casos: os casos originais de "casos.txt"
+# e os casos validados registrados no banco de validação (ver casos_validados)
+def lotes_de_origem(arquivo_casos: str = ARQUIVO_CASOS, caminho_bd=None, caminho_arquivo=None,
+                    tamanho: int = TAMANHO_LOTE) -> Iterator[Lote]:
+    casos = load_triagem_cases(arquivo_casos)
+    for inicio in range(0, len(casos), tamanho):
+        lote = casos[inicio:inicio + tamanho]
+        yield [f"case_{inicio + i}" for i in range(len(lote))], lote, [{"content": caso} for caso in lote]
+    yield from casos_validados(caminho_bd, caminho_arquivo, tamanho)
+
+# Função para gerar, em lotes, os sintomas das triagens enviadas para validação (textos da coleção de entradas):
+# banco de validação (paginado pelo rowid, sem manter uma leitura aberta que bloquearia as gravações dos aplicativos)
+# e partições do arquivamento
+def lotes_entradas_triagem(caminho_bd=None, caminho_arquivo=None, tamanho: int = TAMANHO_LOTE) -> Iterator[Lote]:
+    import sqlite3
+    from arquivamento import CAMINHO_ARQUIVO, listar_particoes
+    from banco_validacao import CAMINHO_BD, conectar
+
+    def converter(linhas) -> Lote:
+        return ([linha[0] for linha in linhas], [linha[1] for linha in linhas],
+                [{"data_hora": linha[2], "validado": bool(linha[3])} for linha in linhas])
+
+    def paginar(conn):
+        ultimo = 0
+        while True:
+            linhas = conn.execute(
+                "SELECT rowid, id, sintomas, data_hora, validado FROM validacao_triagem WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (ultimo, tamanho)
+            ).fetchall()
+            if not linhas:
+                return
+            ultimo = linhas[-1][0]
+            yield converter([linha[1:] for linha in linhas])
+
+    conn = conectar(caminho_bd or CAMINHO_BD)
+    try:
+        yield from paginar(conn)
+    finally:
+        conn.close()
+
+    for _, formato, caminho in listar_particoes(caminho_arquivo or CAMINHO_ARQUIVO):
+        if formato == "sqlite":
+            conn = sqlite3.connect(caminho, timeout=30)
+            try:
+                yield from paginar(conn)
+            finally:
+                conn.close()
+        else:
+            import pyarrow.parquet as pq
+            arquivo = pq.ParquetFile(caminho)
+            for lote in arquivo.iter_batches(batch_size=tamanho, columns=["id", "sintomas", "data_hora", "validado"]):
+                yield converter(list(zip(*(lote.column(i).to_pylist() for i in range(4)))))
+
+# Função para incluir na coleção os textos de origem que ela ainda não tem; retorna a quantidade incluída
+def _completar_colecao(colecao, lotes: Iterator[Lote], modelo: str) -> int:
+    from embeddings import embed_textos
+
+    existentes = set()
+    for lote in iterar_colecao(colecao, include=()):
+        existentes.update(lote["ids"])
+    incluidos = 0
+    for ids, textos, metadados in lotes:
+        # Um mesmo ID em duas origens (ex.: caso validado em duas triagens, ou triagem no banco e numa partição
+        # durante um arquivamento) entra uma vez só
+        faltantes = []
+        for i, caso_id in enumerate(ids):
+            if caso_id not in existentes:
+                existentes.add(caso_id)
+                faltantes.append(i)
+        if not faltantes:
+            continue
+        colecao.add(
+            embeddings=embed_textos([textos[i] for i in faltantes], modelo),
+            ids=[ids[i] for i in faltantes],
+            metadatas=[metadados[i] for i in faltantes]
+        )
+        incluidos += len(faltantes)
+        print(f"  {colecao.name}: {incluidos} vetores incluídos")
+    return incluidos
+
+# Função para indexar de uma vez os sintomas das triagens que ainda não têm vetor na coleção de entradas
+# (enviadas antes da indexação existir, ou cuja indexação falhou no envio), inclusive as arquivadas.
+# Retorna a quantidade de vetores incluídos.
+def indexar_entradas(nome=NOME_COLECAO_ENTRADAS, chroma_client=None, caminho_bd=None, caminho_arquivo=None,
+                     tamanho_lote: int = TAMANHO_LOTE) -> int:
+    from banco_validacao import CAMINHO_BD, init_validation_db
+    caminho_bd = caminho_bd or CAMINHO_BD
+    init_validation_db(caminho_bd)
+    colecao = obter_colecao(chroma_client, nome=nome)
+    incluidos = _completar_colecao(colecao, lotes_entradas_triagem(caminho_bd, caminho_arquivo, tamanho_lote), modelo_da_colecao(nome))
+    print(f"{incluidos} triagens indexadas em {colecao.name} ({colecao.count()} no total)")
+    return incluidos
+
+# Função para reconstruir a coleção com os parâmetros HNSW informados, a partir de casos.txt e do banco de validação.
+# A nova coleção é montada com um nome próprio ({nome}__rAAAAMMDDHHMMSS) enquanto os aplicativos continuam na atual;
+# a troca é feita regravando colecoes_ativas.json com os.replace, como na troca de modelo (reindexacao.py).
+# Depois da troca, os casos validados nesse meio-tempo são incluídos e a coleção antiga é apagada.
+def reconstruir_colecao(config_hnsw=None, nome=NOME_COLECAO, chroma_client=None, arquivo_casos: str = ARQUIVO_CASOS, caminho_bd=None,
+                        caminho_arquivo=None):
+    from banco_validacao import CAMINHO_BD, incrementar_versao_dados
+
+    if chroma_client is None:
+        chroma_client = conectar_chroma()
+    caminho_bd = caminho_bd or CAMINHO_BD
+    config_hnsw = dict(config_hnsw or CONFIG_HNSW)
+    # A reconstrução mantém o modelo da coleção ativa (para trocar de modelo, use reindexacao.py)
+    modelo = modelo_da_colecao(nome)
+    antiga = nome_ativo(nome)
+    # Uma reconstrução interrompida deixa a coleção nova para trás, sem uso ("python reindexacao.py remover-antigas" apaga)
+    existentes = nomes_colecoes(chroma_client)
+    base = nova = f"{nome}__r{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    sequencia = 1
+    while nova in existentes:
+        nova = f"{base}_{sequencia}"
+        sequencia += 1
+
+    colecao = chroma_client.create_collection(name=nova, metadata=config_hnsw)
+    inicio = time.perf_counter()
+    _completar_colecao(colecao, lotes_de_origem(arquivo_casos, caminho_bd, caminho_arquivo), modelo)
+    duracao = time.perf_counter() - inicio
+
+    # Troca atômica: os aplicativos passam a consultar a nova coleção na próxima leitura do arquivo.
+    # Um modelo anterior registrado pela reindexação continua disponível para o "reverter".
+    entrada = {"colecao": nova, "modelo": modelo, "data": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    anterior = ler_colecoes_ativas().get(nome, {}).get("anterior")
+    if anterior and anterior.get("colecao") != antiga:
+        entrada["anterior"] = anterior
+    gravar_colecoes_ativas({nome: entrada})
+    # Invalida as estatísticas do banco vetorial em cache no painel administrativo
+    incrementar_versao_dados("banco_vetorial", caminho_bd)
+
+    # Casos validados durante a carga (gravados na coleção antiga) e remoção da coleção antiga
+    _completar_colecao(colecao, casos_validados(caminho_bd, caminho_arquivo), modelo)
+    if antiga != nova and antiga in nomes_colecoes(chroma_client):
+        chroma_client.delete_collection(antiga)
+
+    print(f"Coleção '{nome}' reconstruída em '{nova}' com {colecao.count()} casos em {duracao:.1f}s "
+          f"usando {config_hnsw} e o modelo {modelo}")
+    return chroma_client.get_collection(nova)
+
+# Função para calcular os k vizinhos exatos (força bruta) usados como referência de recall, na mesma métrica da coleção
+# (hnsw:space): cosseno, produto interno ("ip") ou distância euclidiana ("l2"). A base chega em lotes de (ids, embeddings)
+# e só os k melhores de cada consulta ficam na memória; retorna os IDs.
+def vizinhos_exatos(lotes, consultas, k, espaco: str = "cosine") -> List[set]:
+    import numpy as np
+
+    if espaco not in ("cosine", "ip", "l2"):
+        raise ValueError(f"Métrica de distância desconhecida: {espaco}")
+    consultas = np.asarray(consultas, dtype=np.float32)
+    if espaco == "cosine":
+        consultas /= np.linalg.norm(consultas, axis=1, keepdims=True) + 1e-12
+    melhores_similaridades = np.empty((len(consultas), 0), dtype=np.float32)
+    melhores_ids = np.empty((len(consultas), 0), dtype=object)
+
+    for ids, embeddings in lotes:
+        base = np.asarray(embeddings, dtype=np.float32)
+        if espaco == "cosine":
+            base /= np.linalg.norm(base, axis=1, keepdims=True) + 1e-12
+        # Pontuação em que maior é melhor: para "l2", |c - b|² = |c|² - 2 c·b + |b|², e |c|² não muda a ordem
+        pontuacoes = consultas @ base.T
+        if espaco == "l2":
+            pontuacoes = 2 * pontuacoes - np.einsum("ij,ij->i", base, base)
+        similaridades = np.concatenate([melhores_similaridades, pontuacoes], axis=1)
+        candidatos = np.concatenate([melhores_ids, np.broadcast_to(np.array(ids, dtype=object), (len(consultas), len(ids)))], axis=1)
+        k_lote = min(k, similaridades.shape[1])
+        indices = np.argpartition(-similaridades, k_lote - 1, axis=1)[:, :k_lote]
+        melhores_similaridades = np.take_along_axis(similaridades, indices, axis=1)
+        melhores_ids = np.take_along_axis(candidatos, indices, axis=1)
+    return [set(linha) for linha in melhores_ids]
+
+# Função para obter a métrica de distância de uma coleção (o ChromaDB usa "l2" quando hnsw:space não foi informado)
+def espaco_da_colecao(collection) -> str:
+    return (collection.metadata or {}).get("hnsw:space", "l2")
+
+# Função para ler o search_ef com que o índice HNSW da coleção foi aberto: nas versões do ChromaDB com configuração
+# de coleção ("hnsw" em configuration_json) vale a configuração; nas anteriores, os metadados de criação
+def search_ef_efetivo(collection) -> Optional[int]:
+    configuracao = getattr(collection, "configuration_json", None)
+    hnsw = configuracao.get("hnsw") if isinstance(configuracao, dict) else None
+    if isinstance(hnsw, dict) and hnsw.get("ef_search") is not None:
+        return hnsw["ef_search"]
+    return (collection.metadata or {}).get("hnsw:search_ef")
+
+# Função para ler os vetores de uma coleção de uma só vez: todos, ou uma amostra aleatória de `tamanho` vetores
+# (sorteada pelos IDs, com semente fixa para que medições repetidas usem a mesma amostra)
+def amostra_embeddings(collection, tamanho: int) -> Tuple[List[str], list]:
+    import numpy as np
+
+    ids, embeddings = [], []
+    if collection.count() <= tamanho:
+        for ids_lote, embeddings_lote in lotes_embeddings(collection):
+            ids.extend(ids_lote)
+            embeddings.extend(embeddings_lote)
+    else:
+        todos = [id for lote in iterar_colecao(collection, include=()) for id in lote["ids"]]
+        sorteados = random.Random(0).sample(todos, tamanho)
+        for inicio in range(0, tamanho, TAMANHO_LOTE):
+            lote = collection.get(ids=sorteados[inicio:inicio + TAMANHO_LOTE], include=["embeddings"])
+            ids.extend(lote["ids"])
+            embeddings.extend(lote["embeddings"])
+    return ids, np.asarray(embeddings, dtype=np.float32)
+
+# Função para medir recall@k e latência da busca para diferentes valores de hnsw:search_ef.
+# Alterar o search_ef de uma coleção já aberta não muda o índice carregado, então cada valor é medido num índice
+# temporário criado com ele (demais parâmetros HNSW iguais), apagado em seguida. Os vetores são lidos da coleção uma
+# única vez (inteira, ou uma amostra de `amostra` vetores) e ficam na memória: a referência (vizinhos exatos, na
+# métrica da coleção) e os índices temporários são montados a partir deles, sem reler a coleção. A coleção medida
+# não é alterada. As consultas usam o modelo da própria coleção.
+def varredura_recall_latencia(collection, consultas: List[str], k=3, valores_ef=(10, 20, 40, 80, 160, 320), modelo=None,
+                              chroma_client=None, amostra: int = TAMANHO_AMOSTRA_VARREDURA):
+    import numpy as np
+    from embeddings import embed_textos
+
+    total = collection.count()
+    if not total:
+        print("A coleção está vazia; nada a medir.")
+        return []
+    if chroma_client is None:
+        chroma_client = conectar_chroma()
+
+    embeddings_consultas = embed_textos(consultas, modelo or modelo_da_colecao_fisica(collection.name))
+    ids, vetores = amostra_embeddings(collection, amostra)
+    lotes = [(ids[inicio:inicio + TAMANHO_LOTE], vetores[inicio:inicio + TAMANHO_LOTE]) for inicio in range(0, len(ids), TAMANHO_LOTE)]
+    referencia = vizinhos_exatos(lotes, embeddings_consultas, k, espaco_da_colecao(collection))
+    metadados = dict(collection.metadata or {})
+
+    resultados = []
+    for ef in valores_ef:
+        nome_copia = f"{collection.name[:48]}__ef{ef}"
+        if nome_copia in nomes_colecoes(chroma_client):
+            chroma_client.delete_collection(nome_copia)
+        copia = chroma_client.create_collection(name=nome_copia, metadata={**metadados, "hnsw:search_ef": ef})
+        try:
+            for ids_lote, vetores_lote in lotes:
+                copia.add(ids=ids_lote, embeddings=vetores_lote)
+            efetivo = search_ef_efetivo(chroma_client.get_collection(nome_copia))
+            if efetivo != ef:
+                raise RuntimeError(f"O índice da cópia foi aberto com search_ef={efetivo} em vez de {ef}; a medição não seria válida")
+
+            latencias, acertos = [], 0
+            for embedding, esperados in zip(embeddings_consultas, referencia):
+                inicio = time.perf_counter()
+                resposta = copia.query(query_embeddings=[embedding], n_results=k, include=[])
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                acertos += len(esperados & set(resposta["ids"][0]))
+        finally:
+            chroma_client.delete_collection(nome_copia)
+        resultados.append({
+            "search_ef": ef,
+            "recall": acertos / (len(referencia) * min(k, len(ids))),
+            "latencia_media_ms": float(np.mean(latencias)),
+            "latencia_p95_ms": float(np.percentile(latencias, 95)),
+        })
+
+    medidos = f"{len(ids)} vetores" if len(ids) == total else f"amostra de {len(ids)} de {total} vetores"
+    print(f"Varredura recall@{k} x latência ({len(consultas)} consultas, {medidos})")
+    print(f"{'search_ef':>10} {'recall':>8} {'média (ms)':>11} {'p95 (ms)':>9}")
+    for r in resultados:
+        print(f"{r['search_ef']:>10} {r['recall']:>8.3f} {r['latencia_media_ms']:>11.2f} {r['latencia_p95_ms']:>9.2f}")
+    return resultados
+
+# Função para exibir a configuração atual da coleção e apontar divergências em relação à configuração desejada
+def exibir_status(collection):
+    metadados = dict(collection.metadata or {})
+    print(f"Coleção: {collection.name} ({collection.count()} vetores)")
+    for chave, desejado in CONFIG_HNSW.items():
+        atual = metadados.get(chave, "padrão")
+        aviso = "" if atual == desejado else "  <- diferente da configuração (execute 'reconstruir')"
+        print(f"  {chave}: {atual} (configurado: {desejado}){aviso}")
+
+# Função para copiar a coleção do ChromaDB para o índice NumPy (permite trocar o backend sem recalcular embeddings)
+def exportar_para_numpy(nome=NOME_COLECAO, chroma_client=None):
+    from indice_numpy import IndiceNumpy
+
+    origem = obter_colecao(chroma_client, nome, backend="chroma")
+
+    destino = IndiceNumpy(nome_ativo(nome))
+    if destino.count():
+        raise ValueError(f"O índice NumPy '{nome}' já existe em {destino.diretorio}; remova-o antes de exportar.")
+    exportados = 0
+    for lote in iterar_colecao(origem, include=("metadatas", "embeddings")):
+        destino.add(embeddings=lote["embeddings"], ids=lote["ids"], metadatas=lote["metadatas"])
+        exportados += len(lote["ids"])
+    print(f"{exportados} vetores exportados para {destino.diretorio}")
+    return destino
+
+# Função para comparar o ChromaDB com o índice NumPy: tempo de abertura, latência de busca e recall
+def benchmark_backends(consultas: List[str], k=3, repeticoes=5, nome=NOME_COLECAO, chroma_client=None):
+    import tempfile
+    import numpy as np
+    from embeddings import embed_textos
+    from indice_numpy import IndiceNumpy
+
+    inicio = time.perf_counter()
+    colecao_chroma = obter_colecao(chroma_client or conectar_chroma(), nome, backend="chroma")
+    abertura_chroma = (time.perf_counter() - inicio) * 1000
+
+    total = colecao_chroma.count()
+    if not total:
+        print("A coleção está vazia; nada a medir.")
+        return {}
+
+    embeddings_consultas = embed_textos(consultas, modelo_da_colecao(nome))
+    referencia = vizinhos_exatos(lotes_embeddings(colecao_chroma), embeddings_consultas, k, espaco_da_colecao(colecao_chroma))
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        copia = IndiceNumpy(nome, caminho=diretorio)
+        for lote in iterar_colecao(colecao_chroma, include=("metadatas", "embeddings")):
+            copia.add(embeddings=lote["embeddings"], ids=lote["ids"], metadatas=lote["metadatas"])
+        inicio = time.perf_counter()
+        indice = IndiceNumpy(nome, caminho=diretorio)
+        abertura_numpy = (time.perf_counter() - inicio) * 1000
+
+        resultados = {}
+        for rotulo, colecao, abertura in (("chroma", colecao_chroma, abertura_chroma), ("numpy", indice, abertura_numpy)):
+            latencias, acertos = [], 0
+            for _ in range(repeticoes):
+                for embedding, esperados in zip(embeddings_consultas, referencia):
+                    inicio = time.perf_counter()
+                    resposta = colecao.query(query_embeddings=[embedding], n_results=k)
+                    latencias.append((time.perf_counter() - inicio) * 1000)
+                    acertos += len(esperados & set(resposta["ids"][0]))
+
+            # Todas as consultas de uma vez (o índice NumPy resolve tudo numa única multiplicação de matrizes)
+            inicio = time.perf_counter()
+            colecao.query(query_embeddings=embeddings_consultas, n_results=k)
+            lote = (time.perf_counter() - inicio) * 1000
+
+            resultados[rotulo] = {
+                "abertura_ms": abertura,
+                "latencia_media_ms": float(np.mean(latencias)),
+                "latencia_p95_ms": float(np.percentile(latencias, 95)),
+                "lote_ms": lote,
+                "recall": acertos / (repeticoes * len(referencia) * min(k, total)),
+            }
+
+    print(f"Benchmark de backends ({total} vetores, {len(consultas)} consultas, k={k})")
+    print(f"{'backend':>8} {'abertura (ms)':>14} {'média (ms)':>11} {'p95 (ms)':>9} {'lote (ms)':>10} {'recall':>7}")
+    for rotulo, r in resultados.items():
+        print(f"{rotulo:>8} {r['abertura_ms']:>14.1f} {r['latencia_media_ms']:>11.2f} {r['latencia_p95_ms']:>9.2f} {r['lote_ms']:>10.2f} {r['recall']:>7.3f}")
+    return resultados
+
+def main():
+    parser = argparse.ArgumentParser(description="Manutenção do banco vetorial de triagem")
+    parser.add_argument("--unidade", help="Código da unidade cuja coleção é mantida (conforme unidades.json)")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+
+    subcomandos.add_parser("status", help="Mostra os parâmetros HNSW da coleção")
+
+    reconstruir = subcomandos.add_parser("reconstruir", help="Recria a coleção a partir de casos.txt e do banco de validação")
+    reconstruir.add_argument("--space", default=CONFIG_HNSW["hnsw:space"], choices=["cosine", "l2", "ip"])
+    reconstruir.add_argument("--m", type=int, default=CONFIG_HNSW["hnsw:M"])
+    reconstruir.add_argument("--construction-ef", type=int, default=CONFIG_HNSW["hnsw:construction_ef"])
+    reconstruir.add_argument("--search-ef", type=int, default=CONFIG_HNSW["hnsw:search_ef"])
+    reconstruir.add_argument("--sem-varredura", action="store_true", help="Não executa a varredura de recall ao final")
+
+    varredura = subcomandos.add_parser("varredura", help="Mede recall x latência para vários search_ef")
+    varredura.add_argument("--k", type=int, default=3)
+    varredura.add_argument("--efs", default="10,20,40,80,160,320")
+
+    subcomandos.add_parser("exportar-numpy", help="Copia a coleção do ChromaDB para o índice NumPy")
+
+    benchmark = subcomandos.add_parser("benchmark", help="Compara o ChromaDB com o índice NumPy")
+    benchmark.add_argument("--k", type=int, default=3)
+    benchmark.add_argument("--repeticoes", type=int, default=5)
+
+    indexar = subcomandos.add_parser("indexar-entradas", help="Indexa as triagens enviadas que ainda não têm vetor")
+    indexar.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="Triagens lidas e vetorizadas por vez")
+
+    args = parser.parse_args()
+
+    # Sem --unidade, usa a coleção e os caminhos padrão (instalação com uma única unidade)
+    nome, caminho_chroma, arquivo_casos, caminho_bd, caminho_arquivo = NOME_COLECAO, CAMINHO_CHROMA, ARQUIVO_CASOS, None, None
+    nome_entradas = NOME_COLECAO_ENTRADAS
+    if args.unidade:
+        from unidades import obter_unidade
+        unidade = obter_unidade(args.unidade)
+        nome, caminho_chroma, arquivo_casos = unidade.colecao, unidade.caminho_chroma, unidade.arquivo_casos
+        caminho_bd, caminho_arquivo, nome_entradas = unidade.caminho_bd, unidade.caminho_arquivo, unidade.colecao_entradas
+
+    if args.comando == "exportar-numpy":
+        exportar_para_numpy(nome, conectar_chroma(caminho_chroma))
+        return
+    if args.comando == "benchmark":
+        benchmark_backends(load_triagem_cases(ARQUIVO_TESTE), args.k, args.repeticoes, nome, conectar_chroma(caminho_chroma))
+        return
+    if args.comando == "indexar-entradas":
+        # No backend NumPy cada coleção já tem seu diretório, sem cliente do ChromaDB
+        chroma_client = None if BACKEND_VETORIAL == "numpy" else conectar_chroma(caminho_chroma)
+        indexar_entradas(nome_entradas, chroma_client, caminho_bd, caminho_arquivo, args.lote)
+        return
+
+    # status, reconstruir e varredura tratam dos parâmetros do índice HNSW do ChromaDB; o índice NumPy não tem esses
+    # parâmetros (a busca é exata) e é montado com "exportar-numpy" ou pelos próprios aplicativos
+    if BACKEND_VETORIAL == "numpy":
+        parser.error(f"o subcomando '{args.comando}' se aplica apenas ao ChromaDB, mas TRIAGEM_BACKEND_VETORIAL=numpy. "
+                     "Execute-o com TRIAGEM_BACKEND_VETORIAL=chroma.")
+
+    chroma_client = conectar_chroma(caminho_chroma)
+
+    if args.comando == "status":
+        exibir_status(obter_colecao(chroma_client, nome=nome))
+    elif args.comando == "reconstruir":
+        config_hnsw = {
+            "hnsw:space": args.space,
+            "hnsw:M": args.m,
+            "hnsw:construction_ef": args.construction_ef,
+            "hnsw:search_ef": args.search_ef,
+        }
+        collection = reconstruir_colecao(config_hnsw, nome, chroma_client, arquivo_casos, caminho_bd, caminho_arquivo)
+        if not args.sem_varredura:
+            varredura_recall_latencia(collection, load_triagem_cases(ARQUIVO_TESTE), chroma_client=chroma_client)
+    elif args.comando == "varredura":
+        valores_ef = [int(ef) for ef in args.efs.split(",") if ef.strip()]
+        varredura_recall_latencia(obter_colecao(chroma_client, nome=nome), load_triagem_cases(ARQUIVO_TESTE), args.k, valores_ef,
+                                  chroma_client=chroma_client)
+
+if __name__ == "__main__":
+    main()
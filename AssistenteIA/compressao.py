@@ -0,0 +1,176 @@
+# Compressão dos textos longos do banco de validação (resposta do modelo e feedback dos especialistas)
+#
+# Cada texto vira um blob: 1 byte com o codec, 4 bytes com o ID do dicionário (0 = sem dicionário) e os dados.
+# O dicionário é treinado sobre respostas anteriores: como toda resposta repete os mesmos títulos de seção
+# ("Classificação de Risco", "Conduta Clínica Inicial", ...), esse texto fixo passa a custar poucos bytes por linha.
+# Usa zstd (pacote opcional zstandard) quando instalado e zlib (biblioteca padrão) caso contrário; o mesmo
+# dicionário serve aos dois codecs, e o byte de codec permite ler blobs gravados por qualquer um deles.
+#
+# Uso pela linha de comando (a partir da pasta AssistenteIA):
+#   python compressao.py status
+#   python compressao.py treinar --amostras 5000
+#   python compressao.py recomprimir
+import argparse
+import time
+import zlib
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+CODEC_TEXTO = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+NIVEL_ZSTD = 9
+NIVEL_ZLIB = 9
+
+# Tamanho máximo do dicionário (o zlib usa no máximo os últimos 32 KB)
+TAMANHO_DICIONARIO = 16384
+
+# Quantidade de caracteres da resposta guardada sem compressão para as listagens
+TAMANHO_PREVIA = 50
+
+class Dicionario(NamedTuple):
+    id: int
+    tipo: str  # "zstd" (treinado pelo zstd) ou "bruto" (trechos frequentes, usado quando o zstd não está instalado)
+    dados: bytes
+
+# Função para obter o módulo zstandard, ou None se ele não estiver instalado
+@lru_cache(maxsize=None)
+def _zstd():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+def zstd_disponivel() -> bool:
+    return _zstd() is not None
+
+# Dicionário no formato do zstd (montado uma vez por dicionário, pois a preparação tem custo)
+@lru_cache(maxsize=32)
+def _dicionario_zstd(dicionario: Dicionario):
+    zstd = _zstd()
+    tipo = zstd.DICT_TYPE_FULLDICT if dicionario.tipo == "zstd" else zstd.DICT_TYPE_RAWCONTENT
+    return zstd.ZstdCompressionDict(dicionario.dados, dict_type=tipo)
+
+# Função para comprimir um texto (None continua None)
+def comprimir(texto: Optional[str], dicionario: Optional[Dicionario] = None) -> Optional[bytes]:
+    if texto is None:
+        return None
+    dados = str(texto).encode("utf-8")
+    dicionario_id = dicionario.id if dicionario else 0
+
+    if zstd_disponivel():
+        compressor = _zstd().ZstdCompressor(level=NIVEL_ZSTD, dict_data=_dicionario_zstd(dicionario) if dicionario else None)
+        codec, comprimido = CODEC_ZSTD, compressor.compress(dados)
+    else:
+        objeto = zlib.compressobj(NIVEL_ZLIB, zdict=dicionario.dados) if dicionario else zlib.compressobj(NIVEL_ZLIB)
+        codec, comprimido = CODEC_ZLIB, objeto.compress(dados) + objeto.flush()
+
+    # Textos muito curtos podem crescer ao comprimir; nesse caso ficam como texto puro
+    if len(comprimido) >= len(dados):
+        return bytes([CODEC_TEXTO]) + (0).to_bytes(4, "big") + dados
+    return bytes([codec]) + dicionario_id.to_bytes(4, "big") + comprimido
+
+# Função para descomprimir um blob gravado por comprimir(); `dicionarios` mapeia ID -> Dicionario
+def descomprimir(blob: Optional[bytes], dicionarios: Dict[int, Dicionario]) -> Optional[str]:
+    if blob is None:
+        return None
+    codec, dicionario_id, dados = blob[0], int.from_bytes(blob[1:5], "big"), bytes(blob[5:])
+    dicionario = dicionarios[dicionario_id] if dicionario_id else None
+
+    if codec == CODEC_TEXTO:
+        return dados.decode("utf-8")
+    if codec == CODEC_ZLIB:
+        objeto = zlib.decompressobj(zdict=dicionario.dados) if dicionario else zlib.decompressobj()
+        return (objeto.decompress(dados) + objeto.flush()).decode("utf-8")
+    if codec == CODEC_ZSTD:
+        if not zstd_disponivel():
+            raise RuntimeError("Texto comprimido com zstd: instale o pacote zstandard (pip install zstandard)")
+        descompressor = _zstd().ZstdDecompressor(dict_data=_dicionario_zstd(dicionario) if dicionario else None)
+        return descompressor.decompress(dados).decode("utf-8")
+    raise ValueError(f"Codec de compressão desconhecido: {codec}")
+
+# Função para montar um dicionário só com os trechos que se repetem entre as amostras (linhas inteiras e
+# os rótulos antes de ":"), com os mais valiosos no final, onde ficam mais próximos do texto comprimido
+def dicionario_trechos_frequentes(amostras: List[str], tamanho: int = TAMANHO_DICIONARIO) -> bytes:
+    contagem = Counter()
+    for amostra in amostras:
+        trechos = set()
+        for linha in amostra.splitlines():
+            linha = linha.strip()
+            if linha:
+                trechos.add(linha)
+                if ":" in linha:
+                    trechos.add(linha.split(":", 1)[0] + ":")
+        contagem.update(trechos)
+
+    repetidos = [(quantidade * len(trecho), trecho) for trecho, quantidade in contagem.items() if quantidade > 1]
+    dicionario = b""
+    for _, trecho in sorted(repetidos, reverse=True):
+        dados = (trecho + "\n").encode("utf-8")
+        if len(dicionario) + len(dados) > tamanho:
+            break
+        dicionario = dados + dicionario
+    return dicionario
+
+# Função para treinar um dicionário a partir de textos anteriores; retorna (tipo, dados)
+def treinar_dicionario(amostras: List[str], tamanho: int = TAMANHO_DICIONARIO) -> Tuple[str, bytes]:
+    if zstd_disponivel():
+        try:
+            treinado = _zstd().train_dictionary(tamanho, [amostra.encode("utf-8") for amostra in amostras])
+            return "zstd", treinado.as_bytes()
+        except _zstd().ZstdError:
+            # Poucas amostras para o treinador do zstd: usa os trechos frequentes
+            pass
+    return "bruto", dicionario_trechos_frequentes(amostras, tamanho)
+
+# Função para extrair a prévia (início do texto, sem compressão) exibida nas listagens
+def previa(texto: Optional[str], tamanho: int = TAMANHO_PREVIA) -> Optional[str]:
+    if texto is None:
+        return None
+    return str(texto)[:tamanho]
+
+def main():
+    from arquivamento import compactar
+    from banco_validacao import CAMINHO_BD, estatisticas_compressao, recomprimir, treinar_dicionario_bd
+
+    parser = argparse.ArgumentParser(description="Compressão das respostas e feedbacks do banco de validação")
+    parser.add_argument("--bd", default=CAMINHO_BD, help="Caminho do banco de validação")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    subparsers.add_parser("status", help="Tamanho dos textos antes e depois da compressão")
+
+    treinar = subparsers.add_parser("treinar", help="Treina um novo dicionário com as respostas mais recentes e recomprime o banco")
+    treinar.add_argument("--amostras", type=int, default=5000, help="Quantidade de triagens usadas no treino")
+    treinar.add_argument("--sem-compactar", action="store_true", help="Não executa VACUUM ao final")
+
+    recomprimir_parser = subparsers.add_parser("recomprimir", help="Comprime as linhas ainda não comprimidas (ou todas, com --todas)")
+    recomprimir_parser.add_argument("--todas", action="store_true", help="Recomprime também as linhas que usam dicionários antigos")
+    recomprimir_parser.add_argument("--sem-compactar", action="store_true", help="Não executa VACUUM ao final")
+
+    args = parser.parse_args()
+
+    if args.comando == "treinar":
+        dicionario = treinar_dicionario_bd(args.bd, args.amostras)
+        print(f"Dicionário {dicionario.id} ({dicionario.tipo}, {len(dicionario.dados)} bytes) treinado.")
+
+    if args.comando in ("treinar", "recomprimir"):
+        inicio = time.perf_counter()
+        linhas = recomprimir(args.bd, todas=args.comando == "treinar" or args.todas)
+        print(f"{linhas} triagens comprimidas em {time.perf_counter() - inicio:.1f}s")
+        if not args.sem_compactar:
+            compactar(args.bd)
+
+    estatisticas = estatisticas_compressao(args.bd)
+    print(f"Codec disponível: {'zstd' if zstd_disponivel() else 'zlib (instale zstandard para usar zstd)'}")
+    print(f"Dicionário atual: {estatisticas['dicionario'] or 'nenhum'}")
+    print(f"Triagens: {estatisticas['triagens']} ({estatisticas['nao_comprimidas']} ainda não comprimidas)")
+    print(f"Textos originais: {estatisticas['bytes_originais'] / 1e6:.2f} MB")
+    print(f"Textos comprimidos: {estatisticas['bytes_comprimidos'] / 1e6:.2f} MB "
+          f"(taxa {estatisticas['bytes_originais'] / max(estatisticas['bytes_comprimidos'], 1):.1f}x)")
+    print(f"Arquivo do banco: {estatisticas['tamanho_arquivo'] / 1e6:.2f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+# Módulo compartilhado para geração de embeddings (vetorização de textos)
+# Usado pelo aplicativo principal e pelas ferramentas de manutenção do banco vetorial
+import threading
+from functools import lru_cache
+from typing import List
+
+# Modelo de embeddings semânticos das coleções sem modelo registrado em colecoes_ativas.json
+# (o modelo de cada coleção é obtido com banco_vetorial.modelo_da_colecao; para trocá-lo, use reindexacao.py)
+MODELO_EMBEDDING = 'sentence-transformers/all-MiniLM-L6-v2'
+
+# Impede que sessões simultâneas carreguem o mesmo modelo ao mesmo tempo (cada cópia ocupa centenas de MB)
+_lock_carga = threading.Lock()
+
+# Função para carregar o modelo uma única vez por processo. Ficam carregados no máximo dois modelos
+# (o atual e o anterior, durante a troca feita por reindexacao.py); o mais antigo é liberado.
+def carregar_modelo(nome_modelo: str = MODELO_EMBEDDING):
+    with _lock_carga:
+        return _carregar_modelo(nome_modelo)
+
+@lru_cache(maxsize=2)
+def _carregar_modelo(nome_modelo: str):
+    # Importa aqui para não pagar o custo do torch em quem não gera embeddings
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(nome_modelo)
+
+# Função que converte um texto em vetor numérico (embedding)
+def embed_text(text: str, nome_modelo: str = MODELO_EMBEDDING) -> List[float]:
+    return embed_textos([text], nome_modelo)[0]
+
+# Função que converte uma lista de textos em embeddings, processando em lotes
+def embed_textos(textos: List[str], nome_modelo: str = MODELO_EMBEDDING, tamanho_lote: int = 64) -> List[List[float]]:
+    model = carregar_modelo(nome_modelo)
+    embeddings = model.encode(textos, batch_size=tamanho_lote, convert_to_numpy=True)
+    return embeddings.tolist()
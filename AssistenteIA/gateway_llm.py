@@ -0,0 +1,359 @@
+# Gateway para múltiplos servidores Ollama
+#
+# Recebe uma lista de URLs base do Ollama, mantém conexões HTTP persistentes com cada uma,
+# encaminha cada requisição ao servidor saudável menos carregado e, em caso de erro de conexão, timeout
+# ou erro do servidor (HTTP 5xx), tenta novamente no próximo servidor. Os servidores marcados como
+# indisponíveis são verificados de novo em segundo plano. As latências de cada chamada podem ser gravadas no SQLite
+# (tabela chamadas_llm) para exibição no painel administrativo.
+import http.client
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+# URLs dos servidores Ollama, separadas por vírgula
+URLS_OLLAMA = [url.strip() for url in os.environ.get("TRIAGEM_OLLAMA_URLS", "http://localhost:11434").split(",") if url.strip()]
+
+# Tempo máximo de espera por uma verificação de saúde (GET /api/tags)
+TIMEOUT_SAUDE = 2.0
+
+# Por quanto tempo o Ollama mantém o modelo carregado na memória após a última requisição: duração com unidade ("30m", "1h")
+# ou número de segundos ("300"; "-1" mantém o modelo carregado indefinidamente e "0" o descarrega logo após a resposta)
+KEEP_ALIVE = os.environ.get("TRIAGEM_OLLAMA_KEEP_ALIVE", "30m")
+
+# Horário do turno (horas cheias, 0-24) em que o modelo é mantido aquecido e intervalo entre os pings, em segundos
+TURNO_INICIO = int(os.environ.get("TRIAGEM_TURNO_INICIO", "7"))
+TURNO_FIM = int(os.environ.get("TRIAGEM_TURNO_FIM", "19"))
+INTERVALO_MANTER_AQUECIDO = float(os.environ.get("TRIAGEM_KEEP_WARM_INTERVALO", "240"))
+
+# Acima deste tempo de carga do modelo (load_duration do Ollama), a chamada é considerada "a frio"
+LIMIAR_CARGA_FRIA_MS = 1000.0
+
+# Erro levantado quando nenhum servidor consegue atender a requisição
+class ErroGatewayLLM(RuntimeError):
+    pass
+
+# Erro HTTP devolvido por um servidor. Erros 4xx vêm do pedido (ex.: modelo inexistente) e se repetiriam
+# em qualquer servidor, então não derrubam o servidor nem disparam o failover
+class ErroHTTPOllama(ErroGatewayLLM):
+    def __init__(self, mensagem: str, status: int):
+        super().__init__(mensagem)
+        self.status = status
+
+# Resposta de chat no mesmo formato textual do ChatResponse do LlamaIndex ("assistant: ...")
+class RespostaChat:
+    def __init__(self, content: str, role: str = "assistant", backend: str = "", latencia_ms: float = 0.0, dados: Optional[dict] = None):
+        self.content = content
+        self.role = role
+        self.backend = backend
+        self.latencia_ms = latencia_ms
+        self.dados = dados or {}
+
+    def __str__(self):
+        return f"{self.role}: {self.content}"
+
+# Estado de um servidor Ollama: conexões reaproveitáveis, carga atual e estatísticas de latência
+class BackendOllama:
+    def __init__(self, url: str, timeout: float):
+        partes = urlparse(url if "://" in url else f"http://{url}")
+        self.url = f"{partes.scheme}://{partes.netloc}"
+        self.https = partes.scheme == "https"
+        self.host = partes.hostname
+        self.porta = partes.port or (443 if self.https else 80)
+        self.timeout = timeout
+
+        self.lock = threading.Lock()
+        self.conexoes_livres: List[http.client.HTTPConnection] = []
+        self.em_andamento = 0
+        self.saudavel = True
+        self.ultima_verificacao = 0.0
+        self.requisicoes = 0
+        self.falhas = 0
+        self.latencias = deque(maxlen=200)
+
+    def _nova_conexao(self, timeout: float):
+        classe = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return classe(self.host, self.porta, timeout=timeout)
+
+    # Envia uma requisição reaproveitando uma conexão persistente (keep-alive) do próprio servidor
+    def requisitar(self, metodo: str, caminho: str, corpo: Optional[dict] = None, timeout: Optional[float] = None) -> dict:
+        with self.lock:
+            conexao = self.conexoes_livres.pop() if self.conexoes_livres else None
+        reaproveitada = conexao is not None
+        if conexao is None:
+            conexao = self._nova_conexao(timeout or self.timeout)
+        conexao.timeout = timeout or self.timeout
+        if conexao.sock is not None:
+            conexao.sock.settimeout(conexao.timeout)
+
+        dados = json.dumps(corpo).encode("utf-8") if corpo is not None else None
+        try:
+            conexao.request(metodo, caminho, body=dados, headers={"Content-Type": "application/json"})
+            resposta = conexao.getresponse()
+            conteudo = resposta.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conexao.close()
+            # O servidor fechou uma conexão ociosa: tenta uma única vez com uma conexão nova
+            if not reaproveitada:
+                raise
+            return self.requisitar(metodo, caminho, corpo, timeout)
+        except Exception:
+            conexao.close()
+            raise
+
+        if resposta.status >= 400:
+            conexao.close()
+            raise ErroHTTPOllama(f"{self.url} respondeu HTTP {resposta.status}: {conteudo[:200]!r}", resposta.status)
+
+        with self.lock:
+            self.conexoes_livres.append(conexao)
+        return json.loads(conteudo) if conteudo else {}
+
+    # Verifica se o servidor responde (lista de modelos) e atualiza o estado de saúde
+    def verificar_saude(self) -> bool:
+        try:
+            self.requisitar("GET", "/api/tags", timeout=TIMEOUT_SAUDE)
+            self.saudavel = True
+        except Exception:
+            self.saudavel = False
+        self.ultima_verificacao = time.monotonic()
+        return self.saudavel
+
+    def latencia_media_ms(self) -> float:
+        return sum(self.latencias) / len(self.latencias) if self.latencias else 0.0
+
+    def estatisticas(self) -> dict:
+        latencias = sorted(self.latencias)
+        return {
+            "backend": self.url,
+            "saudavel": self.saudavel,
+            "em_andamento": self.em_andamento,
+            "requisicoes": self.requisicoes,
+            "falhas": self.falhas,
+            "latencia_media_ms": self.latencia_media_ms(),
+            "latencia_p95_ms": latencias[int(0.95 * (len(latencias) - 1))] if latencias else 0.0,
+        }
+
+class GatewayOllama:
+    def __init__(self, urls: Optional[List[str]] = None, model: str = "mistral", request_timeout: float = 420.0,
+                 intervalo_saude: float = 30.0, caminho_bd: Optional[str] = None, keep_alive: Union[str, int] = KEEP_ALIVE):
+        urls = urls or URLS_OLLAMA
+        if not urls:
+            raise ValueError("Informe ao menos uma URL de servidor Ollama.")
+        self.model = model
+        self.keep_alive = valor_keep_alive(keep_alive)
+        self.intervalo_saude = intervalo_saude
+        self.caminho_bd = caminho_bd
+        self.backends = [BackendOllama(url, request_timeout) for url in urls]
+        self.lock = threading.Lock()
+        self._encerrado = threading.Event()
+        if caminho_bd:
+            init_tabela_chamadas(caminho_bd)
+        if intervalo_saude > 0:
+            threading.Thread(target=self._verificar_saude_periodicamente, name="saude-ollama", daemon=True).start()
+
+    # Verifica novamente os servidores marcados como indisponíveis cuja última verificação já expirou
+    def _reverificar_indisponiveis(self):
+        agora = time.monotonic()
+        for backend in self.backends:
+            if not backend.saudavel and agora - backend.ultima_verificacao >= self.intervalo_saude:
+                backend.verificar_saude()
+
+    # Executada numa thread em segundo plano: as triagens não esperam pela verificação dos servidores indisponíveis
+    def _verificar_saude_periodicamente(self):
+        while not self._encerrado.wait(self.intervalo_saude):
+            self._reverificar_indisponiveis()
+
+    # Interrompe a verificação de saúde em segundo plano
+    def encerrar(self):
+        self._encerrado.set()
+
+    # Escolhe o servidor saudável com menos requisições em andamento (empate: menor latência média)
+    def _escolher_backend(self, excluidos) -> Optional[BackendOllama]:
+        with self.lock:
+            candidatos = [b for b in self.backends if b not in excluidos and b.saudavel]
+            if not candidatos:
+                # Nenhum servidor saudável: tenta mesmo assim os que ainda não foram tentados
+                candidatos = [b for b in self.backends if b not in excluidos]
+            if not candidatos:
+                return None
+            escolhido = min(candidatos, key=lambda b: (b.em_andamento, b.latencia_media_ms()))
+            escolhido.em_andamento += 1
+            return escolhido
+
+    def verificar_saude(self) -> List[bool]:
+        return [backend.verificar_saude() for backend in self.backends]
+
+    # Envia uma requisição a um servidor específico, atualizando as estatísticas e o registro de chamadas.
+    # O contador em_andamento do servidor já deve ter sido incrementado por quem chamou.
+    def _enviar(self, backend: BackendOllama, caminho: str, corpo: dict, origem: str) -> Tuple[dict, float]:
+        inicio = time.perf_counter()
+        try:
+            dados = backend.requisitar("POST", caminho, corpo)
+        except Exception as e:
+            latencia_ms = (time.perf_counter() - inicio) * 1000
+            with self.lock:
+                backend.em_andamento -= 1
+                backend.falhas += 1
+                backend.requisicoes += 1
+                # Só erros de conexão, timeouts e HTTP 5xx indicam problema no servidor
+                if not erro_do_pedido(e):
+                    backend.saudavel = False
+                    backend.ultima_verificacao = time.monotonic()
+            self._registrar_chamada(backend, latencia_ms, False, str(e), origem, None)
+            raise
+
+        latencia_ms = (time.perf_counter() - inicio) * 1000
+        with self.lock:
+            backend.em_andamento -= 1
+            backend.requisicoes += 1
+            if origem == "triagem":
+                backend.latencias.append(latencia_ms)
+        # load_duration (em nanossegundos) indica quanto tempo o Ollama levou para carregar o modelo na memória
+        carga = dados.get("load_duration")
+        duracao_carga_ms = carga / 1e6 if isinstance(carga, (int, float)) else None
+        self._registrar_chamada(backend, latencia_ms, True, None, origem, duracao_carga_ms)
+        dados["duracao_carga_ms"] = duracao_carga_ms
+        return dados, latencia_ms
+
+    # Envia uma requisição ao Ollama, com failover para os demais servidores em caso de erro de conexão, timeout ou HTTP 5xx.
+    # Erros 4xx são repassados a quem chamou sem tentar os outros servidores
+    def _requisitar(self, caminho: str, corpo: dict, origem: str = "triagem") -> Tuple[dict, BackendOllama, float]:
+        tentados, erros = [], []
+        while True:
+            backend = self._escolher_backend(tentados)
+            if backend is None:
+                raise ErroGatewayLLM("Nenhum servidor Ollama conseguiu atender a requisição: " + "; ".join(erros))
+            tentados.append(backend)
+
+            try:
+                dados, latencia_ms = self._enviar(backend, caminho, corpo, origem)
+            except Exception as e:
+                if erro_do_pedido(e):
+                    raise
+                erros.append(f"{backend.url}: {e}")
+                continue
+            return dados, backend, latencia_ms
+
+    def _corpo_chat(self, messages) -> dict:
+        return {
+            "model": self.model,
+            "messages": [{"role": getattr(m.role, "value", m.role), "content": m.content} for m in messages],
+            "stream": False,
+            "keep_alive": self.keep_alive,
+        }
+
+    # Mesma assinatura usada com o LlamaIndex: recebe a lista de ChatMessage e retorna a resposta do modelo
+    def chat(self, messages, origem: str = "triagem") -> RespostaChat:
+        dados, backend, latencia_ms = self._requisitar("/api/chat", self._corpo_chat(messages), origem)
+        mensagem = dados.get("message", {})
+        return RespostaChat(mensagem.get("content", ""), mensagem.get("role", "assistant"), backend.url, latencia_ms, dados)
+
+    # Aquece todos os servidores: envia uma pergunta mínima com a mensagem de sistema fixa da triagem,
+    # para que o modelo (e o prefixo do prompt) já esteja carregado quando chegar a primeira triagem
+    def aquecer(self, mensagem_sistema: str) -> List[dict]:
+        corpo = {
+            "model": self.model,
+            "messages": [{"role": "system", "content": mensagem_sistema}, {"role": "user", "content": "ok"}],
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": {"num_predict": 1},
+        }
+        resultados = []
+        for backend in self.backends:
+            with self.lock:
+                backend.em_andamento += 1
+            try:
+                dados, latencia_ms = self._enviar(backend, "/api/chat", corpo, "aquecimento")
+                resultados.append({"backend": backend.url, "latencia_ms": latencia_ms, "duracao_carga_ms": dados["duracao_carga_ms"]})
+            except Exception as e:
+                resultados.append({"backend": backend.url, "erro": str(e)})
+        return resultados
+
+    # Renova o keep_alive em todos os servidores sem gerar texto (mensagens vazias apenas carregam o modelo no Ollama)
+    def manter_aquecido(self):
+        corpo = {"model": self.model, "messages": [], "stream": False, "keep_alive": self.keep_alive}
+        for backend in self.backends:
+            with self.lock:
+                backend.em_andamento += 1
+            try:
+                self._enviar(backend, "/api/chat", corpo, "manter_aquecido")
+            except Exception:
+                pass
+
+    # Inicia uma thread que renova o keep_alive periodicamente, apenas durante o horário do turno
+    def iniciar_manter_aquecido(self, intervalo: float = INTERVALO_MANTER_AQUECIDO, inicio_turno: int = TURNO_INICIO, fim_turno: int = TURNO_FIM):
+        def executar():
+            while True:
+                if dentro_do_turno(datetime.now().hour, inicio_turno, fim_turno):
+                    self.manter_aquecido()
+                time.sleep(intervalo)
+
+        thread = threading.Thread(target=executar, name="manter-llm-aquecido", daemon=True)
+        thread.start()
+        return thread
+
+    def estatisticas(self) -> List[dict]:
+        return [backend.estatisticas() for backend in self.backends]
+
+    # Grava a chamada no SQLite para o painel administrativo (falhas de gravação não interrompem a triagem)
+    def _registrar_chamada(self, backend: BackendOllama, latencia_ms: float, sucesso: bool, erro: Optional[str], origem: str,
+                           duracao_carga_ms: Optional[float]):
+        if not self.caminho_bd:
+            return
+        try:
+            conn = sqlite3.connect(self.caminho_bd, timeout=5)
+            conn.execute(
+                "INSERT INTO chamadas_llm (backend, data_hora, latencia_ms, sucesso, erro, origem, duracao_carga_ms) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (backend.url, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), latencia_ms, int(sucesso), erro, origem, duracao_carga_ms)
+            )
+            conn.commit()
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+# Função para criar a tabela de registro das chamadas ao LLM, se não existir
+def init_tabela_chamadas(caminho_bd: str):
+    conn = sqlite3.connect(caminho_bd)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS chamadas_llm (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        backend TEXT NOT NULL,
+        data_hora TEXT NOT NULL,
+        latencia_ms REAL NOT NULL,
+        sucesso INTEGER NOT NULL,
+        erro TEXT,
+        origem TEXT,
+        duracao_carga_ms REAL
+    )
+    ''')
+    # Bancos criados antes do registro do tempo de carga do modelo recebem a coluna nova
+    colunas = [linha[1] for linha in conn.execute("PRAGMA table_info(chamadas_llm)")]
+    if "duracao_carga_ms" not in colunas:
+        conn.execute("ALTER TABLE chamadas_llm ADD COLUMN duracao_carga_ms REAL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chamadas_llm_data_hora ON chamadas_llm (data_hora)")
+    conn.commit()
+    conn.close()
+
+# Função para converter o keep_alive para o formato da API do Ollama: números vão como número de segundos, porque
+# o Ollama interpreta texto como duração e recusa com HTTP 400 um texto sem unidade (ex.: "-1")
+def valor_keep_alive(valor: Union[str, int]) -> Union[str, int]:
+    if isinstance(valor, str) and re.fullmatch(r"\s*-?\d+\s*", valor):
+        return int(valor)
+    return valor
+
+# Função para verificar se o erro foi causado pelo pedido (HTTP 4xx) e não pelo servidor
+def erro_do_pedido(erro: Exception) -> bool:
+    return isinstance(erro, ErroHTTPOllama) and 400 <= erro.status < 500
+
+# Função para verificar se a hora atual está dentro do turno (aceita turnos que passam da meia-noite, ex.: 19 às 7)
+def dentro_do_turno(hora: int, inicio_turno: int, fim_turno: int) -> bool:
+    if inicio_turno <= fim_turno:
+        return inicio_turno <= hora < fim_turno
+    return hora >= inicio_turno or hora < fim_turno
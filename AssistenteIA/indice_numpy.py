@@ -0,0 +1,402 @@
+# Índice vetorial em memória usando apenas NumPy (alternativa ao ChromaDB para bases pequenas e médias)
+#
+# Os embeddings ficam normalizados em float32 num arquivo .npy aberto por memory-map (sem cópia ao carregar)
+# e os IDs/metadados ficam num arquivo JSON ao lado. A busca é um produto de matrizes seguido de argpartition.
+# A classe expõe o mesmo subconjunto da interface de coleção do ChromaDB usado pelos aplicativos
+# (add, get, update, delete, query, count), então pode ser trocada pela configuração TRIAGEM_BACKEND_VETORIAL=numpy.
+#
+# Inclusões e alterações só de metadados não regravam o .npy: são acrescentadas, uma linha JSON por operação, a um
+# arquivo de delta (delta_<id>.jsonl, do mesmo <id> do embeddings_<id>.npy em uso). Quando o delta passa de
+# TAMANHO_MAXIMO_DELTA registros (ou numa exclusão ou troca de vetores), o índice é compactado num .npy novo.
+# As gravações de processos diferentes (os dois aplicativos, reindexacao.py) são serializadas por uma trava no
+# arquivo indice.lock do diretório do índice.
+import base64
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Diretório padrão onde os índices NumPy são gravados (um subdiretório por coleção)
+CAMINHO_INDICE_NUMPY = os.environ.get("TRIAGEM_NUMPY_PATH", "./indice_numpy")
+
+# Quantidade de vetores da base comparados por vez na busca (limita a memória da matriz de similaridades)
+TAMANHO_BLOCO_BUSCA = 65536
+
+# Quantidade de registros acrescentados ao delta antes de compactar o índice num .npy novo
+TAMANHO_MAXIMO_DELTA = int(os.environ.get("TRIAGEM_NUMPY_DELTA_MAXIMO", "1024"))
+
+# Função para normalizar vetores (norma 1), de modo que o produto interno seja a similaridade de cosseno
+def normalizar(vetores) -> np.ndarray:
+    vetores = np.asarray(vetores, dtype=np.float32)
+    if vetores.ndim == 1:
+        vetores = vetores.reshape(1, -1)
+    normas = np.linalg.norm(vetores, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return vetores / normas
+
+# Função para travar um arquivo entre processos (fcntl.flock no Linux/macOS, msvcrt.locking no Windows)
+@contextmanager
+def travar_arquivo(caminho: str):
+    with open(caminho, "a+b") as arquivo:
+        if os.name == "nt":
+            import msvcrt
+            arquivo.seek(0)
+            # LK_LOCK desiste depois de ~10 tentativas; continua tentando até obter a trava
+            while True:
+                try:
+                    msvcrt.locking(arquivo.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                arquivo.seek(0)
+                msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+
+class IndiceNumpy:
+    def __init__(self, nome: str, caminho: str = CAMINHO_INDICE_NUMPY):
+        self.name = nome
+        self.metadata = {"hnsw:space": "cosine", "backend": "numpy"}
+        self.diretorio = os.path.join(caminho, nome)
+        self.arquivo_registros = os.path.join(self.diretorio, "registros.json")
+        self.arquivo_trava = os.path.join(self.diretorio, "indice.lock")
+        os.makedirs(self.diretorio, exist_ok=True)
+
+        self._assinatura = None
+        self._ids: List[str] = []
+        self._metadatas: List[dict] = []
+        self._posicoes: Dict[str, int] = {}
+        self._arquivo_base = ""
+        self._base = np.zeros((0, 0), dtype=np.float32)
+        self._delta = np.zeros((0, 0), dtype=np.float32)
+        self._lido_delta = 0
+        self._registros_delta = 0
+        # Serializa as gravações das threads do processo (sessões do Streamlit que compartilham a instância):
+        # cada gravação lê o estado atual e grava uma versão nova, então duas simultâneas perderiam registros.
+        # Entre processos, a trava é o arquivo indice.lock (ver _travar)
+        self._lock_gravacao = threading.RLock()
+        self._travado = False
+        # Impede que duas threads leiam o mesmo trecho do delta ao mesmo tempo (o registro entraria duas vezes)
+        self._lock_carga = threading.Lock()
+        self._remover_orfaos()
+        self._carregar()
+
+    # Trava o índice para leitura-alteração-gravação: primeiro entre as threads do processo, depois entre processos.
+    # Chamadas aninhadas na mesma thread (ex.: add que compacta) reaproveitam a trava do arquivo.
+    @contextmanager
+    def _travar(self):
+        with self._lock_gravacao:
+            if self._travado:
+                yield
+                return
+            with travar_arquivo(self.arquivo_trava):
+                self._travado = True
+                try:
+                    yield
+                finally:
+                    self._travado = False
+
+    # Remove os arquivos de vetores e de delta que o registros.json não referencia mais (sobras de gravações
+    # interrompidas ou de versões que não puderam ser apagadas no Windows por estarem abertas em outro processo)
+    def _remover_orfaos(self):
+        with self._travar():
+            try:
+                with open(self.arquivo_registros, "r", encoding="utf-8") as arquivo:
+                    arquivo_embeddings = json.load(arquivo).get("arquivo_embeddings") or ""
+            except FileNotFoundError:
+                arquivo_embeddings = ""
+            em_uso = {arquivo_embeddings, self._nome_delta(arquivo_embeddings)}
+            for nome in os.listdir(self.diretorio):
+                orfao = (nome.startswith("embeddings_") and nome.endswith(".npy")) or (nome.startswith("delta_") and nome.endswith(".jsonl"))
+                if (orfao and nome not in em_uso) or nome == "registros.json.tmp":
+                    try:
+                        os.remove(os.path.join(self.diretorio, nome))
+                    except OSError:
+                        pass
+
+    # Nome do arquivo de delta de uma versão dos vetores (embeddings_<id>.npy -> delta_<id>.jsonl)
+    @staticmethod
+    def _nome_delta(arquivo_embeddings: str) -> str:
+        if not arquivo_embeddings:
+            return ""
+        return "delta_" + arquivo_embeddings[len("embeddings_"):-len(".npy")] + ".jsonl"
+
+    # Carrega (ou recarrega, se outro processo gravou) os registros, abre os embeddings por memory-map
+    # e aplica as linhas novas do delta
+    def _carregar(self):
+        with self._lock_carga:
+            try:
+                estado = os.stat(self.arquivo_registros)
+            except FileNotFoundError:
+                return
+            assinatura = (estado.st_mtime_ns, estado.st_size)
+            if assinatura != self._assinatura:
+                with open(self.arquivo_registros, "r", encoding="utf-8") as arquivo:
+                    registros = json.load(arquivo)
+
+                base = np.zeros((0, 0), dtype=np.float32)
+                if registros.get("arquivo_embeddings"):
+                    try:
+                        base = np.load(os.path.join(self.diretorio, registros["arquivo_embeddings"]), mmap_mode="r")
+                    except FileNotFoundError:
+                        # Uma compactação de outro processo substituiu esta versão; a próxima leitura pega a nova
+                        return
+                self._ids = registros["ids"]
+                self._metadatas = registros["metadatas"]
+                self._posicoes = {caso_id: i for i, caso_id in enumerate(self._ids)}
+                self._arquivo_base = registros.get("arquivo_embeddings") or ""
+                self._base = base
+                self._delta = np.zeros((0, base.shape[1] if base.ndim == 2 else 0), dtype=np.float32)
+                self._lido_delta = 0
+                self._registros_delta = 0
+                self._assinatura = assinatura
+            self._ler_delta()
+
+    # Aplica as linhas do delta gravadas depois da última leitura. Só linhas completas (terminadas em \n) são lidas:
+    # a última pode estar sendo escrita por outro processo, ou ter ficado pela metade numa gravação interrompida.
+    def _ler_delta(self):
+        if not self._arquivo_base:
+            return
+        caminho = os.path.join(self.diretorio, self._nome_delta(self._arquivo_base))
+        try:
+            with open(caminho, "rb") as arquivo:
+                arquivo.seek(self._lido_delta)
+                dados = arquivo.read()
+        except FileNotFoundError:
+            return
+        completos = dados.rfind(b"\n") + 1
+        if not completos:
+            return
+
+        ids, metadatas, posicoes, vetores = list(self._ids), list(self._metadatas), dict(self._posicoes), [self._delta]
+        for linha in dados[:completos].splitlines():
+            operacao = json.loads(linha)
+            if "embeddings" in operacao:
+                for caso_id in operacao["ids"]:
+                    posicoes[caso_id] = len(ids)
+                    ids.append(caso_id)
+                metadatas.extend(operacao["metadatas"])
+                vetores.append(np.frombuffer(base64.b64decode(operacao["embeddings"]), dtype=np.float32).reshape(len(operacao["ids"]), -1))
+            else:
+                for caso_id, metadata in zip(operacao["ids"], operacao["metadatas"]):
+                    metadatas[posicoes[caso_id]] = {**metadatas[posicoes[caso_id]], **metadata}
+            self._registros_delta += len(operacao["ids"])
+
+        # As listas são trocadas (não alteradas no lugar), então uma busca em andamento continua com a versão que leu
+        self._ids, self._metadatas, self._posicoes = ids, metadatas, posicoes
+        if len(vetores) > 1:
+            self._delta = np.concatenate([v for v in vetores if v.size], axis=0)
+        self._lido_delta += completos
+
+    # Acrescenta uma operação ao delta (com o índice travado) e a aplica na memória
+    def _anexar_delta(self, operacao: dict):
+        caminho = os.path.join(self.diretorio, self._nome_delta(self._arquivo_base))
+        with open(caminho, "ab") as arquivo:
+            # Descarta o resto de uma linha deixada pela metade por um processo interrompido
+            if arquivo.tell() > self._lido_delta:
+                arquivo.truncate(self._lido_delta)
+            arquivo.write((json.dumps(operacao, ensure_ascii=False) + "\n").encode("utf-8"))
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        self._carregar()
+
+    # Dimensão dos vetores do índice (0 se ainda está vazio)
+    def _dimensao(self) -> int:
+        for matriz in (self._base, self._delta):
+            if matriz.ndim == 2 and matriz.shape[1]:
+                return matriz.shape[1]
+        return 0
+
+    # Vetores das posições informadas (a base fica no .npy e as inclusões recentes, no delta)
+    def _vetores(self, posicoes) -> np.ndarray:
+        posicoes = np.asarray(posicoes, dtype=np.int64)
+        resultado = np.empty((len(posicoes), self._dimensao()), dtype=np.float32)
+        na_base = posicoes < len(self._base)
+        resultado[na_base] = self._base[posicoes[na_base]]
+        resultado[~na_base] = self._delta[posicoes[~na_base] - len(self._base)]
+        return resultado
+
+    # Percorre os vetores em blocos de até TAMANHO_BLOCO_BUSCA, com a posição inicial de cada bloco
+    def _blocos(self) -> Iterator[Tuple[int, np.ndarray]]:
+        base, delta = self._base, self._delta
+        for deslocamento, matriz in ((0, base), (len(base), delta)):
+            for inicio in range(0, len(matriz), TAMANHO_BLOCO_BUSCA):
+                yield deslocamento + inicio, matriz[inicio:inicio + TAMANHO_BLOCO_BUSCA]
+
+    # Substitui atomicamente o JSON de registros (IDs, metadados e nome do arquivo de vetores em uso)
+    def _gravar_registros(self, ids: List[str], metadatas: List[dict], arquivo_embeddings: str):
+        temporario = self.arquivo_registros + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump({"ids": ids, "metadatas": metadatas, "arquivo_embeddings": arquivo_embeddings}, arquivo, ensure_ascii=False)
+        os.replace(temporario, self.arquivo_registros)
+
+        self._assinatura = None
+        self._carregar()
+
+    # Grava uma nova versão do índice, já sem delta. O .npy recebe um nome novo e o JSON (que aponta para ele)
+    # é substituído atomicamente, então leitores nunca veem IDs e vetores de versões diferentes.
+    def _gravar(self, ids: List[str], metadatas: List[dict], embeddings: np.ndarray):
+        anterior = self._arquivo_base
+
+        arquivo_embeddings = f"embeddings_{uuid.uuid4().hex}.npy"
+        np.save(os.path.join(self.diretorio, arquivo_embeddings), np.ascontiguousarray(embeddings, dtype=np.float32))
+        self._gravar_registros(ids, metadatas, arquivo_embeddings)
+
+        # Remove a versão anterior dos vetores e seu delta (no Windows o .npy pode estar aberto por outro processo;
+        # nesse caso fica para _remover_orfaos)
+        if anterior and anterior != arquivo_embeddings:
+            for nome in (anterior, self._nome_delta(anterior)):
+                try:
+                    os.remove(os.path.join(self.diretorio, nome))
+                except OSError:
+                    pass
+
+    # Incorpora o delta num .npy novo
+    def compactar(self):
+        with self._travar():
+            self._carregar()
+            if self._registros_delta:
+                self._gravar(self._ids, self._metadatas, self._vetores(range(len(self._ids))))
+
+    def count(self) -> int:
+        self._carregar()
+        return len(self._ids)
+
+    # Adiciona vetores ao índice (IDs já existentes geram erro, como no ChromaDB)
+    def add(self, embeddings, ids: List[str], metadatas: Optional[List[dict]] = None, documents=None):
+        with self._travar():
+            self._carregar()
+            repetidos = [caso_id for caso_id in ids if caso_id in self._posicoes]
+            if repetidos:
+                raise ValueError(f"IDs já existentes no índice: {repetidos}")
+
+            novos = normalizar(embeddings)
+            metadatas = metadatas or [{} for _ in ids]
+            if not self._arquivo_base:
+                # Índice novo: grava a primeira versão do .npy
+                self._gravar(list(ids), list(metadatas), novos)
+                return
+            self._anexar_delta({
+                "ids": list(ids),
+                "metadatas": list(metadatas),
+                "embeddings": base64.b64encode(novos.tobytes()).decode("ascii"),
+            })
+            if self._registros_delta >= TAMANHO_MAXIMO_DELTA:
+                self.compactar()
+
+    # Atualiza os metadados (e, opcionalmente, os vetores) de registros existentes
+    def update(self, ids: List[str], metadatas: Optional[List[dict]] = None, embeddings=None):
+        with self._travar():
+            self._carregar()
+            posicoes = [self._posicoes[caso_id] for caso_id in ids]
+            if embeddings is None:
+                # Só os metadados mudaram: os vetores continuam nos mesmos arquivos
+                if metadatas is not None:
+                    self._anexar_delta({"ids": list(ids), "metadatas": list(metadatas)})
+                    if self._registros_delta >= TAMANHO_MAXIMO_DELTA:
+                        self.compactar()
+                return
+
+            metadatas_novos = list(self._metadatas)
+            if metadatas is not None:
+                for posicao, metadata in zip(posicoes, metadatas):
+                    metadatas_novos[posicao] = {**metadatas_novos[posicao], **metadata}
+            vetores = self._vetores(range(len(self._ids)))
+            vetores[posicoes] = normalizar(embeddings)
+            self._gravar(self._ids, metadatas_novos, vetores)
+
+    # Remove registros do índice
+    def delete(self, ids: List[str]):
+        with self._travar():
+            self._carregar()
+            remover = {self._posicoes[caso_id] for caso_id in ids if caso_id in self._posicoes}
+            if not remover:
+                return
+            manter = [p for p in range(len(self._ids)) if p not in remover]
+            self._gravar(
+                [self._ids[p] for p in manter],
+                [self._metadatas[p] for p in manter],
+                self._vetores(manter) if manter else np.zeros((0, self._dimensao()), dtype=np.float32)
+            )
+
+    # Retorna a máscara dos registros cujos metadados atendem ao filtro (apenas igualdade, ex.: {"validado": True})
+    @staticmethod
+    def _filtrar(metadatas: List[dict], where: Optional[dict]) -> Optional[np.ndarray]:
+        if not where:
+            return None
+        return np.array([all(metadata.get(chave) == valor for chave, valor in where.items()) for metadata in metadatas], dtype=bool)
+
+    # Retorna registros do índice no mesmo formato do ChromaDB (listas de ids, metadatas e embeddings)
+    def get(self, ids: Optional[List[str]] = None, limit: Optional[int] = None, offset: Optional[int] = None, include=("metadatas",)):
+        self._carregar()
+        # Lê a versão atual de uma vez, sem que outra thread aplique um delta novo no meio
+        with self._lock_carga:
+            if ids is not None:
+                posicoes = [self._posicoes[caso_id] for caso_id in ids if caso_id in self._posicoes]
+            else:
+                inicio = offset or 0
+                fim = len(self._ids) if limit is None else inicio + limit
+                posicoes = list(range(inicio, min(fim, len(self._ids))))
+
+            resultado = {"ids": [self._ids[p] for p in posicoes], "metadatas": None, "embeddings": None}
+            if "metadatas" in include:
+                resultado["metadatas"] = [self._metadatas[p] for p in posicoes]
+            if "embeddings" in include:
+                resultado["embeddings"] = self._vetores(posicoes) if posicoes else np.zeros((0, 0), dtype=np.float32)
+        return resultado
+
+    # Busca os n_results vizinhos mais próximos de cada consulta (todas as consultas em uma única multiplicação por bloco)
+    def query(self, query_embeddings, n_results: int = 10, include=("metadatas", "distances"), where: Optional[dict] = None):
+        self._carregar()
+        # Usa a versão lida agora até o fim, mesmo que outra thread aplique um delta novo durante a busca
+        with self._lock_carga:
+            ids, metadatas, blocos = self._ids, self._metadatas, list(self._blocos())
+        consultas = normalizar(query_embeddings)
+        total = len(ids)
+        mascara = self._filtrar(metadatas, where)
+        k = min(n_results, total if mascara is None else int(mascara.sum()))
+
+        if k == 0:
+            vazios = [[] for _ in range(consultas.shape[0])]
+            return {"ids": vazios, "metadatas": vazios, "distances": vazios}
+
+        melhores_similaridades = np.full((consultas.shape[0], 0), -np.inf, dtype=np.float32)
+        melhores_posicoes = np.zeros((consultas.shape[0], 0), dtype=np.int64)
+
+        # Percorre a base (e o delta) em blocos, mantendo apenas os k melhores candidatos de cada consulta
+        for inicio, bloco in blocos:
+            similaridades_bloco = consultas @ bloco.T
+            if mascara is not None:
+                similaridades_bloco[:, ~mascara[inicio:inicio + bloco.shape[0]]] = -np.inf
+            similaridades = np.concatenate([melhores_similaridades, similaridades_bloco], axis=1)
+            posicoes = np.concatenate(
+                [melhores_posicoes, np.broadcast_to(np.arange(inicio, inicio + bloco.shape[0]), (consultas.shape[0], bloco.shape[0]))],
+                axis=1
+            )
+            candidatos = min(k, similaridades.shape[1])
+            selecionados = np.argpartition(-similaridades, candidatos - 1, axis=1)[:, :candidatos]
+            melhores_similaridades = np.take_along_axis(similaridades, selecionados, axis=1)
+            melhores_posicoes = np.take_along_axis(posicoes, selecionados, axis=1)
+
+        # Ordena os k melhores de cada consulta (argpartition não garante ordem)
+        ordem = np.argsort(-melhores_similaridades, axis=1)
+        melhores_similaridades = np.take_along_axis(melhores_similaridades, ordem, axis=1)
+        melhores_posicoes = np.take_along_axis(melhores_posicoes, ordem, axis=1)
+
+        resultado = {"ids": [[ids[p] for p in linha] for linha in melhores_posicoes]}
+        resultado["metadatas"] = [[metadatas[p] for p in linha] for linha in melhores_posicoes] if "metadatas" in include else None
+        # Distância de cosseno, como na coleção ChromaDB configurada com hnsw:space = cosine
+        resultado["distances"] = (1.0 - melhores_similaridades).tolist() if "distances" in include else None
+        return resultado
@@ -0,0 +1,303 @@
+# Memória dos servidores Streamlit: medições por etapa, amostras periódicas e estado limitado das sessões
+#
+# Os aplicativos ficam abertos durante todo o turno, e todas as sessões (abas do navegador) rodam no mesmo processo.
+# - MonitorMemoria.etapa("nome") mede cada etapa de uma execução: tempo, RSS atual do processo ao final e variação do RSS e,
+#   com o tracemalloc ligado (TRIAGEM_TRACEMALLOC=<quadros de pilha>), a variação da memória alocada pelo Python.
+#   Com várias sessões simultâneas, as variações incluem o que as outras alocaram; as médias por etapa mostram onde cresce.
+# - O monitor grava a cada TRIAGEM_INTERVALO_MEMORIA_S segundos o RSS, a memória alocada, as sessões com estado guardado
+#   e, com o tracemalloc, as linhas de código cuja memória mais cresceu desde o início do servidor (diferença entre snapshots).
+# - EstadoSessoes guarda o estado pesado de cada sessão fora do st.session_state, descartando as sessões ociosas há mais de
+#   TRIAGEM_SESSAO_OCIOSA_MIN minutos e as mais antigas além de TRIAGEM_MAX_SESSOES (abas esquecidas abertas não acumulam memória).
+#
+# O RSS é lido do /proc no Linux, com GetProcessMemoryInfo no Windows e com o psutil (se instalado) nos demais sistemas;
+# sem nenhum deles (ex.: macOS sem psutil), as medições são gravadas sem o RSS e o aplicativo segue normalmente.
+#
+# As medições ficam nas tabelas memoria_etapas e memoria_amostras do banco de validação e aparecem no Dashboard do painel.
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Optional
+
+# Quadros de pilha guardados pelo tracemalloc em cada alocação (0 = desligado; ligar deixa o servidor mais lento)
+QUADROS_TRACEMALLOC = int(os.environ.get("TRIAGEM_TRACEMALLOC", "0"))
+
+# Segundos entre duas amostras de memória (e entre duas gravações das medições por etapa)
+INTERVALO_AMOSTRAS = float(os.environ.get("TRIAGEM_INTERVALO_MEMORIA_S", "60"))
+
+# Com o tracemalloc, um snapshot (comparado com o do início) a cada tantas amostras: o snapshot percorre toda a memória alocada
+AMOSTRAS_POR_SNAPSHOT = 10
+
+# Linhas de código com maior crescimento guardadas em cada snapshot
+LINHAS_SNAPSHOT = 15
+
+# Minutos sem atividade após os quais o estado de uma sessão é descartado, e quantidade máxima de sessões com estado
+SESSAO_OCIOSA_MIN = float(os.environ.get("TRIAGEM_SESSAO_OCIOSA_MIN", "30"))
+MAX_SESSOES = int(os.environ.get("TRIAGEM_MAX_SESSOES", "200"))
+
+# Dias de medições mantidos no banco
+DIAS_RETENCAO = 7
+
+logger = logging.getLogger(__name__)
+
+# Função para ler a memória residente (RSS) atual do processo, em MB (None se não for possível ler neste sistema)
+def rss_mb() -> Optional[float]:
+    try:
+        if os.name == "nt":
+            return _rss_windows()
+        with open("/proc/self/status", "r") as arquivo:
+            for linha in arquivo:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1]) / 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    # Outros sistemas (ex.: macOS): psutil, se instalado. O ru_maxrss do módulo resource não serve: é o pico, não o RSS atual.
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except Exception:
+        return None
+
+# Função para ler o RSS (working set) do processo no Windows, via GetProcessMemoryInfo
+def _rss_windows() -> Optional[float]:
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    contadores = PROCESS_MEMORY_COUNTERS()
+    contadores.cb = ctypes.sizeof(PROCESS_MEMORY_COUNTERS)
+    # K32GetProcessMemoryInfo fica no kernel32 a partir do Windows 7 (antes, GetProcessMemoryInfo do psapi)
+    kernel32 = ctypes.WinDLL("kernel32")
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    funcao = getattr(kernel32, "K32GetProcessMemoryInfo", None) or ctypes.WinDLL("psapi").GetProcessMemoryInfo
+    funcao.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+    funcao.restype = wintypes.BOOL
+    if not funcao(kernel32.GetCurrentProcess(), ctypes.byref(contadores), contadores.cb):
+        return None
+    return contadores.WorkingSetSize / (1024 * 1024)
+
+_aviso_rss = threading.Event()
+
+# Função para ler o RSS sem nunca interromper o aplicativo: falhas viram None, com um aviso no log só na primeira vez
+def _rss_seguro() -> Optional[float]:
+    try:
+        valor = rss_mb()
+    except Exception:
+        if not _aviso_rss.is_set():
+            logger.exception("Falha ao ler a memória residente do processo")
+        valor = None
+    if valor is None and not _aviso_rss.is_set():
+        _aviso_rss.set()
+        logger.warning("Memória residente (RSS) indisponível neste sistema; as medições seguem sem o RSS (instale o psutil)")
+    return valor
+
+# Função para ler a memória alocada pelo Python e rastreada pelo tracemalloc, em MB (None se ele estiver desligado)
+def alocado_mb() -> Optional[float]:
+    if not tracemalloc.is_tracing():
+        return None
+    return tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+
+# Função para criar as tabelas das medições de memória, se não existirem, e apagar as mais antigas que DIAS_RETENCAO
+def init_tabelas_memoria(caminho_bd: str):
+    conn = sqlite3.connect(caminho_bd)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS memoria_etapas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        data_hora TEXT NOT NULL,
+        processo TEXT NOT NULL,
+        etapa TEXT NOT NULL,
+        duracao_ms REAL NOT NULL,
+        rss_mb REAL,
+        variacao_rss_mb REAL,
+        variacao_alocado_mb REAL
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS memoria_amostras (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        data_hora TEXT NOT NULL,
+        processo TEXT NOT NULL,
+        rss_mb REAL,
+        alocado_mb REAL,
+        pico_alocado_mb REAL,
+        sessoes INTEGER,
+        sessoes_descartadas INTEGER,
+        maiores_crescimentos TEXT
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_memoria_etapas_data_hora ON memoria_etapas (data_hora)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_memoria_amostras_data_hora ON memoria_amostras (data_hora)")
+    for tabela in ("memoria_etapas", "memoria_amostras"):
+        conn.execute(f"DELETE FROM {tabela} WHERE data_hora < datetime('now', 'localtime', ?)", (f"-{DIAS_RETENCAO} days",))
+    conn.commit()
+    conn.close()
+
+# Estado das sessões guardado fora do st.session_state, com descarte das sessões ociosas e limite de quantidade.
+# Compartilhado por todas as sessões do servidor (criado com st.cache_resource); cada sessão acessa só o seu ID.
+class EstadoSessoes:
+    def __init__(self, ociosa_min: float = SESSAO_OCIOSA_MIN, maximo: int = MAX_SESSOES):
+        self.ociosa_s = ociosa_min * 60
+        self.maximo = maximo
+        self.descartadas = 0
+        self._estados: "OrderedDict[str, tuple]" = OrderedDict()  # ID da sessão -> (último acesso, estado), do mais antigo ao mais recente
+        self._lock = threading.Lock()
+
+    # Retorna o estado da sessão (None se não houver ou se já foi descartado) e renova seu último acesso
+    def obter(self, id_sessao: str) -> Any:
+        with self._lock:
+            self._expurgar()
+            item = self._estados.pop(id_sessao, None)
+            if item is None:
+                return None
+            self._estados[id_sessao] = (time.monotonic(), item[1])
+            return item[1]
+
+    def guardar(self, id_sessao: str, estado: Any):
+        with self._lock:
+            self._estados.pop(id_sessao, None)
+            self._estados[id_sessao] = (time.monotonic(), estado)
+            self._expurgar()
+
+    def descartar(self, id_sessao: str):
+        with self._lock:
+            self._estados.pop(id_sessao, None)
+
+    # Descarta as sessões ociosas e as mais antigas além do máximo; retorna quantas sessões continuam com estado
+    def expurgar(self) -> int:
+        with self._lock:
+            self._expurgar()
+            return len(self._estados)
+
+    def _expurgar(self):
+        limite = time.monotonic() - self.ociosa_s
+        while self._estados and (len(self._estados) > self.maximo or next(iter(self._estados.values()))[0] < limite):
+            self._estados.popitem(last=False)
+            self.descartadas += 1
+
+    def __len__(self):
+        return len(self._estados)
+
+# Monitor de memória de um processo (um por servidor Streamlit, criado com st.cache_resource)
+class MonitorMemoria:
+    def __init__(self, processo: str, caminho_bd: str, sessoes: Optional[EstadoSessoes] = None,
+                 intervalo: float = INTERVALO_AMOSTRAS, quadros_tracemalloc: int = QUADROS_TRACEMALLOC):
+        self.processo = f"{processo}:{os.getpid()}"
+        self.caminho_bd = caminho_bd
+        self.sessoes = sessoes
+        self.intervalo = intervalo
+        # Medições por etapa aguardando gravação (limitadas, caso o banco fique indisponível)
+        self._etapas = deque(maxlen=10000)
+        self._snapshot_inicial = None
+        self._amostras = 0
+
+        init_tabelas_memoria(caminho_bd)
+        if quadros_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start(quadros_tracemalloc)
+        if tracemalloc.is_tracing():
+            self._snapshot_inicial = self._snapshot()
+        threading.Thread(target=self._amostrar, name=f"monitor-memoria-{processo}", daemon=True).start()
+
+    # Mede uma etapa de uma execução do script (ex.: with monitor.etapa("embedding"): ...).
+    # A medição nunca interrompe a etapa: sem RSS disponível, grava só o tempo e a memória alocada.
+    @contextmanager
+    def etapa(self, nome: str):
+        inicio = time.perf_counter()
+        rss_inicio, alocado_inicio = _rss_seguro(), alocado_mb()
+        try:
+            yield
+        finally:
+            try:
+                rss_fim, alocado_fim = _rss_seguro(), alocado_mb()
+                self._etapas.append((
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    self.processo,
+                    nome,
+                    (time.perf_counter() - inicio) * 1000,
+                    rss_fim,
+                    rss_fim - rss_inicio if rss_inicio is not None and rss_fim is not None else None,
+                    alocado_fim - alocado_inicio if alocado_inicio is not None and alocado_fim is not None else None,
+                ))
+            except Exception:
+                logger.exception("Falha ao medir a etapa %s", nome)
+
+    @staticmethod
+    def _snapshot():
+        # Desconsidera as alocações do próprio tracemalloc e do mecanismo de importação
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+
+    # Linhas de código com maior crescimento de memória desde o snapshot do início do servidor
+    def maiores_crescimentos(self, limite: int = LINHAS_SNAPSHOT) -> list:
+        if self._snapshot_inicial is None or not tracemalloc.is_tracing():
+            return []
+        diferencas = self._snapshot().compare_to(self._snapshot_inicial, "lineno")
+        return [
+            {
+                "local": f"{diferenca.traceback[0].filename}:{diferenca.traceback[0].lineno}",
+                "tamanho_kb": round(diferenca.size / 1024, 1),
+                "crescimento_kb": round(diferenca.size_diff / 1024, 1),
+                "blocos": diferenca.count,
+            }
+            for diferenca in diferencas[:limite]
+        ]
+
+    def _amostrar(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                self.gravar_amostra()
+            except Exception:
+                # O monitor nunca interrompe o aplicativo (ex.: banco bloqueado): a próxima amostra tenta de novo
+                logger.debug("Falha ao gravar a amostra de memória", exc_info=True)
+
+    # Grava as medições por etapa acumuladas e uma amostra da memória do processo
+    def gravar_amostra(self):
+        self._amostras += 1
+        crescimentos = self.maiores_crescimentos() if self._amostras % AMOSTRAS_POR_SNAPSHOT == 0 else []
+        pico = tracemalloc.get_traced_memory()[1] / (1024 * 1024) if tracemalloc.is_tracing() else None
+        sessoes = self.sessoes.expurgar() if self.sessoes is not None else None
+        etapas = [self._etapas.popleft() for _ in range(len(self._etapas))]
+
+        conn = sqlite3.connect(self.caminho_bd, timeout=5)
+        try:
+            conn.executemany(
+                "INSERT INTO memoria_etapas (data_hora, processo, etapa, duracao_ms, rss_mb, variacao_rss_mb, variacao_alocado_mb) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                etapas
+            )
+            conn.execute(
+                "INSERT INTO memoria_amostras (data_hora, processo, rss_mb, alocado_mb, pico_alocado_mb, sessoes, sessoes_descartadas, "
+                "maiores_crescimentos) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), self.processo, _rss_seguro(), alocado_mb(), pico, sessoes,
+                 self.sessoes.descartadas if self.sessoes is not None else None,
+                 json.dumps(crescimentos, ensure_ascii=False) if crescimentos else None)
+            )
+            conn.commit()
+        except sqlite3.Error:
+            # As medições por etapa voltam para a fila e são gravadas na próxima amostra
+            self._etapas.extendleft(reversed(etapas))
+            raise
+        finally:
+            conn.close()
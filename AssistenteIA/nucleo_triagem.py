@@ -0,0 +1,103 @@
+# Etapas da triagem sem a interface do Streamlit: montagem do prompt enviado ao modelo e envio da triagem para
+# validação. Usado pelo aplicativo principal (AppTriagem.py) e pelo teste de carga (teste_carga.py).
+from array import array
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from banco_validacao import salvar_para_validacao
+from banco_vetorial import indexar_entrada_triagem, modelo_da_colecao
+from unidades import Unidade, cliente_chroma_da_unidade
+
+# Mensagem de sistema fixa: define o comportamento do assistente como um profissional da saúde
+MENSAGEM_SISTEMA = "Você é um profissional de saúde responsável por analisar sintomas clínicos no Hospital de Clínicas de Ijuí. Seu objetivo é classificar o diagnóstico mais provável com base na CID-10, informando o código correspondente e sugerindo condutas clínicas iniciais apropriadas ao caso. Não inclua informações irrelevantes ou fora do contexto clínico."
+
+# Solicita resposta estruturada com classificação, justificativa e conduta
+INSTRUCOES_RESPOSTA = (
+    "Com base nos sintomas descritos e nos casos similares fornecidos, elabore uma resposta estruturada contendo as seguintes seções:\n\n"
+    "Diagnóstico\n"
+    "Nome (CID-10: [CÓDIGO]): [Nome da condição diagnosticada]\n\n"
+    "Classificação de Risco\n"
+    "Cor: [Vermelha | Laranja | Amarela | Verde | Azul]\n"
+    "Justificativa: [Explique clinicamente os motivos da classificação com base nos sintomas, sinais vitais e idade do paciente]\n\n"
+    "Conduta Clínica Inicial\n"
+    "Encaminhamento: [Para onde o paciente deve ser encaminhado]\n"
+    "Objetivo: [O que deve ser feito inicialmente com o paciente: exames, estabilização, etc.]\n\n"
+    "Responda de forma objetiva, clara, curta e seguindo linguagem médica. Evite informações desnecessárias ou fora do contexto clínico."
+)
+
+# Mensagem enviada ao modelo (mesmos campos role/content do ChatMessage do LlamaIndex, que o gateway aceita)
+class Mensagem(NamedTuple):
+    role: str
+    content: str
+
+# Função para montar a sequência de mensagens enviada ao modelo de linguagem
+def montar_mensagens(sintomas: str, casos_semelhantes: List[str]) -> List[Mensagem]:
+    # Monta o prompt com os sintomas e os casos similares
+    input_text = f"Sintomas do novo caso: {sintomas}\n\nCasos Similares: {' '.join(casos_semelhantes)}"
+    return [
+        # Mensagem inicial: define o comportamento do assistente como um profissional da saúde
+        Mensagem("system", MENSAGEM_SISTEMA),
+        # Mensagem com os sintomas e os casos similares
+        Mensagem("user", input_text),
+        Mensagem("user", INSTRUCOES_RESPOSTA),
+    ]
+
+# Estado de uma triagem guardado entre as execuções do script, até o envio para validação. Guarda só o texto da resposta
+# e suas seções (não o objeto de resposta do modelo) e o vetor dos sintomas em float32 (1,5 KB em vez de ~12 KB numa lista),
+# com o modelo de embedding que o calculou.
+class TriagemSessao(NamedTuple):
+    sintomas: str
+    resposta: str
+    diagnostico: str
+    classificacao: str
+    conduta: str
+    embedding: Optional[array]
+    unidade: str
+    modelo: str
+
+# Função para extrair o trecho da resposta entre dois títulos de seção
+def extrair_bloco(texto: str, inicio: str, fim: Optional[str] = None) -> str:
+    try:
+        start = texto.index(inicio)
+        end = texto.index(fim) if fim else len(texto)
+        return texto[start + len(inicio):end].strip()
+    except ValueError:
+        return "Informação não disponível."
+
+# Função para montar o estado da triagem a partir da resposta do modelo
+def criar_triagem_sessao(sintomas: str, resposta, embedding: Optional[List[float]], unidade: str, modelo: str) -> TriagemSessao:
+    texto = str(resposta)
+    return TriagemSessao(
+        sintomas=sintomas,
+        resposta=texto,
+        diagnostico=extrair_bloco(texto, "Diagnóstico", "Classificação de Risco"),
+        classificacao=extrair_bloco(texto, "Classificação de Risco", "Conduta Clínica Inicial"),
+        conduta=extrair_bloco(texto, "Conduta Clínica Inicial"),
+        embedding=array("f", embedding) if embedding is not None else None,
+        unidade=unidade,
+        modelo=modelo,
+    )
+
+# Função para enviar uma triagem para validação: grava no banco da unidade e indexa o vetor dos sintomas
+# (para o painel mostrar triagens semelhantes já validadas). Retorna o ID da triagem e o erro da indexação, se houver;
+# a falha na indexação não impede o envio. Se a coleção trocou de modelo (reindexacao.py) entre o diagnóstico e o envio,
+# o vetor guardado não é comparável com os da coleção e os sintomas são convertidos de novo com o modelo atual.
+def enviar_para_validacao(sintomas: str, resposta, embedding: Optional[Sequence[float]], unidade: Unidade,
+                          modelo: str) -> Tuple[str, Optional[Exception]]:
+    triagem_id = salvar_para_validacao(sintomas, resposta, unidade.caminho_bd)
+
+    erro_indexacao = None
+    if embedding is not None:
+        try:
+            modelo_atual = modelo_da_colecao(unidade.colecao_entradas)
+            if modelo_atual != modelo:
+                from embeddings import embed_text
+                embedding = embed_text(sintomas, modelo_atual)
+            indexar_entrada_triagem(
+                triagem_id,
+                list(embedding),
+                chroma_client=cliente_chroma_da_unidade(unidade),
+                nome=unidade.colecao_entradas,
+            )
+        except Exception as e:
+            erro_indexacao = e
+    return triagem_id, erro_indexacao
@@ -0,0 +1,73 @@
+# Observador dos eventos das triagens pendentes (tabela eventos_triagem)
+#
+# Um único observador por servidor do painel lê os eventos novos e os mantém em memória; as sessões dos
+# especialistas pedem apenas "o que aconteceu depois do evento N" sem consultar o SQLite cada uma.
+# A leitura é feita sob demanda, no máximo uma vez a cada `intervalo` segundos, e só consulta a tabela quando
+# PRAGMA data_version indica que outra conexão alterou o banco.
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+
+from banco_validacao import CAMINHO_BD, ler_eventos, ultimo_evento
+
+# Intervalo mínimo, em segundos, entre duas leituras do banco
+INTERVALO_OBSERVADOR = float(os.environ.get("TRIAGEM_INTERVALO_EVENTOS", "1.0"))
+
+# Quantidade de eventos mantidos em memória; sessões que ficarem mais atrasadas que isso recarregam a lista inteira
+CAPACIDADE_EVENTOS = 1000
+
+class ObservadorEventos:
+    def __init__(self, caminho_bd: str = CAMINHO_BD, intervalo: float = INTERVALO_OBSERVADOR, capacidade: int = CAPACIDADE_EVENTOS):
+        self.caminho_bd = caminho_bd
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._eventos = deque(maxlen=capacidade)
+        # Conexão própria, usada apenas para leitura pelas threads das sessões (sempre sob o lock)
+        self._conn = sqlite3.connect(caminho_bd, timeout=30, check_same_thread=False)
+        self._versao_banco = None
+        self._ultima_leitura = 0.0
+        # Todos os eventos com seq maior que _cobertura estão em memória
+        self._ultimo_seq = ultimo_evento(self._conn)
+        self._cobertura = self._ultimo_seq
+
+    # Lê os eventos novos do banco (respeitando o intervalo mínimo, a menos que forcar=True)
+    def atualizar(self, forcar: bool = False):
+        with self._lock:
+            agora = time.monotonic()
+            if not forcar and agora - self._ultima_leitura < self.intervalo:
+                return
+            self._ultima_leitura = agora
+
+            # data_version só muda quando outra conexão confirma uma alteração no banco
+            versao = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if versao == self._versao_banco:
+                return
+            self._versao_banco = versao
+
+            while True:
+                novos = ler_eventos(self._conn, self._ultimo_seq, self._eventos.maxlen)
+                for evento in novos:
+                    if len(self._eventos) == self._eventos.maxlen:
+                        self._cobertura = self._eventos[0]["seq"]
+                    self._eventos.append(evento)
+                if novos:
+                    self._ultimo_seq = novos[-1]["seq"]
+                if len(novos) < self._eventos.maxlen:
+                    break
+
+    # Função para obter o número do último evento conhecido (usado ao carregar a lista completa)
+    def ultimo_seq(self) -> int:
+        self.atualizar(forcar=True)
+        with self._lock:
+            return self._ultimo_seq
+
+    # Retorna os eventos posteriores a `seq`, ou None se eles já saíram da memória (a lista deve ser recarregada)
+    def eventos_desde(self, seq: int, forcar: bool = False) -> Optional[List[dict]]:
+        self.atualizar(forcar)
+        with self._lock:
+            if seq < self._cobertura:
+                return None
+            return [evento for evento in self._eventos if evento["seq"] > seq]
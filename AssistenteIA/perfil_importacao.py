@@ -0,0 +1,87 @@
+# Relatório do tempo de importação dos aplicativos (python -X importtime)
+#
+# Mede, em um processo Python novo, quanto custam as importações feitas no topo de cada aplicativo
+# (o que a tela de login e o Dashboard pagam antes de exibir qualquer coisa) e quanto custam as
+# dependências pesadas que só devem ser importadas nas páginas que precisam delas.
+#
+# Uso pela linha de comando (a partir da pasta AssistenteIA):
+#   python perfil_importacao.py
+#   python perfil_importacao.py --top 20 --limite 1.0
+import argparse
+import ast
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+# Aplicativos analisados
+APLICATIVOS = ["AppTriagem.py", "AppAdminMedico.py"]
+
+# Dependências pesadas que devem ficar fora das importações de topo
+DEPENDENCIAS_PESADAS = ["pandas", "chromadb", "sentence_transformers", "llama_index.core", "numpy"]
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Função para listar as importações feitas no topo do arquivo (fora de funções e blocos condicionais)
+def importacoes_de_topo(arquivo: str) -> List[str]:
+    with open(os.path.join(DIRETORIO, arquivo), "r", encoding="utf-8") as f:
+        codigo = f.read()
+    arvore = ast.parse(codigo)
+    return [ast.get_source_segment(codigo, no) for no in arvore.body if isinstance(no, (ast.Import, ast.ImportFrom))]
+
+# Função para executar um trecho de código com -X importtime e retornar (self_us, cumulativo_us, nivel, modulo)
+def medir_importacao(codigo: str) -> Tuple[List[Tuple[int, int, int, str]], str]:
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo],
+        cwd=DIRETORIO, capture_output=True, text=True
+    )
+    registros = []
+    for linha in processo.stderr.splitlines():
+        if not linha.startswith("import time:") or "self [us]" in linha:
+            continue
+        proprio, cumulativo, nome = linha[len("import time:"):].split("|")
+        # A indentação do nome indica o nível de aninhamento (nível 0 = importado diretamente pelo código)
+        nivel = (len(nome) - len(nome.lstrip()) - 1) // 2
+        registros.append((int(proprio), int(cumulativo), nivel, nome.strip()))
+
+    erro = ""
+    if processo.returncode != 0:
+        erro = processo.stderr.strip().splitlines()[-1] if processo.stderr.strip() else "erro desconhecido"
+    return registros, erro
+
+# Função para somar o tempo total das importações de nível 0, em segundos
+def tempo_total(registros) -> float:
+    return sum(cumulativo for _, cumulativo, nivel, _ in registros if nivel == 0) / 1e6
+
+def exibir_relatorio(titulo: str, registros, erro: str, top: int):
+    print(f"\n== {titulo}: {tempo_total(registros):.3f}s")
+    if erro:
+        print(f"   (importação interrompida: {erro})")
+    mais_lentos = sorted(registros, key=lambda r: r[1], reverse=True)[:top]
+    for _, cumulativo, nivel, nome in mais_lentos:
+        print(f"   {cumulativo / 1000:>9.1f} ms  {'  ' * nivel}{nome}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Perfil do tempo de importação dos aplicativos")
+    parser.add_argument("--top", type=int, default=15, help="Quantidade de módulos mais lentos exibidos")
+    parser.add_argument("--limite", type=float, default=None, help="Falha (código 1) se as importações de topo de algum aplicativo passarem deste tempo, em segundos")
+    args = parser.parse_args()
+
+    excedeu = False
+    for aplicativo in APLICATIVOS:
+        registros, erro = medir_importacao("\n".join(importacoes_de_topo(aplicativo)))
+        exibir_relatorio(f"Importações de topo de {aplicativo}", registros, erro, args.top)
+        if args.limite is not None and tempo_total(registros) > args.limite:
+            excedeu = True
+
+    print("\nDependências pesadas (carregadas apenas nas páginas que precisam delas):")
+    for modulo in DEPENDENCIAS_PESADAS:
+        registros, erro = medir_importacao(f"import {modulo}")
+        print(f"   {tempo_total(registros):>7.3f}s  {modulo}{'  (não instalado)' if erro else ''}")
+
+    if excedeu:
+        print(f"\nAs importações de topo passaram do limite de {args.limite:.2f}s.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+# Troca do modelo de embedding com reindexação em lotes, retomável
+#
+# Vetores de modelos diferentes não são comparáveis, então trocar o modelo (ex.: por um multilíngue, já que os
+# textos são em português) exige recalcular todos os vetores da unidade: a base de casos (triagem_<unidade>) e os
+# vetores das triagens enviadas (triagem_<unidade>_entradas). Cada modelo grava em coleções próprias, com o nome
+# do modelo no nome da coleção (ver banco_vetorial.nome_versionado). Enquanto a reindexação roda, os aplicativos
+# continuam consultando as coleções ativas (e o modelo delas); ao final, colecoes_ativas.json é regravado de uma vez
+# e as duas coleções passam a apontar para o novo modelo.
+#
+# Os textos são lidos em lotes (casos.txt e casos validados registrados no SQLite; sintomas das triagens no SQLite;
+# em ambos, também nas partições do arquivamento) e os embeddings são calculados em vários processos. Se o processo for interrompido,
+# basta executá-lo de novo: os IDs já gravados na coleção nova são pulados. Antes e depois da troca, uma passada
+# de sincronização copia o que foi incluído, validado ou excluído nas coleções antigas durante a reindexação.
+#
+# Uso pela linha de comando (a partir da pasta AssistenteIA), em segundo plano:
+#   python reindexacao.py status
+#   nohup python reindexacao.py executar --modelo sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2 &
+#   python reindexacao.py reverter
+#   python reindexacao.py remover-antigas
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from typing import Iterator, List
+
+from banco_validacao import incrementar_versao_dados, init_validation_db
+from banco_vetorial import (
+    BACKEND_VETORIAL, Lote, gravar_colecoes_ativas, iterar_colecao, ler_colecoes_ativas, lotes_de_origem, lotes_entradas_triagem,
+    modelo_da_colecao, nome_ativo, nome_versionado, nomes_colecoes, obter_colecao
+)
+from embeddings import embed_textos
+from unidades import Unidade, cliente_chroma_da_unidade, listar_unidades, obter_unidade
+
+# Quantidade de textos por lote enviado a um processo
+TAMANHO_LOTE_REINDEXACAO = int(os.environ.get("TRIAGEM_LOTE_REINDEXACAO", "256"))
+
+# Quantidade de processos que calculam embeddings (cada um carrega sua cópia do modelo)
+PROCESSOS_REINDEXACAO = int(os.environ.get("TRIAGEM_PROCESSOS_REINDEXACAO", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# Modelo carregado em cada processo da reindexação
+_modelo_processo = None
+
+# Função executada uma vez em cada processo: carrega o modelo e divide os núcleos entre os processos
+def _iniciar_processo(modelo: str, threads: int):
+    global _modelo_processo
+    import torch
+    torch.set_num_threads(threads)
+    _modelo_processo = modelo
+    embed_textos([""], modelo)
+
+def _calcular_embeddings(textos: List[str]) -> List[List[float]]:
+    return embed_textos(textos, _modelo_processo)
+
+# Lotes da base de casos: casos.txt e os casos validados registrados no banco de validação e nas partições
+# (os mesmos para qualquer modelo, então a coleção ativa não é lida)
+def lotes_casos(unidade: Unidade, tamanho: int) -> Iterator[Lote]:
+    yield from lotes_de_origem(unidade.arquivo_casos, unidade.caminho_bd, unidade.caminho_arquivo, tamanho)
+
+# Lotes dos sintomas das triagens: banco de validação e partições do arquivamento (ver banco_vetorial.lotes_entradas_triagem)
+def lotes_entradas(unidade: Unidade, tamanho: int) -> Iterator[Lote]:
+    yield from lotes_entradas_triagem(unidade.caminho_bd, unidade.caminho_arquivo, tamanho)
+
+# Conjuntos reindexados em cada unidade: (nome lógico da coleção, função que gera os lotes de origem)
+def conjuntos(unidade: Unidade):
+    return [(unidade.colecao, lotes_casos), (unidade.colecao_entradas, lotes_entradas)]
+
+def _colecoes_existentes(unidade: Unidade) -> List[str]:
+    if BACKEND_VETORIAL == "numpy":
+        from indice_numpy import CAMINHO_INDICE_NUMPY
+        if not os.path.isdir(CAMINHO_INDICE_NUMPY):
+            return []
+        return [nome for nome in os.listdir(CAMINHO_INDICE_NUMPY) if os.path.exists(os.path.join(CAMINHO_INDICE_NUMPY, nome, "registros.json"))]
+    return nomes_colecoes(cliente_chroma_da_unidade(unidade))
+
+# Função para deixar a coleção `destino` igual à origem: calcula os embeddings dos IDs que faltam (em paralelo no
+# `executor`), atualiza metadados alterados (ex.: triagem validada) e, com remover_ausentes, apaga o que saiu da origem.
+# No máximo `em_andamento_max` lotes ficam em cálculo ao mesmo tempo, para não carregar a origem inteira na memória.
+# Retorna a quantidade de vetores calculados.
+def sincronizar(destino, lotes: Iterator[Lote], executor, em_andamento_max: int, remover_ausentes: bool = True) -> int:
+    metadados_atuais = {}
+    for atuais in iterar_colecao(destino):
+        metadados_atuais.update(zip(atuais["ids"], atuais["metadatas"]))
+    vistos = set()
+    em_andamento = {}
+    calculados = 0
+
+    def gravar(concluidos):
+        nonlocal calculados
+        for futuro in concluidos:
+            ids, metadados = em_andamento.pop(futuro)
+            destino.add(embeddings=futuro.result(), ids=ids, metadatas=metadados)
+            calculados += len(ids)
+        print(f"  {destino.name}: {calculados} vetores calculados")
+
+    for ids, textos, metadados in lotes:
+        vistos.update(ids)
+        faltantes = [i for i, caso_id in enumerate(ids) if caso_id not in metadados_atuais]
+        alterados = [i for i, caso_id in enumerate(ids) if caso_id in metadados_atuais and metadados_atuais[caso_id] != metadados[i]]
+        if alterados:
+            destino.update(ids=[ids[i] for i in alterados], metadatas=[metadados[i] for i in alterados])
+        if faltantes:
+            futuro = executor.submit(_calcular_embeddings, [textos[i] for i in faltantes])
+            em_andamento[futuro] = ([ids[i] for i in faltantes], [metadados[i] for i in faltantes])
+            # Um mesmo ID em duas origens (ex.: banco e partição durante um arquivamento) é calculado uma vez só
+            metadados_atuais.update((ids[i], metadados[i]) for i in faltantes)
+        if len(em_andamento) >= em_andamento_max:
+            concluidos, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+            gravar(concluidos)
+    if em_andamento:
+        gravar(wait(em_andamento).done)
+
+    ausentes = [caso_id for caso_id in metadados_atuais if caso_id not in vistos]
+    if remover_ausentes and ausentes:
+        destino.delete(ids=ausentes)
+    return calculados
+
+# Função para reindexar as coleções de uma unidade com outro modelo e trocar para elas ao final
+def reindexar_unidade(unidade: Unidade, modelo: str, processos: int = PROCESSOS_REINDEXACAO,
+                      tamanho_lote: int = TAMANHO_LOTE_REINDEXACAO):
+    init_validation_db(unidade.caminho_bd)
+    chroma_client = cliente_chroma_da_unidade(unidade)
+    antigas = {nome: nome_ativo(nome) for nome, _ in conjuntos(unidade)}
+    novas = {nome: nome_versionado(nome, modelo) for nome, _ in conjuntos(unidade)}
+    if antigas == novas:
+        print(f"A unidade '{unidade.codigo}' já usa o modelo {modelo}.")
+        return
+
+    print(f"Reindexando a unidade '{unidade.codigo}' de {modelo_da_colecao(unidade.colecao)} para {modelo} "
+          f"({processos} processos, lotes de {tamanho_lote})")
+    inicio = time.perf_counter()
+    threads = max(1, (os.cpu_count() or 1) // processos)
+    # "spawn": os processos não herdam as conexões do ChromaDB e do SQLite abertas neste processo
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(processos, mp_context=contexto, initializer=_iniciar_processo, initargs=(modelo, threads)) as executor:
+        # Dois lotes por processo: um sendo calculado e outro esperando
+        em_andamento_max = 2 * processos
+
+        # 1. Carga principal (retomável) e 2. sincronização do que mudou durante a carga
+        for _ in range(2):
+            for nome, gerar_lotes in conjuntos(unidade):
+                destino = obter_colecao(chroma_client, nome=novas[nome])
+                sincronizar(destino, gerar_lotes(unidade, tamanho_lote), executor, em_andamento_max)
+
+        # 3. Troca: as duas coleções passam a apontar para o novo modelo numa única gravação do arquivo
+        data = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        gravar_colecoes_ativas({
+            nome: {
+                "colecao": nova,
+                "modelo": modelo,
+                "data": data,
+                "anterior": {"colecao": antigas[nome], "modelo": modelo_da_colecao(nome)},
+            }
+            for nome, nova in novas.items()
+        })
+        incrementar_versao_dados("banco_vetorial", unidade.caminho_bd)
+
+        # 4. Gravações feitas nas coleções antigas entre a sincronização e a troca (sem remover o que já foi
+        # gravado nas novas depois da troca)
+        for nome, gerar_lotes in conjuntos(unidade):
+            destino = obter_colecao(chroma_client, nome=novas[nome])
+            sincronizar(destino, gerar_lotes(unidade, tamanho_lote), executor, em_andamento_max, remover_ausentes=False)
+
+    print(f"Unidade '{unidade.codigo}' reindexada com {modelo} em {time.perf_counter() - inicio:.1f}s. "
+          f"As coleções antigas foram mantidas (use 'reverter' para voltar ou 'remover-antigas' para apagá-las).")
+
+# Função para voltar as coleções de uma unidade ao modelo anterior
+def reverter_unidade(unidade: Unidade):
+    ativas = ler_colecoes_ativas()
+    alteracoes = {}
+    for nome, _ in conjuntos(unidade):
+        anterior = ativas.get(nome, {}).get("anterior")
+        if anterior is None:
+            print(f"A coleção '{nome}' não tem modelo anterior registrado.")
+            return
+        alteracoes[nome] = {**anterior, "data": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    gravar_colecoes_ativas(alteracoes)
+    incrementar_versao_dados("banco_vetorial", unidade.caminho_bd)
+    print(f"Unidade '{unidade.codigo}' voltou ao modelo {alteracoes[unidade.colecao]['modelo']}. "
+          f"Triagens enviadas depois da troca só têm vetor no modelo novo e serão recalculadas quando abertas no painel.")
+
+# Função para apagar as coleções de modelos que não estão mais ativos
+def remover_antigas(unidade: Unidade):
+    chroma_client = cliente_chroma_da_unidade(unidade)
+    existentes = _colecoes_existentes(unidade)
+    for nome, _ in conjuntos(unidade):
+        ativa = nome_ativo(nome)
+        for colecao in existentes:
+            if colecao != ativa and (colecao == nome or colecao.startswith(f"{nome}__")):
+                if BACKEND_VETORIAL == "numpy":
+                    import shutil
+                    from indice_numpy import CAMINHO_INDICE_NUMPY
+                    shutil.rmtree(os.path.join(CAMINHO_INDICE_NUMPY, colecao))
+                else:
+                    chroma_client.delete_collection(colecao)
+                print(f"Coleção '{colecao}' removida")
+
+def exibir_status(unidade: Unidade):
+    existentes = _colecoes_existentes(unidade)
+    print(f"Unidade: {unidade.codigo} ({unidade.nome})")
+    for nome, _ in conjuntos(unidade):
+        ativa = nome_ativo(nome)
+        print(f"  {nome}: coleção {ativa}, modelo {modelo_da_colecao(nome)}")
+        for colecao in existentes:
+            if colecao != ativa and (colecao == nome or colecao.startswith(f"{nome}__")):
+                print(f"    inativa: {colecao} ({obter_colecao(cliente_chroma_da_unidade(unidade), nome=colecao).count()} vetores)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Troca do modelo de embedding das coleções do banco vetorial")
+    parser.add_argument("--unidade", help="Código da unidade (padrão: TRIAGEM_UNIDADE ou a unidade padrão)")
+    parser.add_argument("--todas-unidades", action="store_true", help="Aplica o comando a todas as unidades")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    subparsers.add_parser("status", help="Mostra a coleção e o modelo ativos de cada unidade")
+
+    executar = subparsers.add_parser("executar", help="Recalcula os vetores com outro modelo e troca para eles ao final")
+    executar.add_argument("--modelo", required=True, help="Modelo do Sentence Transformers (ex.: sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2)")
+    executar.add_argument("--processos", type=int, default=PROCESSOS_REINDEXACAO)
+    executar.add_argument("--lote", type=int, default=TAMANHO_LOTE_REINDEXACAO, help="Textos por lote")
+
+    subparsers.add_parser("reverter", help="Volta para as coleções do modelo anterior")
+    subparsers.add_parser("remover-antigas", help="Apaga as coleções de modelos que não estão ativos")
+
+    args = parser.parse_args()
+    unidades = listar_unidades() if args.todas_unidades else [obter_unidade(args.unidade)]
+
+    for unidade in unidades:
+        if args.comando == "status":
+            exibir_status(unidade)
+        elif args.comando == "executar":
+            reindexar_unidade(unidade, args.modelo, max(1, args.processos), args.lote)
+        elif args.comando == "reverter":
+            reverter_unidade(unidade)
+        elif args.comando == "remover-antigas":
+            remover_antigas(unidade)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# Servidor HTTP que imita a API do Ollama (/api/tags e /api/chat) com latência configurável.
+# Serve para testar o gateway (gateway_llm.py) e para testes de carga sem precisar do modelo real.
+#
+# Uso pela linha de comando (a partir da pasta AssistenteIA):
+#   python stub_ollama.py --porta 11500 --latencia 2.0
+#   python stub_ollama.py --porta 11501 --latencia 0.5 --taxa-falhas 0.1
+#   python stub_ollama.py --porta 11502 --carga-fria 20 --keep-alive 300
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Resposta fixa no formato estruturado pedido pelo aplicativo de triagem
+RESPOSTA_PADRAO = (
+    "Diagnóstico\n"
+    "Nome (CID-10: R07.4): Dor torácica não especificada\n\n"
+    "Classificação de Risco\n"
+    "Cor: Laranja\n"
+    "Justificativa: Resposta simulada pelo servidor de testes.\n\n"
+    "Conduta Clínica Inicial\n"
+    "Encaminhamento: Sala de emergência\n"
+    "Objetivo: Resposta simulada pelo servidor de testes."
+)
+
+def criar_handler(latencia: float, taxa_falhas: float, resposta: str, carga_fria: float = 0.0, keep_alive: float = 300.0,
+                  modelos=("mistral",)):
+    # Simula o modelo sendo descarregado da memória após keep_alive segundos sem requisições
+    estado = {"ultima_requisicao": None}
+    lock = threading.Lock()
+
+    class HandlerOllama(BaseHTTPRequestHandler):
+        # HTTP/1.1 para manter a conexão aberta entre requisições (como o Ollama real)
+        protocol_version = "HTTP/1.1"
+
+        def _responder(self, status: int, dados: dict):
+            corpo = json.dumps(dados).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self._responder(200, {"models": [{"name": f"{modelo}:latest"} for modelo in modelos]})
+            else:
+                self._responder(404, {"error": "not found"})
+
+        def do_POST(self):
+            tamanho = int(self.headers.get("Content-Length", 0))
+            pedido = json.loads(self.rfile.read(tamanho) or b"{}")
+
+            if self.path != "/api/chat":
+                self._responder(404, {"error": "not found"})
+                return
+            # keep_alive em texto precisa de unidade ("30m"); número de segundos vem como número (como no Ollama)
+            valor_keep_alive = pedido.get("keep_alive")
+            if isinstance(valor_keep_alive, str) and not re.fullmatch(r"-?(\d+(\.\d+)?(ns|us|µs|ms|s|m|h))+", valor_keep_alive):
+                self._responder(400, {"error": f"time: missing unit in duration \"{valor_keep_alive}\""})
+                return
+            # Modelo não instalado: o Ollama responde 404
+            modelo = pedido.get("model", "")
+            if modelo.split(":")[0] not in modelos:
+                self._responder(404, {"error": f"model '{modelo}' not found"})
+                return
+
+            inicio = time.perf_counter()
+            with lock:
+                agora = time.monotonic()
+                fria = estado["ultima_requisicao"] is None or agora - estado["ultima_requisicao"] > keep_alive
+                estado["ultima_requisicao"] = agora
+            carga_ns = int(carga_fria * 1e9) if fria else 0
+            time.sleep(carga_fria if fria else 0)
+
+            # Mensagens vazias apenas carregam o modelo (usado para mantê-lo aquecido)
+            if not pedido.get("messages"):
+                self._responder(200, {"model": pedido.get("model", "mistral"), "message": {"role": "assistant", "content": ""},
+                                      "done": True, "load_duration": carga_ns})
+                return
+
+            time.sleep(latencia)
+            if random.random() < taxa_falhas:
+                self._responder(500, {"error": "falha simulada"})
+                return
+
+            duracao_ns = int((time.perf_counter() - inicio) * 1e9)
+            self._responder(200, {
+                "model": pedido.get("model", "mistral"),
+                "message": {"role": "assistant", "content": resposta},
+                "done": True,
+                "total_duration": duracao_ns,
+                "load_duration": carga_ns,
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return HandlerOllama
+
+# Função para iniciar o servidor em segundo plano (porta 0 = porta livre escolhida pelo sistema)
+def iniciar_servidor_stub(porta: int = 0, latencia: float = 0.0, taxa_falhas: float = 0.0, resposta: str = RESPOSTA_PADRAO,
+                          carga_fria: float = 0.0, keep_alive: float = 300.0, modelos=("mistral",)):
+    handler = criar_handler(latencia, taxa_falhas, resposta, carga_fria, keep_alive, modelos)
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de testes que imita a API do Ollama")
+    parser.add_argument("--porta", type=int, default=11500)
+    parser.add_argument("--latencia", type=float, default=1.0, help="Segundos de espera por resposta de chat")
+    parser.add_argument("--taxa-falhas", type=float, default=0.0, help="Fração das requisições que retornam HTTP 500")
+    parser.add_argument("--carga-fria", type=float, default=0.0, help="Segundos extras para 'carregar o modelo' após ociosidade")
+    parser.add_argument("--keep-alive", type=float, default=300.0, help="Segundos sem requisições até o modelo 'descarregar'")
+    args = parser.parse_args()
+
+    handler = criar_handler(args.latencia, args.taxa_falhas, RESPOSTA_PADRAO, args.carga_fria, args.keep_alive)
+    servidor = ThreadingHTTPServer(("127.0.0.1", args.porta), handler)
+    print(f"Servidor de testes do Ollama em http://127.0.0.1:{args.porta} (latência {args.latencia}s)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+# Teste de carga: simula enfermeiros fazendo triagens e especialistas validando, ao mesmo tempo
+#
+# Executa no mesmo processo (como o servidor do Streamlit, que atende cada sessão numa thread) as mesmas funções
+# usadas pelos aplicativos: busca de casos semelhantes, chamada ao modelo pelo gateway, envio para validação
+# (nucleo_triagem.py) e as consultas do painel (banco_validacao.py). O modelo de linguagem é substituído por
+# servidores de teste (stub_ollama.py) com latência configurável, e o embedding pode ser simulado (vetor derivado
+# do texto, sem carregar o modelo) para medir só o restante do caminho.
+#
+# Tudo é gravado num diretório temporário (banco de validação, coleções e partições); o banco real não é alterado.
+# Com --bd-inicial, o teste parte de uma cópia de um banco existente.
+#
+# Ao final, mostra por operação: quantidade, erros, vazão e latências p50/p95/p99; a espera pelo lock de escrita
+# do SQLite (medida por uma sonda periódica e pelos erros "database is locked") e a memória do processo ao longo do tempo.
+#
+# Uso pela linha de comando (a partir da pasta AssistenteIA):
+#   python teste_carga.py --enfermeiros 20 --revisores 4 --duracao 120 --latencia-llm 3.0
+#   python teste_carga.py --taxa-triagens 2.5 --taxa-revisoes 0.5 --servidores-llm 3 --triagens-iniciais 50000
+#   python teste_carga.py --embedding real --tracemalloc --saida-json resultado_carga.json
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from memoria import EstadoSessoes, rss_mb
+
+# Dimensão dos embeddings simulados (a mesma do all-MiniLM-L6-v2)
+DIMENSAO_EMBEDDING_SIMULADO = 384
+
+# Termos usados na busca textual dos revisores
+TERMOS_BUSCA = ["dor", "febre", "tosse", "dispneia", "cefaleia", "vômitos", "torácica", "abdominal"]
+
+# Embedding simulado: vetor pseudoaleatório determinado pelo texto (textos iguais geram vetores iguais)
+def embedding_simulado(texto: str) -> List[float]:
+    import numpy as np
+    semente = int.from_bytes(hashlib.sha256(texto.encode("utf-8")).digest()[:8], "big")
+    return np.random.default_rng(semente).standard_normal(DIMENSAO_EMBEDDING_SIMULADO).astype(np.float32).tolist()
+
+# Registro das medições feitas pelas threads do teste
+class Medicoes:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencias: Dict[str, List[float]] = defaultdict(list)
+        self.erros: Dict[str, int] = defaultdict(int)
+        self.bloqueios: Dict[str, int] = defaultdict(int)
+        self.ultimos_erros: Dict[str, str] = {}
+        self.amostras: List[dict] = []
+
+    # Executa uma operação medindo a latência (desde `inicio`, que inclui a espera na fila quando informado)
+    def medir(self, operacao: str, funcao: Callable, *args, inicio: Optional[float] = None):
+        inicio = inicio or time.perf_counter()
+        try:
+            resultado = funcao(*args)
+        except Exception as e:
+            with self.lock:
+                self.erros[operacao] += 1
+                if isinstance(e, sqlite3.OperationalError) and "locked" in str(e):
+                    self.bloqueios[operacao] += 1
+                self.ultimos_erros[operacao] = f"{type(e).__name__}: {e}"
+            raise
+        with self.lock:
+            self.latencias[operacao].append((time.perf_counter() - inicio) * 1000)
+        return resultado
+
+    def concluidas(self, operacao: str) -> int:
+        with self.lock:
+            return len(self.latencias[operacao])
+
+# Ambiente isolado do teste: unidade com banco e coleções no diretório temporário, gateway e servidores de teste
+class AmbienteCarga:
+    def __init__(self, diretorio: str, args):
+        from arquivamento import CAMINHO_ARQUIVO
+        from banco_validacao import init_validation_db
+        from banco_vetorial import ARQUIVO_CASOS, ARQUIVO_TESTE, load_triagem_cases, modelo_da_colecao
+        from gateway_llm import GatewayOllama
+        from stub_ollama import iniciar_servidor_stub
+        from unidades import Unidade, colecao_da_unidade
+
+        self.unidade = Unidade(
+            codigo="carga",
+            nome="Teste de carga",
+            colecao="carga_triagem",
+            caminho_chroma=os.path.join(diretorio, "chroma_db"),
+            caminho_bd=os.path.join(diretorio, "validacao_triagem.db"),
+            caminho_arquivo=os.path.join(diretorio, os.path.basename(CAMINHO_ARQUIVO)),
+            arquivo_casos=ARQUIVO_CASOS,
+        )
+        if args.bd_inicial:
+            # Cópia pela API de backup do SQLite (consistente mesmo com os aplicativos gravando no banco de origem)
+            origem, destino = sqlite3.connect(args.bd_inicial), sqlite3.connect(self.unidade.caminho_bd)
+            origem.backup(destino)
+            origem.close()
+            destino.close()
+        init_validation_db(self.unidade.caminho_bd)
+
+        # Modelo de embedding da coleção da unidade de teste, guardado com cada triagem como no aplicativo principal
+        self.modelo = modelo_da_colecao(self.unidade.colecao)
+        if args.embedding == "real":
+            from embeddings import embed_text, embed_textos
+            self.embed_text = lambda texto: embed_text(texto, self.modelo)
+            embed_lote = lambda textos: embed_textos(textos, self.modelo)
+        else:
+            self.embed_text, embed_lote = embedding_simulado, lambda textos: [embedding_simulado(texto) for texto in textos]
+
+        # Base de casos da unidade de teste
+        casos = load_triagem_cases(ARQUIVO_CASOS)
+        colecao_da_unidade(self.unidade).add(
+            embeddings=embed_lote(casos), ids=[f"case_{i}" for i in range(len(casos))], metadatas=[{"content": caso} for caso in casos]
+        )
+        self.sintomas = load_triagem_cases(ARQUIVO_TESTE)
+
+        self.servidores = []
+        urls = args.urls_llm.split(",") if args.urls_llm else []
+        if not urls:
+            for _ in range(args.servidores_llm):
+                servidor, url = iniciar_servidor_stub(latencia=args.latencia_llm, taxa_falhas=args.taxa_falhas_llm)
+                self.servidores.append(servidor)
+                urls.append(url)
+        self.llm = GatewayOllama(urls=urls, model="mistral", request_timeout=420.0, caminho_bd=self.unidade.caminho_bd)
+        # Estado das triagens entre o diagnóstico e o envio, como no aplicativo principal
+        self.sessoes = EstadoSessoes()
+
+    # Sintomas de uma nova triagem: um caso de teste com uma variação, para não repetir o mesmo texto
+    def novos_sintomas(self) -> str:
+        return f"{random.choice(self.sintomas)} Sinais vitais: PA {random.randint(90, 180)}x{random.randint(50, 110)} mmHg, FC {random.randint(50, 140)} bpm."
+
+    def encerrar(self):
+        for servidor in self.servidores:
+            servidor.shutdown()
+
+# Fluxo de uma triagem: embedding, busca dos casos semelhantes, modelo de linguagem e envio para validação
+def executar_triagem(ambiente: AmbienteCarga, medicoes: Medicoes, inicio: Optional[float] = None):
+    from nucleo_triagem import criar_triagem_sessao, enviar_para_validacao, montar_mensagens
+    from unidades import buscar_casos_semelhantes
+
+    def triagem():
+        sintomas = ambiente.novos_sintomas()
+        embedding = medicoes.medir("embedding", ambiente.embed_text, sintomas)
+        casos = medicoes.medir("busca_casos", buscar_casos_semelhantes, embedding, 3, ambiente.unidade)
+        resposta = medicoes.medir("llm", ambiente.llm.chat, montar_mensagens(sintomas, [caso["conteudo"] for caso in casos]))
+        id_sessao = uuid.uuid4().hex
+        ambiente.sessoes.guardar(id_sessao, criar_triagem_sessao(sintomas, resposta, embedding, ambiente.unidade.codigo, ambiente.modelo))
+        triagem = ambiente.sessoes.obter(id_sessao)
+        triagem_id, erro_indexacao = medicoes.medir(
+            "envio_validacao", enviar_para_validacao, triagem.sintomas, triagem.resposta, triagem.embedding, ambiente.unidade,
+            triagem.modelo
+        )
+        ambiente.sessoes.descartar(id_sessao)
+        if erro_indexacao is not None:
+            raise erro_indexacao
+
+    medicoes.medir("triagem", triagem, inicio=inicio)
+
+# Fluxo de um especialista: lista as pendentes, abre uma, valida, consulta o Dashboard e faz uma busca textual
+def executar_revisao(ambiente: AmbienteCarga, medicoes: Medicoes, inicio: Optional[float] = None):
+    from banco_validacao import buscar_triagens, estatisticas_validacao, ler_triagem, listar_triagens, registrar_validacao
+
+    caminho_bd = ambiente.unidade.caminho_bd
+
+    def revisao():
+        pendentes = medicoes.medir("listar_pendentes", listar_triagens, "pendentes", caminho_bd)
+        if not pendentes.empty:
+            triagem_id = random.choice(pendentes["id"].tolist()[:50])
+            medicoes.medir("abrir_triagem", ler_triagem, triagem_id, caminho_bd)
+            medicoes.medir("validar", registrar_validacao, triagem_id, "teste_carga", "Validado pelo teste de carga.", caminho_bd)
+        medicoes.medir("estatisticas", estatisticas_validacao, caminho_bd)
+        medicoes.medir("busca_textual", buscar_triagens, random.choice(TERMOS_BUSCA), 1, 20, caminho_bd)
+
+    medicoes.medir("revisao", revisao, inicio=inicio)
+
+# Gera carga por `duracao` segundos. Com taxa > 0, as chegadas seguem um processo de Poisson (carga aberta: a latência
+# inclui a espera por uma das `concorrencia` threads); com taxa 0, cada thread repete o fluxo após `pausa` segundos.
+def gerar_carga(fluxo: Callable, concorrencia: int, taxa: float, pausa: float, parar: threading.Event) -> List[threading.Thread]:
+    if concorrencia <= 0:
+        return []
+
+    def fechada():
+        while not parar.is_set():
+            try:
+                fluxo()
+            except Exception:
+                pass
+            parar.wait(pausa)
+
+    def aberta():
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            while not parar.wait(random.expovariate(taxa)):
+                executor.submit(_ignorar_erros, fluxo, time.perf_counter())
+
+    if taxa > 0:
+        threads = [threading.Thread(target=aberta, daemon=True)]
+    else:
+        threads = [threading.Thread(target=fechada, daemon=True) for _ in range(concorrencia)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def _ignorar_erros(fluxo: Callable, inicio: float):
+    try:
+        fluxo(inicio=inicio)
+    except Exception:
+        pass
+
+# Sonda do lock de escrita: quanto tempo uma nova gravação esperaria naquele instante (BEGIN IMMEDIATE + ROLLBACK)
+def medir_espera_lock(caminho_bd: str) -> Optional[float]:
+    conn = sqlite3.connect(caminho_bd, timeout=30)
+    try:
+        inicio = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        espera = (time.perf_counter() - inicio) * 1000
+        conn.rollback()
+        return espera
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+# Amostras periódicas: memória, espera pelo lock de escrita e triagens concluídas desde a amostra anterior
+def amostrar(ambiente: AmbienteCarga, medicoes: Medicoes, intervalo: float, parar: threading.Event, inicio: float):
+    anteriores = 0
+    while not parar.wait(intervalo):
+        concluidas = medicoes.concluidas("triagem")
+        rss = rss_mb()
+        medicoes.amostras.append({
+            "segundos": round(time.perf_counter() - inicio, 1),
+            "rss_mb": round(rss, 1) if rss is not None else None,
+            "tracemalloc_mb": round(tracemalloc.get_traced_memory()[0] / 1e6, 1) if tracemalloc.is_tracing() else None,
+            "espera_lock_ms": medir_espera_lock(ambiente.unidade.caminho_bd),
+            "triagens_no_intervalo": concluidas - anteriores,
+            "threads": threading.active_count(),
+        })
+        anteriores = concluidas
+
+# Função para resumir as medições por operação
+def resumir(medicoes: Medicoes, duracao: float) -> Dict[str, dict]:
+    import numpy as np
+    resumo = {}
+    for operacao in sorted(set(medicoes.latencias) | set(medicoes.erros)):
+        latencias = medicoes.latencias[operacao]
+        resumo[operacao] = {
+            "concluidas": len(latencias),
+            "erros": medicoes.erros[operacao],
+            "bloqueios_sqlite": medicoes.bloqueios[operacao],
+            "vazao_por_s": len(latencias) / duracao,
+            "p50_ms": float(np.percentile(latencias, 50)) if latencias else None,
+            "p95_ms": float(np.percentile(latencias, 95)) if latencias else None,
+            "p99_ms": float(np.percentile(latencias, 99)) if latencias else None,
+            "max_ms": float(max(latencias)) if latencias else None,
+            "ultimo_erro": medicoes.ultimos_erros.get(operacao),
+        }
+    return resumo
+
+def _ms(valor) -> str:
+    return "-" if valor is None else f"{valor:.1f}"
+
+def exibir_relatorio(resumo: Dict[str, dict], amostras: List[dict], args, duracao: float):
+    print(f"\nTeste de carga: {duracao:.0f}s, {args.enfermeiros} enfermeiros "
+          f"({'taxa ' + str(args.taxa_triagens) + '/s' if args.taxa_triagens else 'sem pausa' if not args.pausa else 'pausa ' + str(args.pausa) + 's'}), "
+          f"{args.revisores} revisores, LLM {args.latencia_llm}s x {args.servidores_llm if not args.urls_llm else 'servidores reais'}, embedding {args.embedding}")
+    print(f"{'operação':<18} {'ok':>7} {'erros':>6} {'locks':>6} {'vazão/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'máx ms':>9}")
+    for operacao, r in resumo.items():
+        print(f"{operacao:<18} {r['concluidas']:>7} {r['erros']:>6} {r['bloqueios_sqlite']:>6} {r['vazao_por_s']:>8.2f} "
+              f"{_ms(r['p50_ms']):>9} {_ms(r['p95_ms']):>9} {_ms(r['p99_ms']):>9} {_ms(r['max_ms']):>9}")
+    for operacao, r in resumo.items():
+        if r["ultimo_erro"]:
+            print(f"  último erro em {operacao}: {r['ultimo_erro']}")
+
+    if amostras:
+        esperas = [a["espera_lock_ms"] for a in amostras if a["espera_lock_ms"] is not None]
+        print(f"\nEspera pelo lock de escrita do SQLite (sonda a cada {args.intervalo_amostras}s): "
+              f"média {sum(esperas) / max(len(esperas), 1):.1f} ms, máxima {max(esperas, default=0):.1f} ms")
+        rss = [a["rss_mb"] for a in amostras if a["rss_mb"] is not None]
+        if rss:
+            print(f"Memória: RSS {rss[0]:.0f} MB no início, {rss[-1]:.0f} MB no fim, máximo {max(rss):.0f} MB")
+        else:
+            print("Memória: RSS indisponível neste sistema (instale o psutil)")
+        print(f"\n{'s':>7} {'RSS MB':>8} {'tracemalloc MB':>15} {'lock ms':>8} {'triagens':>9} {'threads':>8}")
+        for a in amostras:
+            print(f"{a['segundos']:>7.0f} {_ms(a['rss_mb']):>8} {_ms(a['tracemalloc_mb']):>15} {_ms(a['espera_lock_ms']):>8} "
+                  f"{a['triagens_no_intervalo']:>9} {a['threads']:>8}")
+
+# Função para executar o teste de carga e retornar o resumo por operação e as amostras periódicas
+def executar_teste(args, diretorio: str):
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    ambiente = AmbienteCarga(diretorio, args)
+    medicoes = Medicoes()
+    try:
+        if args.triagens_iniciais:
+            from banco_validacao import registrar_validacao, salvar_para_validacao
+            from stub_ollama import RESPOSTA_PADRAO
+            print(f"Inserindo {args.triagens_iniciais} triagens iniciais...")
+            for i in range(args.triagens_iniciais):
+                triagem_id = salvar_para_validacao(ambiente.novos_sintomas(), RESPOSTA_PADRAO, ambiente.unidade.caminho_bd)
+                # A maior parte das triagens de um banco em uso já foi validada
+                if i % 10:
+                    registrar_validacao(triagem_id, "teste_carga", "Validada antes do teste.", ambiente.unidade.caminho_bd)
+
+        parar = threading.Event()
+        inicio = time.perf_counter()
+        amostrador = threading.Thread(target=amostrar, args=(ambiente, medicoes, args.intervalo_amostras, parar, inicio), daemon=True)
+        amostrador.start()
+        threads = gerar_carga(lambda inicio=None: executar_triagem(ambiente, medicoes, inicio),
+                              args.enfermeiros, args.taxa_triagens, args.pausa, parar)
+        threads += gerar_carga(lambda inicio=None: executar_revisao(ambiente, medicoes, inicio),
+                               args.revisores, args.taxa_revisoes, args.pausa_revisores, parar)
+
+        print(f"Gerando carga por {args.duracao}s em {diretorio}...")
+        time.sleep(args.duracao)
+        parar.set()
+        # Espera as operações em andamento terminarem (elas entram nas medições)
+        for thread in threads:
+            thread.join()
+        duracao = time.perf_counter() - inicio
+        amostrador.join()
+        return resumir(medicoes, duracao), medicoes.amostras, duracao
+    finally:
+        ambiente.encerrar()
+        if args.tracemalloc:
+            tracemalloc.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga da triagem e do painel de validação")
+    parser.add_argument("--duracao", type=float, default=60, help="Segundos de carga")
+    parser.add_argument("--enfermeiros", type=int, default=10, help="Sessões de triagem simultâneas")
+    parser.add_argument("--taxa-triagens", type=float, default=0.0, help="Triagens por segundo (0 = cada sessão repete após --pausa)")
+    parser.add_argument("--pausa", type=float, default=0.0, help="Segundos entre duas triagens da mesma sessão")
+    parser.add_argument("--revisores", type=int, default=2, help="Especialistas validando simultaneamente")
+    parser.add_argument("--taxa-revisoes", type=float, default=0.0, help="Revisões por segundo (0 = cada revisor repete após --pausa-revisores)")
+    parser.add_argument("--pausa-revisores", type=float, default=1.0, help="Segundos entre duas revisões do mesmo revisor")
+    parser.add_argument("--latencia-llm", type=float, default=2.0, help="Segundos de resposta dos servidores de teste do modelo")
+    parser.add_argument("--taxa-falhas-llm", type=float, default=0.0, help="Fração das chamadas ao modelo que falham")
+    parser.add_argument("--servidores-llm", type=int, default=1, help="Quantidade de servidores de teste do modelo")
+    parser.add_argument("--urls-llm", help="URLs de servidores Ollama reais, separadas por vírgula (em vez dos servidores de teste)")
+    parser.add_argument("--embedding", choices=["simulado", "real"], default="simulado", help="'real' carrega o modelo de embeddings")
+    parser.add_argument("--bd-inicial", help="Banco de validação copiado como ponto de partida")
+    parser.add_argument("--triagens-iniciais", type=int, default=0, help="Triagens inseridas antes do teste")
+    parser.add_argument("--intervalo-amostras", type=float, default=5.0, help="Segundos entre as amostras de memória e de lock")
+    parser.add_argument("--tracemalloc", action="store_true", help="Mede também a memória alocada pelo Python (deixa o teste mais lento)")
+    parser.add_argument("--saida-json", help="Arquivo onde gravar o resumo e as amostras")
+    parser.add_argument("--manter-diretorio", action="store_true", help="Não apaga o diretório temporário ao final")
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp(prefix="teste_carga_")
+    # As coleções do teste ficam no diretório temporário em qualquer backend, e o arquivo de coleções ativas
+    # da instalação não se aplica a elas (definido antes de importar os módulos do sistema)
+    os.environ["TRIAGEM_NUMPY_PATH"] = os.path.join(diretorio, "indice_numpy")
+    os.environ["TRIAGEM_COLECOES_ATIVAS_PATH"] = os.path.join(diretorio, "colecoes_ativas.json")
+    try:
+        resumo, amostras, duracao = executar_teste(args, diretorio)
+    finally:
+        if not args.manter_diretorio:
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+    exibir_relatorio(resumo, amostras, args, duracao)
+    if args.saida_json:
+        with open(args.saida_json, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": vars(args), "duracao_s": duracao, "operacoes": resumo, "amostras": amostras},
+                      arquivo, ensure_ascii=False, indent=2)
+        print(f"\nResultado gravado em {args.saida_json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+# Os módulos do sistema ficam soltos na pasta AssistenteIA (os aplicativos são executados a partir dela)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
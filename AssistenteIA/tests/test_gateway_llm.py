@@ -0,0 +1,151 @@
+# Testes do gateway de servidores Ollama (gateway_llm.py) contra servidores de teste (stub_ollama.py)
+#
+# Uso (a partir da pasta AssistenteIA):
+#   python -m pytest -q tests
+import socket
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from gateway_llm import ErroGatewayLLM, ErroHTTPOllama, GatewayOllama
+from nucleo_triagem import Mensagem
+from stub_ollama import iniciar_servidor_stub
+
+MENSAGENS = [Mensagem("user", "Dor torácica há 2 horas")]
+
+@pytest.fixture
+def servidores():
+    iniciados = []
+
+    def iniciar(**kwargs) -> str:
+        servidor, url = iniciar_servidor_stub(**kwargs)
+        iniciados.append(servidor)
+        return url
+
+    yield iniciar
+    for servidor in iniciados:
+        servidor.shutdown()
+        servidor.server_close()
+
+@pytest.fixture
+def gateways():
+    criados = []
+
+    def criar(urls, **kwargs) -> GatewayOllama:
+        gateway = GatewayOllama(urls=urls, **kwargs)
+        criados.append(gateway)
+        return gateway
+
+    yield criar
+    for gateway in criados:
+        gateway.encerrar()
+
+# URL de uma porta local sem nenhum servidor escutando
+def url_sem_servidor() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        porta = sock.getsockname()[1]
+    return f"http://127.0.0.1:{porta}"
+
+def chamadas_registradas(caminho_bd: str):
+    conn = sqlite3.connect(caminho_bd)
+    try:
+        return conn.execute("SELECT backend, sucesso, erro, origem, latencia_ms FROM chamadas_llm ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+def test_failover_para_o_proximo_servidor_em_erro_de_conexao(servidores, gateways):
+    fora_do_ar, no_ar = url_sem_servidor(), servidores()
+    gateway = gateways([fora_do_ar, no_ar])
+
+    resposta = gateway.chat(MENSAGENS)
+
+    assert resposta.backend == no_ar
+    assert "Diagnóstico" in resposta.content
+    assert [b.saudavel for b in gateway.backends] == [False, True]
+    # Enquanto o primeiro estiver indisponível, as triagens vão direto para o segundo
+    assert gateway.chat(MENSAGENS).backend == no_ar
+    assert gateway.backends[0].requisicoes == 1
+
+def test_failover_em_http_5xx(servidores, gateways):
+    com_falha, no_ar = servidores(taxa_falhas=1.0), servidores()
+    gateway = gateways([com_falha, no_ar])
+
+    assert gateway.chat(MENSAGENS).backend == no_ar
+    assert [b.saudavel for b in gateway.backends] == [False, True]
+
+def test_erro_4xx_e_repassado_sem_failover_e_sem_alterar_a_saude(servidores, gateways):
+    primeiro, segundo = servidores(), servidores()
+    gateway = gateways([primeiro, segundo], model="modelo-inexistente")
+
+    with pytest.raises(ErroHTTPOllama) as erro:
+        gateway.chat(MENSAGENS)
+
+    assert erro.value.status == 404
+    assert [b.saudavel for b in gateway.backends] == [True, True]
+    assert [b.requisicoes for b in gateway.backends] == [1, 0]
+
+@pytest.mark.parametrize("keep_alive, enviado", [("-1", -1), ("300", 300), ("30m", "30m"), ("1h30m", "1h30m")])
+def test_keep_alive_numerico_e_enviado_como_numero(servidores, gateways, keep_alive, enviado):
+    gateway = gateways([servidores()], keep_alive=keep_alive)
+
+    assert gateway.keep_alive == enviado
+    assert "Diagnóstico" in gateway.chat(MENSAGENS).content
+
+def test_erro_quando_nenhum_servidor_atende(gateways):
+    gateway = gateways([url_sem_servidor(), url_sem_servidor()])
+
+    with pytest.raises(ErroGatewayLLM, match="Nenhum servidor"):
+        gateway.chat(MENSAGENS)
+
+def test_escolhe_o_menos_carregado_e_depois_o_mais_rapido(servidores, gateways):
+    lento, rapido = servidores(latencia=0.3), servidores(latencia=0.05)
+    gateway = gateways([lento, rapido])
+
+    # Duas triagens simultâneas: sem latência medida, a primeira vai para o primeiro servidor e a segunda,
+    # com o primeiro ocupado, para o servidor sem requisições em andamento
+    respostas = {}
+
+    def triagem(nome):
+        respostas[nome] = gateway.chat(MENSAGENS).backend
+
+    primeira = threading.Thread(target=triagem, args=("primeira",))
+    primeira.start()
+    while gateway.backends[0].em_andamento == 0:
+        time.sleep(0.01)
+    triagem("segunda")
+    primeira.join()
+    assert respostas == {"primeira": lento, "segunda": rapido}
+
+    # Sem carga nos dois, o desempate é pela menor latência média
+    assert [gateway.chat(MENSAGENS).backend for _ in range(3)] == [rapido] * 3
+    assert gateway.backends[0].latencia_media_ms() > gateway.backends[1].latencia_media_ms()
+
+def test_servidor_indisponivel_volta_pela_verificacao_em_segundo_plano(servidores, gateways):
+    gateway = gateways([servidores()], intervalo_saude=0.1)
+    gateway.backends[0].saudavel = False
+
+    limite = time.monotonic() + 5
+    while not gateway.backends[0].saudavel and time.monotonic() < limite:
+        time.sleep(0.05)
+
+    assert gateway.backends[0].saudavel
+
+def test_registra_as_chamadas_no_sqlite(servidores, gateways, tmp_path):
+    caminho_bd = str(tmp_path / "validacao_triagem.db")
+    fora_do_ar, no_ar = url_sem_servidor(), servidores()
+    gateway = gateways([fora_do_ar, no_ar], caminho_bd=caminho_bd)
+
+    gateway.chat(MENSAGENS)
+    gateway.chat(MENSAGENS, origem="teste")
+
+    chamadas = chamadas_registradas(caminho_bd)
+    assert [(backend, sucesso, origem) for backend, sucesso, _, origem, _ in chamadas] == [
+        (fora_do_ar, 0, "triagem"),
+        (no_ar, 1, "triagem"),
+        (no_ar, 1, "teste"),
+    ]
+    assert chamadas[0][2] and chamadas[1][2] is None
+    assert all(latencia_ms >= 0 for *_, latencia_ms in chamadas)
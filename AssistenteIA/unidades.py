@@ -0,0 +1,172 @@
+# Configuração das unidades (hospitais/pronto-atendimentos) atendidas pelo sistema
+#
+# Cada unidade tem sua própria base de casos (coleção e diretório do banco vetorial), seu banco SQLite de
+# validação e seu diretório de arquivamento. As consultas de casos semelhantes vão apenas à coleção da unidade
+# da triagem; opcionalmente, buscar_casos_semelhantes(..., todas_unidades=True) consulta todas as unidades
+# em paralelo e junta os k mais próximos.
+#
+# Os nomes de coleção precisam ser únicos entre todas as unidades, mesmo em diretórios do ChromaDB diferentes:
+# colecoes_ativas.json e o diretório do índice NumPy são compartilhados e identificam as coleções só pelo nome.
+#
+# Sem o arquivo unidades.json, existe uma única unidade ("hci"), com os caminhos usados até aqui
+# (./chroma_db, coleção triagem_hci, ./validacao_triagem.db), então instalações existentes não mudam.
+#
+# Exemplo de unidades.json (caminhos omitidos recebem valores padrão derivados do código da unidade):
+# {
+#   "padrao": "hci",
+#   "unidades": {
+#     "hci": {"nome": "Hospital de Clínicas de Ijuí"},
+#     "upa": {"nome": "UPA Ijuí", "colecao": "triagem_upa", "caminho_bd": "./validacao_triagem_upa.db"}
+#   }
+# }
+import heapq
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, NamedTuple, Optional
+
+from arquivamento import CAMINHO_ARQUIVO
+from banco_validacao import CAMINHO_BD
+from banco_vetorial import (
+    ARQUIVO_CASOS, BACKEND_VETORIAL, CAMINHO_CHROMA, NOME_COLECAO, conectar_chroma, espaco_da_colecao, existe_colecao,
+    modelo_da_colecao, obter_colecao
+)
+
+# Arquivo de configuração das unidades
+CAMINHO_UNIDADES = os.environ.get("TRIAGEM_UNIDADES_PATH", "./unidades.json")
+
+# Unidade usada quando nenhuma é escolhida (sobrepõe o "padrao" do arquivo)
+UNIDADE_AMBIENTE = os.environ.get("TRIAGEM_UNIDADE")
+
+class Unidade(NamedTuple):
+    codigo: str
+    nome: str
+    colecao: str
+    caminho_chroma: str
+    caminho_bd: str
+    caminho_arquivo: str
+    arquivo_casos: str
+
+    # Coleção com os vetores das triagens enviadas para validação nesta unidade
+    @property
+    def colecao_entradas(self) -> str:
+        return f"{self.colecao}_entradas"
+
+# Unidade única das instalações sem unidades.json
+def _unidade_hci() -> Unidade:
+    return Unidade("hci", "Hospital de Clínicas de Ijuí", NOME_COLECAO, CAMINHO_CHROMA, CAMINHO_BD, CAMINHO_ARQUIVO, ARQUIVO_CASOS)
+
+# Função para montar uma unidade a partir do JSON; a unidade padrão herda os caminhos atuais,
+# as demais recebem nomes próprios (triagem_<codigo>, validacao_triagem_<codigo>.db, arquivo/<codigo>)
+def _unidade_de_config(codigo: str, config: dict, padrao: bool) -> Unidade:
+    base = _unidade_hci()
+    return Unidade(
+        codigo=codigo,
+        nome=config.get("nome", codigo),
+        colecao=config.get("colecao", base.colecao if padrao else f"triagem_{codigo}"),
+        caminho_chroma=config.get("caminho_chroma", base.caminho_chroma),
+        caminho_bd=config.get("caminho_bd", base.caminho_bd if padrao else f"./validacao_triagem_{codigo}.db"),
+        caminho_arquivo=config.get("caminho_arquivo", base.caminho_arquivo if padrao else os.path.join(base.caminho_arquivo, codigo)),
+        arquivo_casos=config.get("arquivo_casos", base.arquivo_casos),
+    )
+
+# Função para carregar as unidades configuradas; retorna (código da unidade padrão, unidades por código)
+@lru_cache(maxsize=None)
+def carregar_unidades(caminho: str = CAMINHO_UNIDADES):
+    if not os.path.exists(caminho):
+        unidade = _unidade_hci()
+        return unidade.codigo, {unidade.codigo: unidade}
+
+    with open(caminho, "r", encoding="utf-8") as arquivo:
+        config = json.load(arquivo)
+    configuracoes = config.get("unidades") or {}
+    if not configuracoes:
+        raise ValueError(f"Nenhuma unidade configurada em {caminho}")
+    padrao = config.get("padrao") or next(iter(configuracoes))
+    if padrao not in configuracoes:
+        raise ValueError(f"Unidade padrão '{padrao}' não está entre as unidades de {caminho}")
+
+    unidades = {codigo: _unidade_de_config(codigo, dados or {}, codigo == padrao) for codigo, dados in configuracoes.items()}
+
+    # Duas unidades na mesma coleção (ou no mesmo banco) misturariam as bases de casos. O nome da coleção precisa ser
+    # único mesmo em diretórios do ChromaDB diferentes, pois colecoes_ativas.json e o índice NumPy usam só o nome
+    colecoes = [nome for u in unidades.values() for nome in (u.colecao, u.colecao_entradas)]
+    bancos = [os.path.abspath(u.caminho_bd) for u in unidades.values()]
+    if len(set(colecoes)) != len(colecoes) or len(set(bancos)) != len(bancos):
+        raise ValueError(f"Unidades de {caminho} compartilham o mesmo nome de coleção ou o mesmo banco de validação")
+    return padrao, unidades
+
+# Função para listar as unidades configuradas (a padrão primeiro)
+def listar_unidades() -> List[Unidade]:
+    padrao, unidades = carregar_unidades()
+    return [unidades[padrao]] + [unidade for codigo, unidade in unidades.items() if codigo != padrao]
+
+# Função para obter uma unidade pelo código (sem código: TRIAGEM_UNIDADE ou a padrão do arquivo)
+def obter_unidade(codigo: Optional[str] = None) -> Unidade:
+    padrao, unidades = carregar_unidades()
+    codigo = codigo or UNIDADE_AMBIENTE or padrao
+    if codigo not in unidades:
+        raise KeyError(f"Unidade desconhecida: {codigo} (configuradas: {', '.join(unidades)})")
+    return unidades[codigo]
+
+# Função para obter o cliente do ChromaDB da unidade (None no backend NumPy, em que cada coleção já tem seu diretório)
+def cliente_chroma_da_unidade(unidade: Unidade):
+    if BACKEND_VETORIAL == "numpy":
+        return None
+    return conectar_chroma(unidade.caminho_chroma)
+
+# Funções para abrir a base de casos de uma unidade
+def colecao_da_unidade(unidade: Unidade):
+    return obter_colecao(cliente_chroma_da_unidade(unidade), nome=unidade.colecao)
+
+def existe_colecao_da_unidade(unidade: Unidade) -> bool:
+    return existe_colecao(unidade.colecao, cliente_chroma_da_unidade(unidade))
+
+# Função para converter a distância de uma coleção em distância de cosseno (1 - similaridade), para que resultados de
+# coleções com métricas diferentes possam ser comparados. Vale para vetores de norma 1, como os do all-MiniLM-L6-v2:
+# o "l2" do ChromaDB é a distância euclidiana ao quadrado (2 - 2 * cosseno) e o "ip" é 1 - produto interno.
+def distancia_cosseno(distancia: float, espaco: str) -> float:
+    if espaco == "l2":
+        return distancia / 2
+    if espaco in ("cosine", "ip"):
+        return distancia
+    raise ValueError(f"Métrica de distância desconhecida: {espaco}")
+
+# Consulta os k casos mais próximos na coleção de uma unidade; retorna dicionários com id, conteúdo, distância e unidade.
+# Com normalizar=True, a distância é convertida para cosseno (ver distancia_cosseno).
+def _consultar_unidade(unidade: Unidade, embedding: List[float], k: int, normalizar: bool = False) -> List[dict]:
+    if not existe_colecao_da_unidade(unidade):
+        return []
+    collection = colecao_da_unidade(unidade)
+    espaco = espaco_da_colecao(collection)
+    resultados = collection.query(query_embeddings=[embedding], n_results=k, include=["metadatas", "distances"])
+    return [
+        {
+            "id": caso_id,
+            "conteudo": metadata["content"],
+            "distancia": distancia_cosseno(distancia, espaco) if normalizar else distancia,
+            "unidade": unidade.codigo,
+        }
+        for caso_id, metadata, distancia in zip(resultados["ids"][0], resultados["metadatas"][0], resultados["distances"][0])
+    ]
+
+# Função para buscar os casos mais semelhantes. Por padrão consulta só a unidade informada; com todas_unidades=True
+# consulta em paralelo todas as unidades cuja base usa o mesmo modelo de embedding (vetores de modelos diferentes não
+# são comparáveis, ver reindexacao.py) e junta os k de menor distância. Cada coleção pode ter sido criada com outra
+# métrica (hnsw:space), então as distâncias são convertidas para cosseno antes de juntar, e o vetor da consulta é
+# normalizado (as métricas l2 e ip dependem da norma dele).
+def buscar_casos_semelhantes(embedding: List[float], k: int = 3, unidade: Optional[Unidade] = None,
+                             todas_unidades: bool = False) -> List[dict]:
+    unidade = unidade or obter_unidade()
+    if not todas_unidades:
+        return _consultar_unidade(unidade, embedding, k)
+
+    from indice_numpy import normalizar as normalizar_vetores
+
+    modelo = modelo_da_colecao(unidade.colecao)
+    unidades = [u for u in listar_unidades() if modelo_da_colecao(u.colecao) == modelo]
+    embedding = normalizar_vetores([embedding])[0].tolist()
+    with ThreadPoolExecutor(max_workers=len(unidades)) as executor:
+        por_unidade = list(executor.map(lambda u: _consultar_unidade(u, embedding, k, normalizar=True), unidades))
+    return heapq.nsmallest(k, (caso for casos in por_unidade for caso in casos), key=lambda caso: caso["distancia"])